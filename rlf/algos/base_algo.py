@@ -3,6 +3,7 @@ from typing import Any, Callable, Dict, Iterable, List, Tuple
 import attr
 import numpy as np
 import rlf.rl.utils as rutils
+import torch
 from rlf.baselines.vec_env.vec_env import VecEnv
 from rlf.rl.envs import get_vec_normalize
 from rlf.storage import BaseStorage, RolloutStorage
@@ -80,10 +81,18 @@ class BaseAlgo(object):
         )
         self.timer.clear()
 
+    def add_timer_to(self, timer: rutils.TimeProfilee) -> None:
+        """
+        Adds the times since the last `add_and_clear_timer` to `timer`.
+        """
+        timer.merge(self.timer)
+
     def init(self, policy, args):
         self.update_i = 0
         self.policy = policy
         self.args = args
+        if not getattr(args, "log_timers", True):
+            self.timer.freeze()
 
     def get_steps_generator(self, update_iter: int) -> Iterable[int]:
         """Generates an iterable for the number of rollout steps."""
@@ -98,9 +107,13 @@ class BaseAlgo(object):
 
         def get_vec_normalize_fn():
             if env_norm is not None:
-                obfilt = get_vec_normalize(envs)._obfilt
+                vec_norm = get_vec_normalize(envs)
+                obfilt = vec_norm._obfilt
 
                 def mod_env_ob_filt(state, update=True):
+                    if isinstance(state, torch.Tensor) and not update:
+                        # Normalize on the device of `state`.
+                        return vec_norm.torch_obfilt(state)
                     state = obfilt(state, update)
                     state = rutils.get_def_obs(state)
                     return state
@@ -181,6 +194,12 @@ class BaseAlgo(object):
     def pre_update(self, cur_update: int) -> None:
         pass
 
+    def close(self) -> None:
+        """
+        Called once training is finished to release any resources.
+        """
+        pass
+
     def update(self, storage) -> Dict[str, Any]:
         self.update_i += 1
         return {}
@@ -2,6 +2,7 @@ from argparse import Namespace
 from typing import Any, Callable, Dict, Union
 
 import rlf.algos.utils as autils
+import rlf.rl.utils as rutils
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -106,9 +107,11 @@ class BaseNetAlgo(BaseAlgo):
 
         opt, get_params_fn, _ = self._optimizers[optimizer_key]
         opt.zero_grad()
-        loss.backward()
-        self._clip_grad(get_params_fn())
-        opt.step()
+        with rutils.TimeProfiler("backward", self):
+            loss.backward()
+        with rutils.TimeProfiler("optimizer_step", self):
+            self._clip_grad(get_params_fn())
+            opt.step()
 
     def set_arg_prefix(self, arg_prefix):
         self.arg_prefix = arg_prefix + "-"
@@ -71,10 +71,17 @@ class AirlNetDiscrim(nn.Module):
         else:
             return rs
 
-    def discrim_forward(self, states, actions, mask, next_states, policy):
+    def discrim_forward(self, states, actions, mask, next_states, policy, log_q=None):
+        """
+        :param log_q: The log probabilities of `actions` under the current
+            policy. Computed with `policy` if not provided.
+        """
         log_p = self.f(states, actions, mask, next_states, policy)
-        with torch.no_grad():
-            log_q = policy.evaluate_actions(states, {}, {}, mask, actions)["log_prob"]
+        if log_q is None:
+            with torch.no_grad():
+                log_q = policy.evaluate_actions(states, {}, {}, mask, actions)[
+                    "log_prob"
+                ]
 
         return log_p - log_q
 
@@ -93,7 +100,33 @@ class AirlDiscrim(GailDiscrim):
             num_samples=self.args.off_policy_count,
             get_next_state=True,
         )
-        return self.expert_train_loader, agent_experience
+        # The policy is fixed while the discriminator is updated, so the
+        # expert log probabilities are computed once per update for the items
+        # that are drawn and reused in later discriminator epochs.
+        expert_sampler = self.expert_train_loader
+        num_items = len(expert_sampler.dataset)
+        d = self.args.device
+        expert_sampler.set_extra_field(
+            "idx", torch.arange(num_items, device=expert_sampler.idxs.device)
+        )
+        self._expert_log_probs = torch.zeros(num_items, 1, device=d)
+        self._has_expert_log_prob = torch.zeros(num_items, dtype=torch.bool, device=d)
+        return expert_sampler, agent_experience
+
+    @torch.no_grad()
+    def _get_expert_log_probs(self, idxs, states, actions, mask):
+        """
+        Returns the log probabilities of the expert actions under the current
+        policy, only evaluating the policy on items not seen this update.
+        """
+        idxs = idxs.to(self.args.device)
+        is_new = ~self._has_expert_log_prob[idxs]
+        if is_new.any():
+            self._expert_log_probs[idxs[is_new]] = self.policy.evaluate_actions(
+                states[is_new], {}, {}, mask[is_new], actions[is_new]
+            )["log_prob"].view(-1, 1)
+            self._has_expert_log_prob[idxs[is_new]] = True
+        return self._expert_log_probs[idxs]
 
     def _compute_discrim_loss(self, agent_batch, expert_batch, obsfilt):
         d = self.args.device
@@ -109,10 +142,24 @@ class AirlDiscrim(GailDiscrim):
         agent_mask = agent_batch["mask"].to(d)
 
         expert_d = self.discrim_net.discrim_forward(
-            exp_s0, expert_actions, expert_mask, exp_s1, self.policy
+            exp_s0,
+            expert_actions,
+            expert_mask,
+            exp_s1,
+            self.policy,
+            self._get_expert_log_probs(
+                expert_batch["idx"], exp_s0, expert_actions, expert_mask
+            ),
         )
+        # The discriminator is updated before the policy, so the log
+        # probabilities stored during the rollout are still up to date.
         agent_d = self.discrim_net.discrim_forward(
-            agent_s0, agent_actions, agent_mask, agent_s1, self.policy
+            agent_s0,
+            agent_actions,
+            agent_mask,
+            agent_s1,
+            self.policy,
+            agent_batch.get("prev_log_prob"),
         )
         return expert_d, agent_d, 0
 
@@ -131,14 +178,9 @@ class AirlDiscrim(GailDiscrim):
                 state, action, mask, next_state, self.policy, base_reward_only=True
             )
 
-        finished_episodes = [i for i in range(len(mask)) if mask[i] == 0.0]
-        obsfilt = self.get_env_ob_filt()
-        for i in finished_episodes:
-            next_state[i] = add_inputs["final_obs"][i]
-            if obsfilt is not None:
-                next_state[i] = torch.FloatTensor(
-                    obsfilt(next_state[i].cpu().numpy(), update=False)
-                ).to(self.args.device)
+        next_state = self._sub_final_obs(
+            next_state, add_inputs.get("next_mask", mask), add_inputs
+        )
 
         return self.discrim_net.reward_forward(
             state, action, mask, next_state, self.policy
@@ -10,7 +10,7 @@ import torch
 from rlf.algos.base_net_algo import BaseNetAlgo
 from rlf.args import str2bool
 from rlf.il.d4rl_dataset import D4rlDataset
-from rlf.il.il_dataset import ImitationLearningDataset
+from rlf.il.il_dataset import BatchIndexSampler, ImitationLearningDataset
 from rlf.il.transition_dataset import TransitionDataset
 from rlf.rl import utils
 
@@ -38,6 +38,9 @@ class ExperienceGenerator:
     def reset(self):
         pass
 
+    def close(self):
+        pass
+
 
 class BaseILAlgo(BaseNetAlgo):
     def __init__(self, exp_generator: Optional[ExperienceGenerator] = None):
@@ -127,23 +130,23 @@ class BaseILAlgo(BaseNetAlgo):
                 torch.Generator().manual_seed(self.args.seed),
             )
             val_traj_batch_size = min(len(val_dataset), self.args.traj_batch_size)
-            self.val_train_loader = torch.utils.data.DataLoader(
-                dataset=val_dataset,
+            self.val_train_loader = BatchIndexSampler(
+                val_dataset,
                 batch_size=val_traj_batch_size,
                 shuffle=True,
                 drop_last=True,
-                **self.orig_dataset.get_add_data_loader_kwargs(),
+                device=args.device,
             )
         else:
             train_dataset = self.expert_dataset
             self.val_train_loader = None
 
-        self.expert_train_loader = torch.utils.data.DataLoader(
-            dataset=train_dataset,
+        self.expert_train_loader = BatchIndexSampler(
+            train_dataset,
             batch_size=args.traj_batch_size,
             shuffle=True,
             drop_last=True,
-            **self.orig_dataset.get_add_data_loader_kwargs(),
+            device=args.device,
         )
         if len(self.expert_train_loader) == 0:
             raise ValueError(
@@ -229,6 +232,11 @@ class BaseILAlgo(BaseNetAlgo):
             print(f"Generating {args.exp_gen_num_trans} transitions for imitation")
         super().init(policy, args)
 
+    def close(self):
+        if self.exp_generator is not None:
+            self.exp_generator.close()
+        super().close()
+
     def _get_dataset_override(self, traj_load_path, args):
         if (
             self.exp_generator is not None
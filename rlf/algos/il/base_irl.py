@@ -68,7 +68,7 @@ class BaseIRLAlgo(BaseILAlgo):
         super().init(policy, args)
         self.ep_log_vals = defaultdict(lambda: deque(maxlen=args.log_smooth_len))
         self.culm_log_vals = defaultdict(
-            lambda: [0.0 for _ in range(args.num_processes)]
+            lambda: torch.zeros(args.num_processes, device=args.device)
         )
 
     @abstractmethod
@@ -103,35 +103,134 @@ class BaseIRLAlgo(BaseILAlgo):
     def _trans_agent_state(self, state, other_state=None):
         return rutils.get_def_obs(state)
 
-    def _infer_rollout_storage_reward(self, storage, log_vals):
-        add_info = {k: storage.get_add_info(k) for k in storage.get_extract_info_keys()}
-        for k in storage.ob_keys:
-            if k is not None:
-                add_info[k] = storage.obs[k]
+    def _get_rollout_reward(
+        self,
+        state: torch.Tensor,
+        next_state: torch.Tensor,
+        action: torch.Tensor,
+        mask: torch.Tensor,
+        add_info: Dict[str, Any],
+        num_procs: int,
+    ) -> Tuple[torch.Tensor, Dict[str, Any]]:
+        """
+        Infers the reward for `K` consecutive rollout steps of `num_procs`
+        environments, flattened in time-major order so every input has a
+        leading dimension of `K * num_procs`. Defaults to calling `get_reward`
+        on the whole batch. Override if the reward depends on the order of
+        the steps.
+        """
+        return self.get_reward(state, next_state, action, mask, add_info)
 
-        for step in range(self.args.num_steps):
-            mask = storage.masks[step]
-            state = self._trans_agent_state(storage.get_obs(step))
-            next_state = self._trans_agent_state(storage.get_obs(step + 1))
-            action = storage.actions[step]
-            add_inputs = {k: v[(step + 1) - 1] for k, v in add_info.items()}
+    def _norm_reward(
+        self, reward: torch.Tensor, mask: torch.Tensor, num_procs: int
+    ) -> torch.Tensor:
+        """
+        Scales the reward by the running standard deviation of the discounted
+        return. `reward` and `mask` are `K` consecutive steps of `num_procs`
+        environments flattened in time-major order. Requires `self.returns`
+        and `self.ret_rms` to be set by the subclass.
+        """
+        reward = reward.view(-1, num_procs, 1)
+        mask = mask.view(-1, num_procs, 1)
+        if self.returns is None or self.returns.shape[0] != num_procs:
+            self.returns = reward[0].clone()
 
-            with torch.no_grad():
-                rewards, ep_log_vals = self.get_reward(
-                    state, next_state, action, mask, add_inputs
-                )
+        all_returns = []
+        for step in range(reward.shape[0]):
+            self.returns = self.returns * mask[step] * self.args.gamma + reward[step]
+            all_returns.append(self.returns)
+        self.ret_rms.update(torch.cat(all_returns).cpu().numpy())
 
-            ep_log_vals["reward"] = rewards
-            storage.rewards[step] = rewards
+        return reward.view(-1, 1) / np.sqrt(self.ret_rms.var[0] + 1e-8)
 
-            for i in range(self.args.num_processes):
-                for k in ep_log_vals:
-                    self.culm_log_vals[k][i] += ep_log_vals[k][i].item()
+    def _log_rollout_vals(self, ep_log_vals, masks):
+        """
+        Accumulates per step values over episodes and records the episode
+        totals.
+        :param ep_log_vals: Values of shape (T, N) to accumulate.
+        :param masks: Shape (T, N). A value of 0 ends the episode of that
+            environment after including the value at that step.
+        """
+        num_steps = masks.shape[0]
+        ends = masks == 0.0
+        # Index of the most recent episode end at or before each step.
+        step_idxs = torch.arange(num_steps, device=masks.device).view(-1, 1)
+        last_end = torch.where(ends, step_idxs, -1).cummax(dim=0).values
+        # Index of the most recent episode end strictly before each step.
+        prev_end = torch.cat([torch.full_like(last_end[:1], -1), last_end[:-1]])
+        end_t, end_proc = ends.nonzero(as_tuple=True)
+
+        for k, vals in ep_log_vals.items():
+            culm = self.culm_log_vals[k].to(vals.device)
+            cumsum = torch.cumsum(vals, dim=0) + culm
+            # The running total carried over from previous rollouts belongs to
+            # the first episode of each environment.
+            ep_start = torch.where(
+                prev_end < 0, 0.0, cumsum.gather(0, prev_end.clamp(min=0))
+            )
+            ep_totals = (cumsum - ep_start)[end_t, end_proc]
+            self.ep_log_vals[k].extend(ep_totals.tolist())
+
+            self.culm_log_vals[k] = torch.where(
+                ends[-1], 0.0, cumsum[-1] - ep_start[-1]
+            )
 
-                if storage.masks[step, i] == 0.0:
-                    for k in ep_log_vals:
-                        self.ep_log_vals[k].append(self.culm_log_vals[k][i])
-                        self.culm_log_vals[k][i] = 0.0
+    def _infer_rollout_storage_reward(self, storage, log_vals):
+        num_steps, num_procs = storage.rewards.shape[:2]
+
+        def flatten(x):
+            return x.reshape(num_steps * num_procs, *x.shape[2:])
+
+        add_info = {
+            k: flatten(storage.get_add_info(k)[:num_steps])
+            for k in storage.get_extract_info_keys()
+        }
+        for k in storage.ob_keys:
+            if k is not None:
+                add_info[k] = flatten(storage.obs[k][:num_steps])
+        # `mask` is the mask of each state. Whether the episode ended after
+        # the transition, and so if "final_obs" is its next state, is given
+        # by the mask of the next state.
+        add_info["next_mask"] = flatten(storage.masks[1:])
+
+        state = rutils.obs_op(storage.obs, lambda x: flatten(x[:-1]))
+        next_state = rutils.obs_op(storage.obs, lambda x: flatten(x[1:]))
+        action = flatten(storage.actions)
+        mask = flatten(storage.masks[:-1])
+
+        # Evaluate whole rollout steps at a time so every chunk keeps the
+        # (step, process) layout.
+        chunk_steps = max(self.args.irl_reward_batch_size // num_procs, 1)
+        chunk_size = chunk_steps * num_procs
+
+        all_rewards = []
+        all_log_vals = defaultdict(list)
+        for start in range(0, num_steps * num_procs, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            with torch.no_grad():
+                rewards, ep_log_vals = self._get_rollout_reward(
+                    self._trans_agent_state(rutils.obs_select(state, chunk)),
+                    self._trans_agent_state(rutils.obs_select(next_state, chunk)),
+                    action[chunk],
+                    mask[chunk],
+                    {k: v[chunk] for k, v in add_info.items()},
+                    num_procs,
+                )
+            all_rewards.append(rewards.view(-1, 1))
+            for k, v in ep_log_vals.items():
+                all_log_vals[k].append(v.reshape(-1))
+
+        rewards = torch.cat(all_rewards).view(num_steps, num_procs, 1)
+        storage.rewards.copy_(rewards)
+
+        ep_log_vals = {
+            k: torch.cat(v).view(num_steps, num_procs).float()
+            for k, v in all_log_vals.items()
+        }
+        ep_log_vals["reward"] = rewards.view(num_steps, num_procs)
+        self._log_rollout_vals(
+            ep_log_vals, storage.masks[:-1].view(num_steps, num_procs)
+        )
 
         for k, vals in self.ep_log_vals.items():
             log_vals[f"culm_irl_{k}"] = np.mean(vals)
@@ -141,8 +240,7 @@ class BaseIRLAlgo(BaseILAlgo):
         is_rollout_storage = isinstance(storage, RolloutStorage)
         if is_rollout_storage:
             # CLEAR ALL REWARDS so no environment rewards can leak to the IRL method.
-            for step in range(self.args.num_steps):
-                storage.rewards[step] = 0
+            storage.rewards.zero_()
 
         log_vals = self._update_reward_func(storage)
 
@@ -172,3 +270,14 @@ class BaseIRLAlgo(BaseILAlgo):
                 If true, the learned reward is not updated.
             """,
         )
+        parser.add_argument(
+            "--irl-reward-batch-size",
+            type=int,
+            default=16384,
+            help="""
+                Maximum number of transitions per forward pass when inferring
+                the learned reward over the rollout. Rounded down to a multiple
+                of the number of processes. AIRL also uses this when computing
+                the expert log probabilities.
+            """,
+        )
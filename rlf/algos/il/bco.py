@@ -2,7 +2,6 @@ import os
 import os.path as osp
 from functools import partial
 
-import numpy as np
 import rlf.algos.utils as autils
 import rlf.rl.utils as rutils
 import torch
@@ -16,7 +15,6 @@ from rlf.rl.envs import make_vec_envs_easy
 from rlf.rl.loggers import LoggerChoices
 from rlf.rl.model import Flatten
 from rlf.storage.rollout_storage import RolloutStorage
-from torch.utils.data.sampler import BatchSampler, SubsetRandomSampler
 from tqdm import tqdm
 
 
@@ -63,25 +61,51 @@ class InvFunc(nn.Module):
         return tmp
 
 
+def get_inv_dataset(states, actions, dones):
+    """
+    - states (torch.Tensor[N+1, n_procs, *ob_shape])
+    - actions (torch.Tensor[N, n_procs, ac_dim])
+    - dones (torch.Tensor[N, n_procs]): if the episode ended after the action
+      so the next state is from the reset.
+    Returns the (s0, s1, action) inverse model dataset. The transitions are
+    stored as indices into the flattened states, the next state of transition
+    `i` is `n_procs` after it.
+    """
+    num_procs = states.shape[1]
+    valid = ~dones.reshape(-1).bool()
+    return {
+        "states": states.reshape(-1, *states.shape[2:]),
+        "actions": actions.reshape(-1, *actions.shape[2:]),
+        "idxs": valid.nonzero().view(-1),
+        "num_procs": num_procs,
+    }
+
+
 def select_batch(trans_idx, dataset, device, ob_shape):
     """
-    - trans_idx (list(int)): indices to select from dataset.
-    - dataset (list(dict)): contains a list of dictionaries with the state
-      action data.
+    - trans_idx (torch.Tensor[B]): indices of the transitions to select.
+    - dataset (dict): the inverse model dataset from `get_inv_dataset`.
     """
-    use_state_0 = []
-    use_state_1 = []
-    use_action = []
-    for i in trans_idx:
-        use_state_0.append(dataset[i]["s0"])
-        use_state_1.append(dataset[i]["s1"])
-        use_action.append(dataset[i]["action"])
-    use_state_0 = torch.stack(use_state_0).to(device).view(-1, *ob_shape)
-    use_state_1 = torch.stack(use_state_1).to(device).view(-1, *ob_shape)
-    true_action = torch.stack(use_action).to(device).squeeze(1)
+    state_idx = dataset["idxs"][trans_idx]
+    use_state_0 = dataset["states"][state_idx].to(device).view(-1, *ob_shape)
+    use_state_1 = (
+        dataset["states"][state_idx + dataset["num_procs"]]
+        .to(device)
+        .view(-1, *ob_shape)
+    )
+    true_action = dataset["actions"][state_idx].to(device).squeeze(1)
     return use_state_0, use_state_1, true_action
 
 
+def get_trans_batches(trans_idxs, batch_size):
+    """
+    Shuffles `trans_idxs` and splits them into batches, the last batch may be
+    smaller.
+    """
+    perm = torch.randperm(len(trans_idxs), device=trans_idxs.device)
+    return trans_idxs[perm].split(batch_size)
+
+
 class BehavioralCloningFromObs(BehavioralCloning):
     def init(self, policy, args):
         if args.bco_alpha != 0:
@@ -136,6 +160,10 @@ class BehavioralCloningFromObs(BehavioralCloning):
                 states = loaded_traj["states"]
                 actions = loaded_traj["actions"]
                 dones = loaded_traj["dones"]
+                if isinstance(states, list):
+                    raise ValueError(
+                        f"{load_path} is in the old list format, regenerate it with --bco-expl-refresh"
+                    )
                 print(f"Loaded expl trajectories from {load_path}")
 
         if loaded_traj is None:
@@ -145,18 +173,27 @@ class BehavioralCloningFromObs(BehavioralCloning):
             )
             rutils.pstart_sep()
             print("Collecting exploration experience")
-            states = []
-            actions = []
             state = rutils.get_def_obs(self.use_envs.reset())
-            states.extend(state)
-            dones = [True]
-            for _ in tqdm(range(n_steps)):
+            states = torch.zeros(
+                n_steps + 1, *state.shape, dtype=state.dtype, device=state.device
+            )
+            dones = torch.zeros(n_steps, state.shape[0], dtype=torch.bool)
+            actions = None
+            states[0] = state
+            for step in tqdm(range(n_steps)):
                 ac_info = policy.get_action(state, None, None, None, None)
                 state, reward, done, info = self.use_envs.step(ac_info.take_action)
                 state = rutils.get_def_obs(state)
-                actions.extend(ac_info.action)
-                dones.extend(done)
-                states.extend(state)
+                if actions is None:
+                    actions = torch.zeros(
+                        n_steps,
+                        *ac_info.action.shape,
+                        dtype=ac_info.action.dtype,
+                        device=ac_info.action.device,
+                    )
+                actions[step] = ac_info.action
+                dones[step] = torch.as_tensor(done)
+                states[step + 1] = state
             rutils.pend_sep()
             self.use_envs.reset()
 
@@ -177,10 +214,12 @@ class BehavioralCloningFromObs(BehavioralCloning):
 
         self._update_all(states, actions, dones)
 
-    def _train_inv_func(self, trans_sampler, dataset):
+    def _train_inv_func(self, train_idxs, dataset):
         infer_ac_losses = []
         for i in tqdm(range(self.args.bco_inv_epochs)):
-            for trans_idx in trans_sampler:
+            for trans_idx in get_trans_batches(
+                train_idxs, self.args.bco_inv_batch_size
+            ):
                 use_state_0, use_state_1, true_action = select_batch(
                     trans_idx,
                     dataset,
@@ -200,11 +239,11 @@ class BehavioralCloningFromObs(BehavioralCloning):
                 self.inv_opt.step()
         return infer_ac_losses
 
-    def _infer_inv_accuracy(self, trans_sampler, dataset):
+    def _infer_inv_accuracy(self, val_idxs, dataset):
         total_count = 0
         num_correct = 0
         with torch.no_grad():
-            for trans_idx in trans_sampler:
+            for trans_idx in get_trans_batches(val_idxs, self.args.bco_inv_batch_size):
                 use_state_0, use_state_1, true_action = select_batch(
                     trans_idx,
                     dataset,
@@ -219,49 +258,33 @@ class BehavioralCloningFromObs(BehavioralCloning):
 
     def _update_all(self, states, actions, dones):
         """
-        - states (list[N+1])
-        - masks (list[N+1])
-        - actions (list[N])
+        - states (torch.Tensor[N+1, n_procs, *ob_shape])
+        - actions (torch.Tensor[N, n_procs, ac_dim])
+        - dones (torch.Tensor[N, n_procs]): if the episode ended after the
+          action.
         Performs a complete update of the model by following these steps:
             1. Train inverse function with ground truth data provided.
             2. Infer actions in expert dataset
             3. Train BC
         """
-        dataset = [
-            {"s0": states[i], "s1": states[i + 1], "action": actions[i]}
-            for i in range(len(actions))
-            if not dones[i + 1]
-        ]
+        dataset = get_inv_dataset(states, actions, dones)
 
         rutils.pstart_sep()
         print(f"BCO Update {self.update_i}/{self.args.bco_alpha}")
         print("---")
 
         print("Training inverse function")
-        dataset_idxs = list(range(len(dataset)))
-        np.random.shuffle(dataset_idxs)
+        dataset_idxs = torch.randperm(len(dataset["idxs"]))
 
         eval_len = int(len(dataset_idxs) * self.args.bco_inv_eval_holdout)
         if eval_len != 0.0:
-            train_trans_sampler = BatchSampler(
-                SubsetRandomSampler(dataset_idxs[:-eval_len]),
-                self.args.bco_inv_batch_size,
-                drop_last=False,
-            )
-            val_trans_sampler = BatchSampler(
-                SubsetRandomSampler(dataset_idxs[-eval_len:]),
-                self.args.bco_inv_batch_size,
-                drop_last=False,
-            )
+            train_idxs = dataset_idxs[:-eval_len]
+            val_idxs = dataset_idxs[-eval_len:]
         else:
-            train_trans_sampler = BatchSampler(
-                SubsetRandomSampler(dataset_idxs),
-                self.args.bco_inv_batch_size,
-                drop_last=False,
-            )
+            train_idxs = dataset_idxs
 
         if self.args.bco_inv_load is None or self.update_i > 0:
-            infer_ac_losses = self._train_inv_func(train_trans_sampler, dataset)
+            infer_ac_losses = self._train_inv_func(train_idxs, dataset)
             if (
                 self.args.bc_log_interval != -1
                 and self.update_i % self.args.bc_log_interval == 0
@@ -288,31 +311,29 @@ class BehavioralCloningFromObs(BehavioralCloning):
                         " supported for discrete action spaces right now",
                     )
                 )
-            accuracy = self._infer_inv_accuracy(val_trans_sampler, dataset)
+            accuracy = self._infer_inv_accuracy(val_idxs, dataset)
             print("Inferred actions with %.2f accuracy" % accuracy)
 
-        if isinstance(self.expert_dataset, torch.utils.data.Subset):
-            s0 = self.expert_dataset.dataset.trajs["obs"].to(self.args.device).float()
-            s1 = (
-                self.expert_dataset.dataset.trajs["next_obs"]
-                .to(self.args.device)
-                .float()
-            )
-            dataset_device = self.expert_dataset.dataset.trajs["obs"].device
-        else:
-            s0 = self.expert_dataset.trajs["obs"].to(self.args.device).float()
-            s1 = self.expert_dataset.trajs["next_obs"].to(self.args.device).float()
-            dataset_device = self.expert_dataset.trajs["obs"].device
+        expert_dataset = self.expert_dataset
+        while isinstance(expert_dataset, torch.utils.data.Subset):
+            expert_dataset = expert_dataset.dataset
+        dataset_device = expert_dataset.trajs["actions"].device
 
-        # Perform inference on the expert states
+        # Perform inference on the expert states. Reading the states through
+        # `get_batch` in batches means lazily loaded demos are never fully
+        # materialized.
+        all_idxs = torch.arange(len(expert_dataset), device=dataset_device)
+        pred_actions = []
         with torch.no_grad():
-            pred_actions = self.inv_func(s0, s1).to(dataset_device)
-            pred_actions = rutils.get_ac_compact(self.policy.action_space, pred_actions)
-            if not self.args.bco_oracle_actions:
-                if isinstance(self.expert_dataset, torch.utils.data.Subset):
-                    self.expert_dataset.dataset.trajs["actions"] = pred_actions
-                else:
-                    self.expert_dataset.trajs["actions"] = pred_actions
+            for idxs in all_idxs.split(self.args.bco_inv_batch_size):
+                batch = expert_dataset.get_batch(idxs)
+                s0 = batch["state"].to(self.args.device).float()
+                s1 = batch["next_state"].to(self.args.device).float()
+                pred_actions.append(self.inv_func(s0, s1).to(dataset_device))
+        pred_actions = torch.cat(pred_actions)
+        pred_actions = rutils.get_ac_compact(self.policy.action_space, pred_actions)
+        if not self.args.bco_oracle_actions:
+            expert_dataset.trajs["actions"] = pred_actions
         # Recreate the dataset for BC training so we can be sure it has the
         # most recent data.
         self._create_train_loader(self.args)
@@ -331,13 +352,9 @@ class BehavioralCloningFromObs(BehavioralCloning):
         return BaseAlgo.get_completed_update_steps(self, num_updates)
 
     def update(self, storage):
-        masks = storage.masks.view(-1, 1)
-        actions = storage.actions.view(-1, storage.actions.shape[-1])
-        obs = storage.get_def_obs_seq()
-        obs = obs.view(-1, *obs.shape[2:])
         # Update based on collected experience from environment
-        dones = [(not bool(x)) for x in masks]
-        self._update_all(obs, actions, dones)
+        dones = storage.masks[1:].view(storage.masks.shape[0] - 1, -1) == 0
+        self._update_all(storage.get_def_obs_seq(), storage.actions, dones)
         return {}
 
     def get_storage_buffer(self, policy, envs, args):
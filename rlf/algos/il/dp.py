@@ -35,12 +35,22 @@ class DiffPolicy(BaseILAlgo):
             self.norm_mean = None
             self.norm_var = None
         self.num_bc_updates = 0
-        self.L1 = nn.L1Loss().cuda()
+        self.L1 = nn.L1Loss().to(self.args.device)
         # self.lambda_bc = args.lambda_bc
         # self.lambda_dm = args.lambda_dm
         num_steps = 1000
         dim = 2
 
+        # Train on the chunks of future actions the policy predicts.
+        self.action_horizon = getattr(self.policy, "action_horizon", 1)
+        if self.action_horizon > 1:
+            if not self._is_using_dataset():
+                raise ValueError("Action chunks require an expert dataset")
+            action_chunks = self.orig_dataset.get_action_chunks(self.action_horizon)
+            for loader in [self.expert_train_loader, self.val_train_loader]:
+                if loader is not None:
+                    loader.set_extra_field("action_chunk", action_chunks)
+
     def get_env_settings(self, args):
         settings = super().get_env_settings(args)
         if args.bc_state_norm:
@@ -140,7 +150,10 @@ class DiffPolicy(BaseILAlgo):
             states += add_noise.to(self.args.device)
             states = states.detach()
 
-        true_actions = batch["actions"].to(self.args.device)
+        if "action_chunk" in batch:
+            true_actions = batch["action_chunk"].to(self.args.device)
+        else:
+            true_actions = batch["actions"].to(self.args.device)
         true_actions = self._adjust_action(true_actions)
         return states, true_actions
 
@@ -1,8 +1,6 @@
 from collections import defaultdict
 from functools import partial
-from typing import Dict
 
-import rlf.il.utils as iutils
 import rlf.rl.utils as rutils
 import torch
 import torch.nn as nn
@@ -10,10 +8,10 @@ import torch.nn.functional as F
 from rlf.algos.il.gail import GailDiscrim
 from rlf.algos.nested_algo import NestedAlgo
 from rlf.algos.on_policy.ppo import PPO
+from rlf.il.lazy_demos import LazyDemoField
 from rlf.il.transition_dataset import TransitionDataset
 from rlf.rl.model import ConcatLayer
 from rlf.storage import ReplayBuffer, RolloutStorage
-from torch.utils.data.sampler import BatchSampler, SubsetRandomSampler
 
 
 class GAIFO(NestedAlgo):
@@ -21,12 +19,85 @@ class GAIFO(NestedAlgo):
         super().__init__([GaifoDiscrim(get_discrim), agent_updater], 1)
 
 
+class _PairObsView:
+    """
+    Indexes the shared observations of a `PairTransitionDataset` like the
+    flat "obs" (`offset=0`) or "next_obs" (`offset=1`) tensor.
+    """
+
+    def __init__(self, pair_obs, rows, offset):
+        self._pair_obs = pair_obs
+        self._rows = rows
+        self._offset = offset
+
+    def __getitem__(self, i):
+        return self._pair_obs[self._rows[i] + self._offset]
+
+    def __len__(self):
+        return len(self._rows)
+
+
 class PairTransitionDataset(TransitionDataset):
+    """
+    Only stores the observations once. Each episode is stored as its
+    observations followed by its final next observation, so the next state of
+    a transition is the row after its state. "obs" and "next_obs" are views
+    into the shared observations, so the trajectory accessors still work.
+    """
+
     def __init__(self, load_path, transform_dem_dataset_fn, override_data=None):
         super().__init__(
             load_path, transform_dem_dataset_fn, override_data=override_data
         )
-        self.trajs["next_obs"] = self.trajs["next_obs"].float()
+        if isinstance(self.trajs["obs"], LazyDemoField):
+            # The lazy format already shares the observation storage.
+            return
+
+        obs = self.trajs["obs"]
+        next_obs = self.trajs["next_obs"]
+        offsets = self.get_traj_offsets()
+        ends = offsets[1:]
+        not_end = torch.ones(len(obs) - 1, dtype=torch.bool, device=ends.device)
+        not_end[ends[:-1] - 1] = False
+        if not torch.equal(obs[1:][not_end], next_obs[:-1][not_end]):
+            # The next observations are not the following observations, so
+            # they cannot share storage.
+            return
+        del self.trajs["obs"]
+        del self.trajs["next_obs"]
+
+        num_eps = len(ends)
+        ep_ids = torch.repeat_interleave(
+            torch.arange(num_eps, device=ends.device), ends - offsets[:-1]
+        )
+        rows = torch.arange(len(obs), device=ends.device) + ep_ids
+
+        pair_obs = obs.new_empty(len(obs) + num_eps, *obs.shape[1:])
+        pair_obs[rows] = obs
+        pair_obs[ends + torch.arange(num_eps, device=ends.device)] = next_obs[
+            ends - 1
+        ]
+        self.trajs["pair_obs"] = pair_obs
+        self.trajs["pair_rows"] = rows
+        self._set_obs_views()
+
+    def _set_obs_views(self):
+        pair_obs = self.trajs["pair_obs"]
+        rows = self.trajs["pair_rows"]
+        self.trajs["obs"] = _PairObsView(pair_obs, rows, 0)
+        self.trajs["next_obs"] = _PairObsView(pair_obs, rows, 1)
+
+    def to(self, device):
+        if "pair_obs" not in self.trajs:
+            return super().to(device)
+        del self.trajs["obs"]
+        del self.trajs["next_obs"]
+        super().to(device)
+        self._set_obs_views()
+        return self
+
+    def __len__(self):
+        return len(self.trajs["done"])
 
     def __getitem__(self, i):
         return {
@@ -75,10 +146,6 @@ class GaifoDiscrim(GailDiscrim):
     Computes the discriminator based off of state, next state transitions.
     """
 
-    def __init__(self, get_discrim=None):
-        super().__init__(get_discrim)
-        self._agent_obs_pairs: Dict[str, torch.Tensor] = {}
-
     def _create_discrim(self):
         new_shape = list(rutils.get_obs_shape(self.policy.obs_space))
         new_shape[0] *= 2
@@ -93,7 +160,19 @@ class GaifoDiscrim(GailDiscrim):
         )
 
     def _trans_batches(self, expert_batch, agent_batch):
-        agent_batch = iutils.select_idx_from_dict(agent_batch, self._agent_obs_pairs)
+        # The next state of an expert pair at an episode end is its final
+        # observation. Agent pairs are treated the same way when the final
+        # observations are known, otherwise terminal pairs are dropped on
+        # both sides.
+        if "final_obs" in agent_batch:
+            agent_batch["next_state"] = self._sub_final_obs(
+                agent_batch["next_state"], agent_batch["mask"], agent_batch
+            )
+            agent_batch["valid"] = torch.ones_like(agent_batch["mask"].view(-1)) == 1
+            expert_batch["valid"] = torch.ones_like(expert_batch["done"]) == 1
+        else:
+            agent_batch["valid"] = agent_batch["mask"].view(-1) == 1
+            expert_batch["valid"] = expert_batch["done"] == 0
         return expert_batch, agent_batch
 
     def _compute_discrim_loss(self, agent_batch, expert_batch, obsfilt):
@@ -106,10 +185,8 @@ class GaifoDiscrim(GailDiscrim):
 
         expert_d = self.discrim_net(exp_s0, exp_s1)
         agent_d = self.discrim_net(agent_s0, agent_s1)
-        # Select the valid transitions where the episode did not end in
-        # between.
-        expert_d = expert_d[expert_batch["done"] == 0]
-        agent_d = agent_d[agent_batch["mask"] == 1]
+        expert_d = expert_d[expert_batch["valid"].to(d)]
+        agent_d = agent_d[agent_batch["valid"].to(d)]
         return expert_d, agent_d, 0
 
     def _compute_disc_val(self, state, next_state, action):
@@ -117,24 +194,15 @@ class GaifoDiscrim(GailDiscrim):
 
     def _get_sampler(self, storage):
         if isinstance(storage, RolloutStorage):
-            obs = storage.get_def_obs_seq()
-            ob_shape = rutils.get_obs_shape(self.policy.obs_space)
-            self._agent_obs_pairs = {
-                "state": obs[:-1].view(-1, *ob_shape),
-                "next_state": obs[1:].view(-1, *ob_shape),
-                "mask": storage.masks[:-1].view(-1, 1),
-            }
+            agent_sampler = storage.get_state_pair_generator(
+                self.expert_train_loader.batch_size
+            )
         elif isinstance(storage, ReplayBuffer):
             raise NotImplementedError("GAIfO+SAC not yet implemented")
         else:
             raise ValueError(f"Unrecognized storage {storage}")
 
-        failure_sampler = BatchSampler(
-            SubsetRandomSampler(range(self.args.num_steps)),
-            self.args.traj_batch_size,
-            drop_last=True,
-        )
-        return self.expert_train_loader, failure_sampler
+        return self.expert_train_loader, agent_sampler
 
     def get_env_settings(self, args):
         settings = super().get_env_settings(args)
@@ -144,14 +212,9 @@ class GaifoDiscrim(GailDiscrim):
         return settings
 
     def _compute_discrim_reward(self, state, next_state, action, mask, add_inputs):
-        finished_episodes = [i for i in range(len(mask)) if mask[i] == 0.0]
-        obsfilt = self.get_env_ob_filt()
-        for i in finished_episodes:
-            next_state[i] = add_inputs["final_obs"][i]
-            if obsfilt is not None:
-                next_state[i] = torch.FloatTensor(
-                    obsfilt(next_state[i].cpu().numpy(), update=False)
-                ).to(self.args.device)
+        next_state = self._sub_final_obs(
+            next_state, add_inputs.get("next_mask", mask), add_inputs
+        )
 
         d_val = self.discrim_net(state, next_state)
         s = torch.sigmoid(d_val)
@@ -155,13 +155,28 @@ class GailDiscrim(BaseIRLAlgo):
     def _norm_expert_state(self, state, obsfilt):
         if not self.args.gail_state_norm:
             return state
-        state = state.cpu().numpy()
+        state = state.to(self.args.device)
 
         if obsfilt is not None:
             state = obsfilt(state, update=False)
-        state = torch.tensor(state).to(self.args.device)
         return state
 
+    def _sub_final_obs(self, next_state, mask, add_inputs):
+        """
+        Replaces the next state of finished episodes with the normalized final
+        observation of the episode, since the environment already reset.
+        """
+        finished = mask.view(-1) == 0.0
+        if not finished.any():
+            return next_state
+        final_obs = add_inputs["final_obs"][finished]
+        obsfilt = self.get_env_ob_filt()
+        if obsfilt is not None:
+            final_obs = obsfilt(final_obs.to(next_state.device), update=False)
+        next_state = next_state.clone()
+        next_state[finished] = final_obs
+        return next_state
+
     def _trans_agent_state(self, state, other_state=None):
         if not self.args.gail_state_norm:
             if other_state is None:
@@ -282,19 +297,20 @@ class GailDiscrim(BaseIRLAlgo):
         return reward
 
     def get_reward(self, state, next_state, action, mask, add_inputs):
+        return self._get_rollout_reward(
+            state, next_state, action, mask, add_inputs, mask.shape[0]
+        )
+
+    def _get_rollout_reward(
+        self, state, next_state, action, mask, add_inputs, num_procs
+    ):
         self.discrim_net.eval()
         reward = self._compute_discrim_reward(
             state, next_state, action, mask, add_inputs
         )
 
         if self.args.gail_reward_norm:
-            if self.returns is None:
-                self.returns = reward.clone()
-
-            self.returns = self.returns * mask * self.args.gamma + reward
-            self.ret_rms.update(self.returns.cpu().numpy())
-
-            return reward / np.sqrt(self.ret_rms.var[0] + 1e-8), {}
+            return self._norm_reward(reward, mask, num_procs), {}
         else:
             return reward, {}
 
@@ -352,7 +368,9 @@ class GailDiscrim(BaseIRLAlgo):
 
     def load(self, checkpointer):
         super().load(checkpointer)
-        self.discrim_net.load_state_dict(checkpointer.get_key("gail_disc"))
+        # Not loaded when filtered out by --load-keys.
+        if checkpointer.has_load_key("gail_disc"):
+            self.discrim_net.load_state_dict(checkpointer.get_key("gail_disc"))
 
     def save(self, checkpointer):
         super().save(checkpointer)
@@ -0,0 +1,164 @@
+import atexit
+import queue
+import random
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from rlf.algos.il.base_il import ExperienceGenerator
+
+# How long blocking queue operations wait before checking for shutdown.
+_POLL_TIMEOUT = 0.1
+
+
+def _generator_worker(
+    worker_id: int,
+    make_generator: Callable[[], ExperienceGenerator],
+    policy,
+    args,
+    exp_gen_num_trans: int,
+    seed: int,
+    batch_queue,
+    stop_event,
+) -> None:
+    # Exit without flushing batches the learner will never read.
+    batch_queue.cancel_join_thread()
+    torch.set_num_threads(1)
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    generator = make_generator()
+    generator.init(policy, args, exp_gen_num_trans)
+    try:
+        while not stop_event.is_set():
+            batch = generator.get_batch()
+            # A None batch marks the end of the generator's epoch. It is
+            # forwarded so the learner can end its epoch once every worker
+            # has ended theirs.
+            if batch is None:
+                generator.reset()
+            while not stop_event.is_set():
+                try:
+                    batch_queue.put(batch, timeout=_POLL_TIMEOUT)
+                    break
+                except queue.Full:
+                    pass
+    finally:
+        generator.close()
+
+
+class ParallelExperienceGenerator(ExperienceGenerator):
+    """
+    Runs copies of an `ExperienceGenerator` in background worker processes
+    that keep bounded queues of ready batches filled, so generating the expert
+    batches does not block the update step.
+
+    Worker `i` is seeded with `args.seed + i` and batches are taken from the
+    workers in round robin order, so the sequence of batches is the same
+    between runs. The `exp_gen_num_trans` transitions of an epoch are split
+    between the workers, so an epoch has the size of one of the wrapped
+    generator. A worker that ended its epoch is skipped until all workers
+    have, then a single None is returned for the epoch end. The workers are
+    stopped by `close`, which is called when the algorithm is closed or at
+    interpreter exit.
+    """
+
+    def __init__(
+        self,
+        make_generator: Callable[[], ExperienceGenerator],
+        num_workers: int = 2,
+        queue_size: int = 8,
+        start_method: Optional[str] = None,
+    ):
+        """
+        :param make_generator: Creates the generator in each worker. Must be
+            picklable if the start method is not `fork`.
+        :param queue_size: Total number of batches buffered across workers.
+        :param start_method: Multiprocessing start method, the platform
+            default if None.
+        """
+        self._make_generator = make_generator
+        self._num_workers = num_workers
+        self._queue_size = queue_size
+        self._start_method = start_method
+        self._workers = []
+        self._queues = []
+        self._stop_event = None
+        self._next_worker = 0
+        # Workers that ended their epoch in the current epoch.
+        self._epoch_done = set()
+
+    def init(self, policy, args, exp_gen_num_trans):
+        """
+        Starts the workers. Each worker gets a copy of `policy` as it is now
+        and generates its share of `exp_gen_num_trans`.
+        """
+        ctx = mp.get_context(self._start_method)
+        self._stop_event = ctx.Event()
+        per_worker_size = max(self._queue_size // self._num_workers, 1)
+        for i in range(self._num_workers):
+            worker_num_trans = exp_gen_num_trans // self._num_workers
+            if i < exp_gen_num_trans % self._num_workers:
+                worker_num_trans += 1
+            batch_queue = ctx.Queue(maxsize=per_worker_size)
+            worker = ctx.Process(
+                target=_generator_worker,
+                args=(
+                    i,
+                    self._make_generator,
+                    policy,
+                    args,
+                    worker_num_trans,
+                    args.seed + i,
+                    batch_queue,
+                    self._stop_event,
+                ),
+                daemon=True,
+            )
+            worker.start()
+            self._workers.append(worker)
+            self._queues.append(batch_queue)
+        atexit.register(self.close)
+
+    def get_batch(self) -> Optional[Dict[str, Any]]:
+        if len(self._workers) == 0:
+            raise ValueError("Generator workers are not running")
+        while True:
+            if len(self._epoch_done) == self._num_workers:
+                self._epoch_done = set()
+                return None
+            worker_id = self._next_worker
+            self._next_worker = (self._next_worker + 1) % self._num_workers
+            if worker_id in self._epoch_done:
+                continue
+            batch = self._get_worker_batch(worker_id)
+            if batch is not None:
+                return batch
+            self._epoch_done.add(worker_id)
+
+    def _get_worker_batch(self, worker_id: int) -> Optional[Dict[str, Any]]:
+        while True:
+            try:
+                return self._queues[worker_id].get(timeout=_POLL_TIMEOUT)
+            except queue.Empty:
+                if not self._workers[worker_id].is_alive():
+                    raise RuntimeError(
+                        f"Experience generator worker {worker_id} exited with code "
+                        f"{self._workers[worker_id].exitcode}"
+                    )
+
+    def close(self):
+        if len(self._workers) == 0:
+            return
+        self._stop_event.set()
+        for worker in self._workers:
+            worker.join(timeout=5.0)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        for batch_queue in self._queues:
+            batch_queue.close()
+        self._workers = []
+        self._queues = []
@@ -14,6 +14,8 @@ from rlf.baselines.common.running_mean_std import RunningMeanStd
 from rlf.rl.model import InjectNet
 from rlf.rl.utils import get_obs_shape, get_ac_dim
 from rlf.exp_mgr.viz_utils import append_text_to_image
+from rlf.il.il_dataset import BatchIndexSampler
+from scipy.spatial import cKDTree
 
 
 def get_default_discrim():
@@ -33,6 +35,79 @@ def get_default_discrim():
     return nn.Sequential(*layers), hidden_dim
 
 
+class GreedyCouplingReward:
+    """
+    The greedy primal coupling reward from PWIL
+    (https://arxiv.org/abs/2006.04678). Every expert state-action has weight
+    1 / # expert transitions and every agent step has weight 1 / horizon. Each
+    agent step is greedily coupled to its nearest expert state-actions that
+    still have weight left in the current episode. A KD-tree over the
+    standardized expert state-actions is built once so each step only looks
+    at its nearest neighbours rather than the whole dataset.
+    """
+
+    def __init__(self, expert_sa, num_envs, horizon, alpha, beta):
+        """
+        - expert_sa (np.ndarray[N, D]): expert states concatenated with actions.
+        """
+        self.mean = expert_sa.mean(0)
+        self.std = expert_sa.std(0)
+        self.std[self.std < 1e-8] = 1.0
+        self.tree = cKDTree((expert_sa - self.mean) / self.std)
+
+        self.n_expert = expert_sa.shape[0]
+        self.expert_weight = 1.0 / self.n_expert
+        self.agent_weight = 1.0 / horizon
+        self.alpha = alpha
+        self.reward_scale = beta * horizon / np.sqrt(expert_sa.shape[1])
+        # Number of neighbours to query first, each step needs around
+        # n_expert / horizon expert transitions.
+        self.k = min(self.n_expert, 2 * int(np.ceil(self.n_expert / horizon)) + 1)
+
+        # Remaining weight of every expert transition for each environment.
+        self.weights = np.full((num_envs, self.n_expert), self.expert_weight)
+        self.remaining = np.ones(num_envs)
+
+    def reset(self, env_idxs):
+        self.weights[env_idxs] = self.expert_weight
+        self.remaining[env_idxs] = 1.0
+
+    def compute_reward(self, agent_sa):
+        """
+        - agent_sa (np.ndarray[num_envs, D]): the next step of every environment.
+        Returns the reward for each environment.
+        """
+        # Episodes longer than the horizon start a new coupling once the
+        # expert weight runs out.
+        self.reset(self.remaining < self.agent_weight * (1.0 - 1e-6))
+
+        x = (agent_sa - self.mean) / self.std
+        cost = np.zeros(x.shape[0])
+        todo = np.arange(x.shape[0])
+        k = self.k
+        while len(todo) > 0:
+            dists, idxs = self.tree.query(x[todo], k=k)
+            dists = dists.reshape(len(todo), -1)
+            idxs = idxs.reshape(len(todo), -1)
+            w = self.weights[todo[:, None], idxs]
+            # Take the expert weight in order of distance until the agent
+            # weight is used up.
+            before = np.cumsum(w, axis=1) - w
+            take = np.clip(self.agent_weight - before, 0.0, w)
+            is_done = take.sum(1) >= self.agent_weight * (1.0 - 1e-6)
+            if k == self.n_expert:
+                is_done[:] = True
+
+            rows = todo[is_done]
+            self.weights[rows[:, None], idxs[is_done]] -= take[is_done]
+            self.remaining[rows] -= take[is_done].sum(1)
+            cost[rows] = (take[is_done] * dists[is_done]).sum(1)
+
+            todo = todo[~is_done]
+            k = min(2 * k, self.n_expert)
+        return self.alpha * np.exp(-self.reward_scale * cost)
+
+
 class PWIL(NestedAlgo):
     def __init__(self, agent_updater=PPO(), get_discrim=None):
         super().__init__([PrimalWasserstein(get_discrim), agent_updater], 1)
@@ -71,6 +146,23 @@ class PrimalWasserstein(BaseIRLAlgo):
         self.opt = optim.Adam(
             self.discrim_net.parameters(), lr=self.args.disc_lr)
 
+        self.coupling_reward = None
+        if self.args.reward_type == 'coupling':
+            self.coupling_reward = GreedyCouplingReward(
+                self._get_expert_state_actions(), args.num_processes,
+                args.pwil_horizon, args.pwil_alpha, args.pwil_beta)
+
+    def _get_expert_state_actions(self):
+        expert_batch = next(iter(BatchIndexSampler(
+            self.expert_dataset, len(self.expert_dataset), shuffle=False,
+            device=self.args.device)))
+        expert_actions = self._adjust_action(
+            expert_batch['actions'].to(self.args.device))
+        expert_actions = rutils.get_ac_repr(self.action_space, expert_actions)
+        expert_states = expert_batch['state'].to(self.args.device)
+        return torch.cat([expert_states.view(expert_states.shape[0], -1),
+                          expert_actions], dim=-1).cpu().numpy()
+
     def _get_sampler(self, storage):
         agent_experience = storage.get_generator(None,
                                                  mini_batch_size=self.expert_train_loader.batch_size)
@@ -81,7 +173,7 @@ class PrimalWasserstein(BaseIRLAlgo):
 
     def get_env_settings(self, args):
         settings = super().get_env_settings(args)
-        if not args.gail_state_norm:
+        if not args.gail_state_norm or args.reward_type == 'coupling':
             settings.ret_raw_obs = True
         settings.mod_render_frames_fn = self.mod_render_frames
         return settings
@@ -106,15 +198,15 @@ class PrimalWasserstein(BaseIRLAlgo):
     def _norm_expert_state(self, state, obsfilt):
         if not self.args.gail_state_norm:
             return state
-        state = state.cpu().numpy()
+        state = state.to(self.args.device)
 
         if obsfilt is not None:
             state = obsfilt(state, update=False)
-        state = torch.tensor(state).to(self.args.device)
         return state
 
     def _trans_agent_state(self, state, other_state=None):
-        if not self.args.gail_state_norm:
+        # The coupling is computed between raw expert and agent states.
+        if not self.args.gail_state_norm or self.args.reward_type == 'coupling':
             if other_state is None:
                 return state['raw_obs']
             return other_state['raw_obs']
@@ -123,14 +215,18 @@ class PrimalWasserstein(BaseIRLAlgo):
     def _compute_wass_distance(self, expert_states, expert_actions, agent_states, agent_actions):
         expert_dist = self.discrim_net(expert_states, expert_actions)
         agent_dist = self.discrim_net(agent_states, agent_actions)
-        wass_distance_val = wass_distance(expert_dist, agent_dist)
-        return wass_distance_val
+        return wass_distance(expert_dist, agent_dist,
+                             reg=self.args.sinkhorn_reg)
 
     def _compute_primal_wass_reward(self, expert_states, expert_actions, agent_states, agent_actions):
-        wass_distance_val = self._compute_wass_distance(expert_states, expert_actions, agent_states, agent_actions)
-        return -wass_distance_val.mean()
+        wass_distance_val, n_iters = self._compute_wass_distance(
+            expert_states, expert_actions, agent_states, agent_actions)
+        return -wass_distance_val.mean(), n_iters
 
     def _update_reward_func(self, storage, gradient_clip=False, t=1):
+        if self.coupling_reward is not None:
+            # The coupling reward has nothing to learn.
+            return {}
         self.discrim_net.train()
 
         log_vals = defaultdict(lambda: 0)
@@ -158,48 +254,66 @@ class PrimalWasserstein(BaseIRLAlgo):
 
                 agent_actions = rutils.get_ac_repr(self.action_space, agent_actions)
                 expert_actions = rutils.get_ac_repr(self.action_space, expert_actions)
-                primal_wass_reward = self._compute_primal_wass_reward(expert_states, expert_actions, agent_states,
-                                                                      agent_actions)
+                primal_wass_reward, n_iters = self._compute_primal_wass_reward(
+                    expert_states, expert_actions, agent_states, agent_actions)
                 log_vals['primal_wass_reward'] += primal_wass_reward.item()
+                log_vals['sinkhorn_iters'] += n_iters
 
         for k in log_vals:
             log_vals[k] /= n
 
         return log_vals
 
-    def _compute_discrim_reward(self, storage, step, add_info):
-        state = self._trans_agent_state(storage.get_obs(step))
-        action = storage.actions[step]
+    def _compute_discrim_reward(self, state, next_state, action, mask, add_inputs):
         action = rutils.get_ac_repr(self.action_space, action)
         d_val = self.discrim_net(state, action)
         s = torch.sigmoid(d_val)
         eps = 1e-20
         if self.args.reward_type == 'airl':
             reward = (s + eps).log() - (1 - s + eps).log()
-        elif self.args.reward_type == 'pwil':
-            reward = -wass_distance(s, 1 - s)
         elif self.args.reward_type == 'raw':
             reward = d_val
         else:
             raise ValueError(f"Unrecognized reward type {self.args.reward_type}")
         return reward
 
-    def _get_reward(self, step, storage, add_info):
-        masks = storage.masks[step]
-        with torch.no_grad():
+    def _compute_coupling_reward(self, state, action, mask, num_procs):
+        """
+        The coupling is incremental within an episode so the steps are
+        processed in order, each one vectorized across the environments.
+        """
+        if num_procs != self.args.num_processes:
+            raise ValueError(
+                'The coupling reward must be computed over rollouts')
+        action = rutils.get_ac_repr(self.action_space, action)
+        agent_sa = torch.cat([state.view(state.shape[0], -1), action], dim=-1)
+        agent_sa = agent_sa.view(-1, num_procs, agent_sa.shape[-1]).cpu().numpy()
+        new_episode = (mask.view(-1, num_procs) == 0).cpu().numpy()
+
+        reward = np.zeros(agent_sa.shape[:2], dtype=np.float32)
+        for step in range(agent_sa.shape[0]):
+            self.coupling_reward.reset(new_episode[step])
+            reward[step] = self.coupling_reward.compute_reward(agent_sa[step])
+        return torch.as_tensor(reward, device=state.device).view(-1, 1)
+
+    def get_reward(self, state, next_state, action, mask, add_inputs):
+        return self._get_rollout_reward(state, next_state, action, mask,
+                                        add_inputs, mask.shape[0])
+
+    def _get_rollout_reward(self, state, next_state, action, mask, add_inputs,
+                            num_procs):
+        if self.coupling_reward is not None:
+            reward = self._compute_coupling_reward(state, action, mask,
+                                                   num_procs)
+        else:
             self.discrim_net.eval()
-            reward = self._compute_discrim_reward(storage, step, add_info)
-
-            if self.args.gail_reward_norm:
-                if self.returns is None:
-                    self.returns = reward.clone()
-
-                self.returns = self.returns * masks * self.args.gamma + reward
-                self.ret_rms.update(self.returns.cpu().numpy())
+            reward = self._compute_discrim_reward(state, next_state, action,
+                                                  mask, add_inputs)
 
-                return reward / np.sqrt(self.ret_rms.var[0] + 1e-8), {}
-            else:
-                return reward, {}
+        if self.args.gail_reward_norm:
+            return self._norm_reward(reward, mask, num_procs), {}
+        else:
+            return reward, {}
 
     def get_add_args(self, parser):
         super().get_add_args(parser)
@@ -214,9 +328,20 @@ class PrimalWasserstein(BaseIRLAlgo):
         parser.add_argument('--disc-lr', type=float, default=0.0001)
         parser.add_argument('--disc-grad-pen', type=float, default=0.0)
         parser.add_argument('--n-pwil-epochs', type=int, default=1)
-        parser.add_argument('--reward-type', type=str, default='pwil', help="""
-                One of [airl, raw, pwil]. Changes the reward computation. Does
-                not change training.
+        parser.add_argument('--reward-type', type=str, default='coupling',
+                choices=['coupling', 'airl', 'raw'], help="""
+                Changes the reward computation. "coupling" is the greedy
+                coupling reward of PWIL and does not train the discriminator.
+                """)
+        parser.add_argument('--pwil-horizon', type=int, default=1000, help="""
+                Episode length used to weight each agent step in the coupling
+                reward.
+                """)
+        parser.add_argument('--pwil-alpha', type=float, default=5.0)
+        parser.add_argument('--pwil-beta', type=float, default=5.0)
+        parser.add_argument('--sinkhorn-reg', type=float, default=0.05, help="""
+                Entropic regularization of the Sinkhorn distance used by the
+                discriminator based reward types.
                 """)
 
     def load_resume(self, checkpointer):
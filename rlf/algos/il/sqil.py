@@ -73,10 +73,7 @@ class SqilTransitionStorage(ReplayBuffer):
         obsfilt = self.il_algo.get_env_ob_filt()
         if obsfilt is None:
             return state
-        state = state.cpu().numpy()
-        state = obsfilt(state, update=False)
-        state = torch.tensor(state).to(self.args.device)
-        return state
+        return obsfilt(state.to(self.args.device), update=False)
 
 
 class SQIL(SAC):
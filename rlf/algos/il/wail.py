@@ -109,11 +109,10 @@ class WailDiscrim(BaseIRLAlgo):
     def _norm_expert_state(self, state, obsfilt):
         if not self.args.wail_state_norm:
             return state
-        state = state.cpu().numpy()
+        state = state.to(self.args.device)
 
         if obsfilt is not None:
             state = obsfilt(state, update=False)
-        state = torch.tensor(state).to(self.args.device)
         return state
 
     def _trans_agent_state(self, state, other_state=None):
@@ -144,6 +143,15 @@ class WailDiscrim(BaseIRLAlgo):
         grad_pen = self.compute_pen(expert_states, expert_actions, agent_states,
                                     agent_actions)
 
+        sinkhorn_dist = None
+        if self.args.wail_sinkhorn_reg != 0.0:
+            # Only tracked to monitor how close the agent is to the expert.
+            with torch.no_grad():
+                sinkhorn_dist = autils.wass_distance(
+                    torch.cat([expert_states.flatten(1), expert_actions.flatten(1)], dim=-1),
+                    torch.cat([agent_states.flatten(1), agent_actions.flatten(1)], dim=-1),
+                    reg=self.args.wail_sinkhorn_reg)
+
         diff = torch.cat([(expert_states - agent_states).flatten(1), (expert_actions - agent_actions).flatten(1)],
                          dim=-1)
         distant = torch.norm(diff, dim=1, keepdim=True)
@@ -152,7 +160,7 @@ class WailDiscrim(BaseIRLAlgo):
         else:
             regularize_term = 0.0
 
-        return expert_d, agent_d, grad_pen, regularize_term
+        return expert_d, agent_d, grad_pen, regularize_term, sinkhorn_dist
 
     def compute_pen(self, expert_states, expert_actions, agent_states, agent_actions):
         grad_pen = self.args.disc_grad_pen * autils.wass_grad_pen(expert_states,
@@ -188,8 +196,8 @@ class WailDiscrim(BaseIRLAlgo):
                 expert_batch, agent_batch = self._trans_batches(
                     expert_batch, agent_batch)
                 n += 1
-                expert_d, agent_d, grad_pen, regularize_term = self._compute_discrim_loss(agent_batch, expert_batch,
-                                                                                          obsfilt)
+                expert_d, agent_d, grad_pen, regularize_term, sinkhorn_dist = self._compute_discrim_loss(
+                    agent_batch, expert_batch, obsfilt)
                 expert_loss = torch.mean(expert_d)
                 agent_loss = torch.mean(agent_d)
                 discrim_loss = - expert_loss + agent_loss + regularize_term
@@ -208,15 +216,16 @@ class WailDiscrim(BaseIRLAlgo):
                 log_vals['discrim_loss'] += discrim_loss.item()
                 log_vals['expert_loss'] += expert_loss.item()
                 log_vals['agent_loss'] += agent_loss.item()
+                if sinkhorn_dist is not None:
+                    log_vals['sinkhorn_dist'] += sinkhorn_dist[0].item()
+                    log_vals['sinkhorn_iters'] += sinkhorn_dist[1]
 
         for k in log_vals:
             log_vals[k] /= n
 
         return log_vals
 
-    def _compute_discrim_reward(self, storage, step, add_info):
-        state = self._trans_agent_state(storage.get_obs(step))
-        action = storage.actions[step]
+    def _compute_discrim_reward(self, state, next_state, action, mask, add_inputs):
         action = rutils.get_ac_repr(self.action_space, action)
         d_val = self._compute_disc_val(state, action)
         if self.args.reward_type == "positive":
@@ -227,22 +236,20 @@ class WailDiscrim(BaseIRLAlgo):
             raise ValueError(f"Unrecognized reward type {self.args.reward_type}")
         return reward
 
-    def _get_reward(self, step, storage, add_info):
-        masks = storage.masks[step]
-        with torch.no_grad():
-            self.discrim_net.eval()
-            reward = self._compute_discrim_reward(storage, step, add_info)
-
-            if self.args.wail_reward_norm:
-                if self.returns is None:
-                    self.returns = reward.clone()
+    def get_reward(self, state, next_state, action, mask, add_inputs):
+        return self._get_rollout_reward(state, next_state, action, mask,
+                                        add_inputs, mask.shape[0])
 
-                self.returns = self.returns * masks * self.args.gamma + reward
-                self.ret_rms.update(self.returns.cpu().numpy())
+    def _get_rollout_reward(self, state, next_state, action, mask, add_inputs,
+                            num_procs):
+        self.discrim_net.eval()
+        reward = self._compute_discrim_reward(state, next_state, action, mask,
+                                              add_inputs)
 
-                return reward / np.sqrt(self.ret_rms.var[0] + 1e-8), {}
-            else:
-                return reward, {}
+        if self.args.wail_reward_norm:
+            return self._norm_reward(reward, mask, num_procs), {}
+        else:
+            return reward, {}
 
     def get_add_args(self, parser):
         super().get_add_args(parser)
@@ -265,6 +272,10 @@ class WailDiscrim(BaseIRLAlgo):
                 not change training.
                 """)
         parser.add_argument('--regularize-epsilon', type=float, default=0.0)
+        parser.add_argument('--wail-sinkhorn-reg', type=float, default=0.0, help="""
+                If non-zero, log the Sinkhorn distance between the expert and
+                agent state-action batches with this entropic regularization.
+                """)
 
     def load_resume(self, checkpointer):
         super().load_resume(checkpointer)
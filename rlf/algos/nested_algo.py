@@ -30,6 +30,10 @@ class NestedAlgo(BaseAlgo):
         for module in self.modules:
             module.add_and_clear_timer(log_vals)
 
+    def add_timer_to(self, timer):
+        for module in self.modules:
+            module.add_timer_to(timer)
+
     def get_steps_generator(self, update_iter):
         return self.modules[self.designated_rl_idx].get_steps_generator(update_iter)
 
@@ -72,6 +76,10 @@ class NestedAlgo(BaseAlgo):
         for module in self.modules:
             module.pre_update(cur_update)
 
+    def close(self):
+        for module in self.modules:
+            module.close()
+
     def get_storage_buffer(self, policy, envs, args):
         return self.modules[self.designated_rl_idx].get_storage_buffer(
             policy, envs, args
@@ -32,6 +32,7 @@ class OffPolicy(BaseNetAlgo):
             args,
         )
 
+    @rutils.TimeProfiler("minibatch")
     def _sample_transitions(self, storage):
         return storage.sample_tensors(self.args.batch_size)
 
@@ -44,6 +44,7 @@ class OnPolicy(BaseNetAlgo):
             ).detach()
         return next_value
 
+    @rutils.TimeProfiler("compute_returns")
     def _compute_returns(self, rollouts):
         next_value = self._get_next_value(rollouts)
         rollouts.compute_returns(next_value)
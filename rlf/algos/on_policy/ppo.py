@@ -1,5 +1,6 @@
 from collections import defaultdict
 
+import rlf.rl.utils as rutils
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -21,15 +22,16 @@ class PPO(OnPolicy):
                 advantages, self._arg("num_mini_batch")
             )
 
-            for sample in data_generator:
+            for sample in self.timer.time_iter("minibatch", data_generator):
                 # Get all the data from our batch sample
-                ac_eval = self.policy.evaluate_actions(
-                    sample["state"],
-                    sample["other_state"],
-                    sample["hxs"],
-                    sample["mask"],
-                    sample["action"],
-                )
+                with rutils.TimeProfiler("forward", self):
+                    ac_eval = self.policy.evaluate_actions(
+                        sample["state"],
+                        sample["other_state"],
+                        sample["hxs"],
+                        sample["mask"],
+                        sample["action"],
+                    )
 
                 ratio = torch.exp(ac_eval["log_prob"] - sample["prev_log_prob"])
                 surr1 = ratio * sample["adv"]
@@ -2,6 +2,7 @@
 Includes clipping utilies, wrapping utilies, common RL algorithm components.
 """
 
+import warnings
 from typing import Dict, List, Optional, Tuple
 
 import gym.spaces as spaces
@@ -199,34 +200,109 @@ def wass_grad_pen(
     return grad_pen
 
 
-def wass_distance(p_dist, q_dist, eps=1e-8, n_iters=5):
+def sinkhorn(
+    cost: torch.Tensor,
+    a: Optional[torch.Tensor] = None,
+    b: Optional[torch.Tensor] = None,
+    reg: float = 0.05,
+    tol: float = 1e-4,
+    max_iters: int = 1000,
+    eps_scaling: int = 1,
+) -> Tuple[torch.Tensor, int]:
     """
-    Approximate the Wasserstein distance between two distributions using the Sinkhorn algorithm.
+    Entropic optimal transport with the log-domain stabilized Sinkhorn
+    algorithm, so it is safe for small `reg`.
 
     Parameters:
-        p_dist (torch.Tensor): The first distribution.
-        q_dist (torch.Tensor): The second distribution.
-        eps (float): A small positive value to stabilize the computation.
-        n_iters (int): Number of iterations for Sinkhorn algorithm.
+        cost (torch.Tensor): [B, N, M] or [N, M] cost matrices.
+        a (torch.Tensor): [B, N] or [N] source weights, uniform if None.
+        b (torch.Tensor): [B, M] or [M] target weights, uniform if None.
+        reg (float): The entropic regularization.
+        tol (float): Stop once the L1 error of the source marginals of every
+            batch element is below this.
+        max_iters (int): Maximum number of iterations per regularization stage.
+        eps_scaling (int): Number of stages the regularization is annealed over,
+            geometrically from the largest cost down to `reg`. More stages
+            converge in fewer total iterations for small `reg`.
 
     Returns:
-        torch.Tensor: Approximated Wasserstein distance between p_dist and q_dist.
+        Tuple[torch.Tensor, int]: The transport plans with the same shape as
+        `cost` and the total number of iterations used. A warning is issued if
+        the final stage did not reach `tol` within `max_iters`.
     """
-    n_points = p_dist.shape[0]
-    # Initializing the scaling factors for the two distributions
-    u = torch.ones(n_points, device=p_dist.device) / n_points
-    v = torch.ones(n_points, device=p_dist.device) / n_points
+    is_batched = cost.dim() == 3
+    if not is_batched:
+        cost = cost.unsqueeze(0)
+    n_batch, n, m = cost.shape
+    if a is None:
+        a = torch.full((n_batch, n), 1.0 / n, device=cost.device, dtype=cost.dtype)
+    if b is None:
+        b = torch.full((n_batch, m), 1.0 / m, device=cost.device, dtype=cost.dtype)
+    a = a.view(-1, n).expand(n_batch, n)
+    b = b.view(-1, m).expand(n_batch, m)
+    log_a = a.log()
+    log_b = b.log()
+
+    max_cost = cost.detach().max().item()
+    if eps_scaling > 1 and max_cost > reg:
+        epss = np.geomspace(max_cost, reg, eps_scaling)
+    else:
+        epss = [reg]
+
+    f = torch.zeros_like(a)
+    g = torch.zeros_like(b)
+    n_iters = 0
+    for eps in epss:
+        converged = False
+        for _ in range(max_iters):
+            n_iters += 1
+            new_f = eps * (
+                log_a - torch.logsumexp((g.unsqueeze(1) - cost) / eps, dim=2)
+            )
+            # The source marginals of the current plan are
+            # a * exp((f - new_f) / eps).
+            err = (a * torch.exp((f - new_f) / eps) - a).abs().sum(-1).max()
+            f = new_f
+            g = eps * (
+                log_b - torch.logsumexp((f.unsqueeze(2) - cost) / eps, dim=1)
+            )
+            if err.item() < tol:
+                converged = True
+                break
+    if not converged:
+        # Only the final stage with the target regularization must converge.
+        warnings.warn(
+            f"Sinkhorn did not converge in {max_iters} iterations with reg={reg}, "
+            f"the marginal error is {err.item():.2e}. Increase max_iters or "
+            "eps_scaling."
+        )
 
-    # Sinkhorn iterations
-    for i in range(n_iters):
-        v = q_dist / (torch.sum(p_dist * u, dim=1, keepdim=True) + eps)
-        u = 1.0 / (torch.sum(p_dist * v, dim=1, keepdim=True) + eps)
+    plan = torch.exp((f.unsqueeze(2) + g.unsqueeze(1) - cost) / reg)
+    if not is_batched:
+        plan = plan.squeeze(0)
+    return plan, n_iters
 
-    # Compute the optimal transport matrix and the Wasserstein distance
-    transport_matrix = u * (p_dist * v.t())
-    wass_distance_val = torch.sum(transport_matrix * q_dist, dim=1, keepdim=True)
 
-    return wass_distance_val
+def wass_distance(
+    x: torch.Tensor, y: torch.Tensor, reg: float = 0.05, **sinkhorn_kwargs
+) -> Tuple[torch.Tensor, int]:
+    """
+    Approximate the Wasserstein distance between the uniform distributions over
+    the points `x` and the points `y` with Sinkhorn under the euclidean cost.
+
+    Parameters:
+        x (torch.Tensor): [B, N, D] or [N, D] points.
+        y (torch.Tensor): [B, M, D] or [M, D] points.
+        reg (float): The entropic regularization.
+        sinkhorn_kwargs: Passed to `sinkhorn`.
+
+    Returns:
+        Tuple[torch.Tensor, int]: The [B] or scalar distances and the number of
+        Sinkhorn iterations used.
+    """
+    cost = torch.cdist(x, y)
+    plan, n_iters = sinkhorn(cost, reg=reg, **sinkhorn_kwargs)
+    return (plan * cost).sum((-2, -1)), n_iters
 
 
 class RunningMeanAndVar(nn.Module):
@@ -285,6 +361,45 @@ class RunningMeanAndVar(nn.Module):
         return torch.addcmul(-self._mean * inv_stdev, x, inv_stdev)
 
 
+class TorchRunningMeanStd(nn.Module):
+    """
+    Torch counterpart of `rlf.baselines.common.running_mean_std.RunningMeanStd`
+    that keeps its statistics on the device of the data being normalized.
+    `VecNormalize` keeps one of these in sync with its numpy statistics so
+    observations can be normalized without a round trip through numpy. The
+    statistics are only ever copied from the numpy version, never updated.
+    """
+
+    def __init__(self, shape: Tuple[int, ...]) -> None:
+        super().__init__()
+        self._shape = tuple(shape)
+        self.register_buffer("_mean", torch.zeros(self._shape))
+        self.register_buffer("_var", torch.ones(self._shape))
+
+    @torch.no_grad()
+    def load_np(self, ob_rms) -> None:
+        """
+        Copies the statistics from a numpy `RunningMeanStd`.
+        """
+        self._mean.copy_(torch.as_tensor(ob_rms.mean).view(self._shape))
+        self._var.copy_(torch.as_tensor(ob_rms.var).view(self._shape))
+
+    def normalize(
+        self, x: torch.Tensor, epsilon: float = 1e-8, clip: Optional[float] = None
+    ) -> torch.Tensor:
+        """
+        Same normalization as `VecNormalize._obfilt`. Does not update the
+        statistics.
+        """
+        x = (x - self._mean) / torch.sqrt(self._var + epsilon)
+        if clip is not None:
+            x = x.clamp(-clip, clip)
+        return x
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.normalize(x)
+
+
 class MeanAndVar(nn.Module):
     def __init__(self, mean, var):
         super().__init__()
@@ -61,12 +61,67 @@ def add_args(parser):
         default=50,
         help="save interval, one save per n updates (default: 100)",
     )
+    parser.add_argument(
+        "--async-save",
+        type=str2bool,
+        default=False,
+        help="""
+            If true, checkpoints are copied to the CPU and written by a
+            background thread so training is not blocked.
+            """,
+    )
+    parser.add_argument(
+        "--max-pending-saves",
+        type=int,
+        default=2,
+        help="Max # of checkpoints waiting to be written with --async-save",
+    )
+    parser.add_argument(
+        "--ckpt-keep-last",
+        type=int,
+        default=None,
+        help="""
+            If any of the --ckpt-keep options are set, checkpoints not kept by
+            one of them are deleted. The latest checkpoint is always kept.
+            """,
+    )
+    parser.add_argument("--ckpt-keep-every", type=int, default=None)
+    parser.add_argument("--ckpt-keep-best", type=int, default=0)
+    parser.add_argument(
+        "--ckpt-best-metric",
+        type=str,
+        default="r",
+        help="Evaluation metric used by --ckpt-keep-best",
+    )
+    parser.add_argument(
+        "--ckpt-best-mode", type=str, default="max", choices=["max", "min"]
+    )
+    parser.add_argument(
+        "--ckpt-delta",
+        type=str2bool,
+        default=False,
+        help="""
+            If true, checkpoints between full checkpoints only store the
+            tensors that changed since the last full checkpoint.
+            """,
+    )
+    parser.add_argument("--ckpt-full-every", type=int, default=10)
     parser.add_argument(
         "--eval-interval",
         type=int,
         default=50,
         help="eval interval, one eval per n updates (default: None)",
     )
+    parser.add_argument(
+        "--async-eval",
+        type=str2bool,
+        default=False,
+        help="""
+            If true, evaluations during training run on a snapshot of the
+            policy in a background process and are logged when they finish.
+            Only supported when training on the CPU.
+            """,
+    )
 
     #############################
     # RUN CONFIG
@@ -185,6 +240,23 @@ def add_args(parser):
             """,
     )
     parser.add_argument("--num-eval", type=int, default=5)
+    parser.add_argument(
+        "--eval-adaptive",
+        type=str2bool,
+        default=False,
+        help="""
+            Stop evaluating early once the confidence interval of
+            --eval-metric is narrower than --eval-ci-width or is clearly above
+            or below --eval-threshold. At most the usual # of episodes are
+            run. The episodes running when it stops are finished and counted,
+            episodes that start later are not.
+            """,
+    )
+    parser.add_argument("--eval-metric", type=str, default="r")
+    parser.add_argument("--eval-min-episodes", type=int, default=10)
+    parser.add_argument("--eval-ci-width", type=float, default=None)
+    parser.add_argument("--eval-threshold", type=float, default=None)
+    parser.add_argument("--eval-confidence", type=float, default=0.95)
     parser.add_argument("--final-num-eval", type=int, default=None)
     parser.add_argument("--eval-at-start", type=str2bool, default=False)
     parser.add_argument(
@@ -193,16 +265,54 @@ def add_args(parser):
         default=100,
         help="Smoothing window for all logged statistics",
     )
+    parser.add_argument(
+        "--log-timers",
+        type=str2bool,
+        default=True,
+        help="""
+            Time the environment steps, policy inference, storage and update
+            phases. The total seconds of each per log interval are logged as
+            timing_* and a summary is printed when training ends.
+            """,
+    )
     parser.add_argument(
         "--num-render", type=int, default=None, help="None places no limit"
     )
     parser.add_argument(
         "--resume", default=False, action="store_true", help="Resume training"
     )
+    parser.add_argument(
+        "--save-resume-state",
+        type=str2bool,
+        default=False,
+        help="""
+            Also save the replay buffer, RNG states, reward normalization,
+            episode count and logging windows so --resume continues training
+            exactly. Only the buffer of the latest written checkpoint is
+            kept.
+            """,
+    )
 
     parser.add_argument(
         "--load-file", default="", help=".pt weights file for resuming or evaluating"
     )
+    parser.add_argument(
+        "--load-keys",
+        type=str,
+        default=None,
+        help="""
+            Comma separated keys of the --load-file checkpoint to load, such
+            as "policy,ob_rms" to only evaluate. Algorithm keys, such as
+            "gail_disc" for the GAIL discriminator, are skipped when not
+            listed. Resuming needs every key. By default all are loaded.
+            """,
+    )
+    parser.add_argument(
+        "--load-mmap",
+        type=str2bool,
+        default=True,
+        help="Memory map --load-file so tensors are only read when used",
+    )
 
     parser.add_argument(
         "--eval-num-processes",
@@ -212,6 +322,24 @@ def add_args(parser):
     )
     parser.add_argument("--vid-fps", type=float, default=30.0)
     parser.add_argument("--vid-dir", type=str, default="./data/vids")
+    parser.add_argument(
+        "--vid-scale",
+        type=float,
+        default=1.0,
+        help="Factor to resize the evaluation video frames by",
+    )
+    parser.add_argument(
+        "--vid-frame-skip",
+        type=int,
+        default=1,
+        help="Only every n-th rendered frame is written to the video",
+    )
+    parser.add_argument(
+        "--vid-queue-size",
+        type=int,
+        default=64,
+        help="Max # of rendered frames waiting to be encoded",
+    )
 
     #############################
     # POLICY
@@ -230,6 +358,21 @@ def add_args(parser):
         help="Save the trajectories from the evaluation",
     )
     parser.add_argument("--traj-dir", type=str, default="./data/traj")
+    parser.add_argument(
+        "--traj-chunk-size",
+        type=int,
+        default=None,
+        help="""
+            If set, saved trajectories are streamed to disk in chunks of at
+            least this many transitions instead of held in memory.
+            """,
+    )
+    parser.add_argument(
+        "--traj-append",
+        type=str2bool,
+        default=False,
+        help="Add streamed trajectories to those already saved",
+    )
 
     #############################
     # ENV
@@ -1,5 +1,5 @@
 import numpy as np
-from .vec_env import VecEnv
+from .vec_env import VecEnv, seed_env
 from .util import copy_obs_dict, dict_to_obs, obs_space_info
 from collections.abc import Iterable
 
@@ -60,6 +60,10 @@ class DummyVecEnv(VecEnv):
         return (self._obs_from_buf(), np.copy(self.buf_rews), np.copy(self.buf_dones),
                 self.buf_infos.copy())
 
+    def seed(self, seeds):
+        for env, seed in zip(self.envs, seeds):
+            seed_env(env, seed)
+
     def reset(self):
         for e in range(self.num_envs):
             obs = self.envs[e].reset()
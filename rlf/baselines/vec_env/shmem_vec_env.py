@@ -4,7 +4,7 @@ An interface for asynchronous vectorized environments.
 
 import multiprocessing as mp
 import numpy as np
-from .vec_env import VecEnv, CloudpickleWrapper, clear_mpi_env_vars
+from .vec_env import VecEnv, CloudpickleWrapper, clear_mpi_env_vars, seed_env
 import ctypes
 from rlf.baselines import logger
 from collections.abc import Iterable
@@ -69,6 +69,12 @@ class ShmemVecEnv(VecEnv):
             pipe.send(('reset', None))
         return self._decode_obses([pipe.recv() for pipe in self.parent_pipes])
 
+    def seed(self, seeds):
+        for pipe, seed in zip(self.parent_pipes, seeds):
+            pipe.send(('seed', seed))
+        for pipe in self.parent_pipes:
+            pipe.recv()
+
     def step_async(self, actions):
         assert len(actions) == len(self.parent_pipes)
         for pipe, act in zip(self.parent_pipes, actions):
@@ -145,6 +151,8 @@ def _subproc_worker(pipe, parent_pipe, env_fn_wrapper, obs_bufs, obs_shapes, obs
                 pipe.send((_write_obs(obs), reward, done, info))
             elif cmd == 'render':
                 pipe.send(env.render(mode=data[0], **data[1]))
+            elif cmd == 'seed':
+                pipe.send(seed_env(env, data))
             elif cmd == 'close':
                 pipe.send(None)
                 break
@@ -1,7 +1,7 @@
 import multiprocessing as mp
 
 import numpy as np
-from .vec_env import VecEnv, CloudpickleWrapper, clear_mpi_env_vars
+from .vec_env import VecEnv, CloudpickleWrapper, clear_mpi_env_vars, seed_env
 
 
 def worker(remote, parent_remote, env_fn_wrapper):
@@ -20,6 +20,8 @@ def worker(remote, parent_remote, env_fn_wrapper):
                 remote.send(ob)
             elif cmd == 'render':
                 remote.send(env.render(mode='rgb_array'))
+            elif cmd == 'seed':
+                remote.send(seed_env(env, data))
             elif cmd == 'close':
                 remote.close()
                 break
@@ -82,6 +84,13 @@ class SubprocVecEnv(VecEnv):
             remote.send(('reset', None))
         return _flatten_obs([remote.recv() for remote in self.remotes])
 
+    def seed(self, seeds):
+        self._assert_not_closed()
+        for remote, seed in zip(self.remotes, seeds):
+            remote.send(('seed', seed))
+        for remote in self.remotes:
+            remote.recv()
+
     def close_extras(self):
         self.closed = True
         if self.waiting:
@@ -83,6 +83,13 @@ class VecEnv(ABC):
         """
         pass
 
+    def seed(self, seeds):
+        """
+        Seed each environment, `seeds` has one seed per environment. Takes
+        effect from the next reset.
+        """
+        raise NotImplementedError
+
     def close_extras(self):
         """
         Clean up the  extra resources, beyond what's in this base class.
@@ -172,6 +179,9 @@ class VecEnvWrapper(VecEnv):
     def close(self):
         return self.venv.close()
 
+    def seed(self, seeds):
+        return self.venv.seed(seeds)
+
     def render(self, mode="human", **kwargs):
         return self.venv.render(mode=mode, **kwargs)
 
@@ -193,6 +203,21 @@ class VecEnvObservationWrapper(VecEnvWrapper):
         return self.process(obs), rews, dones, infos
 
 
+def seed_env(env, seed):
+    """
+    Seeds a single environment and its action space.
+    """
+    if hasattr(env.action_space, "seed"):
+        env.action_space.seed(seed)
+    try:
+        env.seed(seed)
+    except AttributeError:
+        # Newer gym versions only seed through reset.
+        from gym.utils import seeding
+
+        env.unwrapped.np_random, _ = seeding.np_random(seed)
+
+
 class CloudpickleWrapper(object):
     """
     Uses cloudpickle to serialize contents (otherwise multiprocessing tries to use pickle)
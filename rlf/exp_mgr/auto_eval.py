@@ -7,11 +7,15 @@ import wandb
 from rlf.exp_mgr import config_mgr
 from rlf.rl.utils import CacheHelper
 import rlf.rl.utils as rutils
+from rlf.rl.checkpointer import list_checkpoints
 from rlf.run_settings import RunSettings
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing as mp
 import os.path as osp
 import os
 import numpy as np
+import torch
 
 
 def convert_to_prefix(run_names, info):
@@ -53,7 +57,11 @@ def eval_from_file(plot_cfg_path, load_dir, get_run_settings, args):
 
     full_load_name = osp.join(load_dir, 'data/trained_models')
     full_log_name = osp.join(load_dir, 'data/log')
-    method_names = defaultdict(list)
+    evaluator = BatchEvaluator(get_run_settings, args.num_eval,
+            num_workers=args.num_workers, eval_num_procs=args.eval_num_procs,
+            override=args.override, table_only=args.table_only,
+            population=args.population)
+    run_infos = []
     for name, method_name, env_name, info in all_run_names:
         model_dir = osp.join(full_load_name, env_name, name)
         cmd_path = osp.join(full_log_name, env_name, name)
@@ -64,53 +72,182 @@ def eval_from_file(plot_cfg_path, load_dir, get_run_settings, args):
         if not osp.exists(cmd_path):
             raise ValueError(f"Model {cmd_path} does not exist")
 
-        model_nums = [int(x.split('_')[1].split('.')[0]) for x in os.listdir(model_dir) if 'model_' in x]
-        if len(model_nums) == 0:
+        use_models = list_checkpoints(model_dir)
+        if len(use_models) == 0:
             raise ValueError(f"Model {model_dir} is empty", info)
 
-        max_idx = max(model_nums)
-        use_model = osp.join(model_dir, f"model_{max_idx}.pt")
+        if not args.all_ckpts:
+            use_models = use_models[-1:]
 
         with open(osp.join(cmd_path,'cmd.txt'), 'r') as f:
             cmd = f.read()
 
-        method_names[method_name].append((use_model, cmd, env_name, info))
+        for use_model in use_models:
+            evaluator.add(cmd, use_model)
+        # The table uses the latest checkpoint.
+        run_infos.append((method_name, use_models[-1], info))
+
+    results = evaluator.run()
 
     env_results = defaultdict(lambda: defaultdict(list))
-    NUM_PROCS = 20
-
-    total_count = sum([len(x) for x in method_names.values()])
-
-    done_count = 0
-    for method_name, runs in method_names.items():
-        for use_model, cmd, env_name, info in runs:
-            print(f"({done_count}/{total_count})")
-            done_count += 1
-            cache_result = CacheHelper(f"result_{method_name}_{use_model.replace('/', '_')}_{args.num_eval}", cmd)
-            if cache_result.exists() and not args.override:
-                eval_result = cache_result.load()
-            else:
-                if args.table_only and not args.override:
-                    break
-                cmd = cmd.split(' ')[2:]
-                cmd.append('--no-wb')
-                cmd.append('--eval-only')
-                cmd.extend(['--cuda', 'False'])
-                cmd.extend(['--num-render', '0'])
-                cmd.extend(['--eval-num-processes', str(NUM_PROCS)])
-                cmd.extend(["--num-eval", f"{args.num_eval // NUM_PROCS}"])
-                cmd.extend(["--load-file", use_model])
-                run_settings = get_run_settings(cmd)
-                run_settings.setup()
-                eval_result = run_settings.eval_result
-                cache_result.save(eval_result)
-            store_num = eval_result[args.get_key]
-            env_results[info['report_name']][method_name].append(store_num)
-            rutils.pstart_sep()
-            print(f"Result for {use_model}: {store_num}")
-            rutils.pend_sep()
+    for method_name, use_model, info in run_infos:
+        if use_model not in results:
+            continue
+        store_num = results[use_model][args.get_key]
+        env_results[info['report_name']][method_name].append(store_num)
     print(generate_eval_table(env_results, scale_factor, rename_sections))
 
+
+def _get_file_key(path):
+    """
+    Identifies the contents of a checkpoint without reading it.
+    """
+    stat = os.stat(path)
+    return (osp.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+# Set in each worker by `_init_worker`. The function is inherited by the
+# forked workers rather than pickled, so it can be any callable.
+_worker_get_run_settings = None
+
+
+def _init_worker(get_run_settings):
+    global _worker_get_run_settings
+    _worker_get_run_settings = get_run_settings
+
+
+def _eval_ckpt_group(cmd, use_models, population):
+    """
+    Evaluates checkpoints that share the same run command with one runner so
+    the environments are only created once.
+    :param population: Evaluate all the checkpoints at once in one set of
+        environments.
+    """
+    # Leave the cores to the other workers.
+    torch.set_num_threads(1)
+    run_settings = _worker_get_run_settings([*cmd, '--load-file',
+        use_models[0]])
+    runner = run_settings.create_runner()
+    results = []
+    try:
+        if population:
+            return runner.population_eval(use_models)
+        for i, use_model in enumerate(use_models):
+            if i > 0:
+                runner.checkpointer.load_file = use_model
+                runner.checkpointer.load()
+            runner.load_from_checkpoint()
+            results.append(runner.full_eval(run_settings.create_traj_saver))
+    finally:
+        runner.close()
+    return results
+
+
+class BatchEvaluator:
+    """
+    Evaluates many checkpoints in a pool of local processes. Checkpoints
+    trained with the same command are evaluated by the same worker which
+    reuses its environments between them. Runs that only differ in their seed
+    have different commands, so they do not share environments. The policy
+    settings may also differ between commands. Results are cached by the
+    command, the number of evaluation episodes and processes, whether it was
+    a population evaluation and the path, size and modification time of the
+    checkpoint file, so a checkpoint is never evaluated twice.
+    """
+
+    def __init__(self, get_run_settings, num_eval, num_workers=None,
+            eval_num_procs=1, override=False, table_only=False,
+            population=False):
+        """
+        :param num_eval: The total number of evaluation episodes.
+        :param num_workers: Number of processes, the # of cores if None.
+        :param eval_num_procs: Number of environment processes per worker.
+        :param table_only: Only return cached results.
+        :param population: Evaluate the checkpoints of a worker together as a
+            population of policies in one set of environments.
+        """
+        self.get_run_settings = get_run_settings
+        self.num_eval = num_eval
+        if num_workers is None:
+            num_workers = max(os.cpu_count() // eval_num_procs, 1)
+        self.num_workers = num_workers
+        self.eval_num_procs = eval_num_procs
+        self.override = override
+        self.table_only = table_only
+        self.population = population
+        self._jobs = []
+
+    def add(self, cmd, use_model):
+        """
+        :param cmd: The command the checkpoint was trained with.
+        """
+        self._jobs.append((cmd, use_model))
+
+    def _get_eval_cmd(self, cmd):
+        cmd = cmd.split(' ')[2:]
+        cmd.append('--no-wb')
+        cmd.append('--eval-only')
+        cmd.extend(['--cuda', 'False'])
+        cmd.extend(['--num-render', '0'])
+        # Replaces the process count of training so workers stay within the
+        # cores they were sized for.
+        cmd.extend(['--num-processes', str(self.eval_num_procs)])
+        cmd.extend(['--eval-num-processes', str(self.eval_num_procs)])
+        cmd.extend(['--num-eval', str(max(self.num_eval // self.eval_num_procs, 1))])
+        return cmd
+
+    def _print_result(self, use_model, eval_result):
+        rutils.pstart_sep()
+        print(f"Result for {use_model}: {eval_result}")
+        rutils.pend_sep()
+
+    def run(self):
+        """
+        :returns: The evaluation result of each checkpoint path.
+        """
+        results = {}
+        caches = {}
+        groups = defaultdict(list)
+        for cmd, use_model in self._jobs:
+            cache = CacheHelper('result',
+                    (cmd, _get_file_key(use_model), self.num_eval,
+                        self.eval_num_procs, self.population))
+            if cache.exists() and not self.override:
+                results[use_model] = cache.load()
+                self._print_result(use_model, results[use_model])
+            elif not self.table_only:
+                caches[use_model] = cache
+                groups[cmd].append(use_model)
+
+        # Split the groups so every worker has work.
+        max_group_size = int(np.ceil(len(caches) / self.num_workers)) if len(caches) > 0 else 1
+        tasks = []
+        for cmd, use_models in groups.items():
+            for i in range(0, len(use_models), max_group_size):
+                tasks.append((cmd, use_models[i:i + max_group_size]))
+
+        print(f"Evaluating {len(caches)} checkpoints ({len(results)} cached) with {self.num_workers} workers")
+        done_count = 0
+        # Forked workers are not daemonic, so they can start environment
+        # processes. The arguments of the initializer are not pickled with
+        # fork, so `get_run_settings` can be a lambda.
+        with ProcessPoolExecutor(self.num_workers,
+                mp_context=mp.get_context('fork'), initializer=_init_worker,
+                initargs=(self.get_run_settings,)) as executor:
+            futures = {
+                    executor.submit(_eval_ckpt_group,
+                        self._get_eval_cmd(cmd), use_models,
+                        self.population): use_models
+                    for cmd, use_models in tasks}
+            for future in as_completed(futures):
+                for use_model, eval_result in zip(futures[future], future.result()):
+                    caches[use_model].save(eval_result)
+                    results[use_model] = eval_result
+                    done_count += 1
+                    print(f"({done_count}/{len(caches)})")
+                    self._print_result(use_model, eval_result)
+        return results
+
 def generate_eval_table(env_results, scale_factor, rename_sections):
     methods = None
     disp_str = ""
@@ -142,6 +279,15 @@ def get_arg_parser():
     parser.add_argument('--get-key', type=str, required=True)
     parser.add_argument('--override', action='store_true')
     parser.add_argument('--table-only', action='store_true')
+    parser.add_argument('--all-ckpts', action='store_true',
+            help='Evaluate every checkpoint, not just the latest')
+    parser.add_argument('--num-workers', type=int, default=None,
+            help='# of evaluation processes, by default the # of cores')
+    parser.add_argument('--eval-num-procs', type=int, default=1,
+            help='# of environment processes for each evaluation process')
+    parser.add_argument('--population', action='store_true',
+            help="""Evaluate the checkpoints of a run together, with their
+            stacked weights controlling slices of one set of environments""")
     return parser
 
 def full_auto_eval(get_run_settings):
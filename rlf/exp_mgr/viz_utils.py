@@ -3,6 +3,8 @@ Utilities for manipulating images, rendering images, and rendering videos.
 """
 import os
 import os.path as osp
+import queue
+import threading
 from argparse import Namespace
 from typing import Dict, List, Optional, Tuple, Union
 
@@ -80,31 +82,128 @@ def save_agent_obs(frames, imdim, vid_dir, name):
     print(f"Wrote observation sequence to {use_dir}")
 
 
-def save_mp4(frames, vid_dir, name, fps=60.0, no_frame_drop=False, should_print=True):
-    frames = np.array(frames)
-    if len(frames[0].shape) == 4:
-        new_frames = frames[0]
-        for i in range(len(frames) - 1):
-            new_frames = np.concatenate([new_frames, frames[i + 1]])
-        frames = new_frames
-
-    if not osp.exists(vid_dir):
-        os.makedirs(vid_dir)
-
-    vid_file = osp.join(vid_dir, name + ".mp4")
-    if osp.exists(vid_file):
-        os.remove(vid_file)
-
-    w, h = frames[0].shape[:-1]
-    videodims = (h, w)
-    fourcc = cv2.VideoWriter_fourcc("m", "p", "4", "v")
-    video = cv2.VideoWriter(vid_file, fourcc, fps, videodims)
+def _iter_frames(frames):
+    """
+    Yields single frames from a sequence of frames or of batches of frames.
+    """
     for frame in frames:
-        frame = frame[..., 0:3][..., ::-1]
-        video.write(frame)
-    video.release()
-    if should_print:
-        print(f"Rendered to {vid_file}")
+        frame = np.asarray(frame)
+        if len(frame.shape) == 4:
+            yield from frame
+        else:
+            yield frame
+
+
+class AsyncVideoWriter:
+    """
+    Encodes an mp4 incrementally in a background thread. Frames are passed
+    through a bounded queue so at most `queue_size` frames are held in
+    memory, and `add_frames` only blocks if the encoder falls behind. The
+    thread and the file are only created once the first frame is added.
+    """
+
+    def __init__(
+        self,
+        vid_dir: str,
+        name: str,
+        fps: float = 60.0,
+        queue_size: int = 64,
+        scale: float = 1.0,
+        frame_skip: int = 1,
+        should_print: bool = True,
+    ):
+        """
+        :param scale: Factor to resize the frames by before encoding.
+        :param frame_skip: Only every `frame_skip` frame is written. The video
+            still plays at `fps`.
+        """
+        self.vid_file = osp.join(vid_dir, name + ".mp4")
+        self._fps = fps
+        self._scale = scale
+        self._frame_skip = frame_skip
+        self._should_print = should_print
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._error = None
+        self._num_added = 0
+        self.num_written = 0
+
+    def _start(self) -> None:
+        vid_dir = osp.dirname(self.vid_file)
+        if not osp.exists(vid_dir):
+            os.makedirs(vid_dir)
+        if osp.exists(self.vid_file):
+            os.remove(self.vid_file)
+        self._thread = threading.Thread(target=self._encode, daemon=True)
+        self._thread.start()
+
+    def _encode(self) -> None:
+        video = None
+        try:
+            while True:
+                frame = self._queue.get()
+                if frame is None:
+                    break
+                if self._scale != 1.0:
+                    frame = cv2.resize(
+                        frame,
+                        None,
+                        fx=self._scale,
+                        fy=self._scale,
+                        interpolation=cv2.INTER_AREA,
+                    )
+                if video is None:
+                    h, w = frame.shape[:2]
+                    fourcc = cv2.VideoWriter_fourcc("m", "p", "4", "v")
+                    video = cv2.VideoWriter(self.vid_file, fourcc, self._fps, (w, h))
+                video.write(np.ascontiguousarray(frame[..., 0:3][..., ::-1]))
+                self.num_written += 1
+        except Exception as e:
+            self._error = e
+            # Keep consuming so the producer is never blocked.
+            while self._queue.get() is not None:
+                pass
+        finally:
+            if video is not None:
+                video.release()
+
+    def _check_error(self) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"Failed to encode {self.vid_file}") from self._error
+
+    def add_frames(self, frames) -> None:
+        """
+        :param frames: A list of frames or of batches of frames. The frames
+            must not be modified after they are added.
+        """
+        self._check_error()
+        for frame in _iter_frames(frames):
+            if self._num_added % self._frame_skip == 0:
+                if self._thread is None:
+                    self._start()
+                self._queue.put(frame)
+            self._num_added += 1
+
+    def close(self) -> Optional[str]:
+        """
+        Waits for all added frames to be encoded.
+        :returns: The video file, or None if no frames were added.
+        """
+        if self._thread is None:
+            return None
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._check_error()
+        if self._should_print:
+            print(f"Rendered to {self.vid_file}")
+        return self.vid_file
+
+
+def save_mp4(frames, vid_dir, name, fps=60.0, no_frame_drop=False, should_print=True):
+    writer = AsyncVideoWriter(vid_dir, name, fps=fps, should_print=should_print)
+    writer.add_frames(frames)
+    writer.close()
 
 
 def plot_traj_data(
@@ -1,4 +1,4 @@
-from rlf.il.il_dataset import ImitationLearningDataset
+from rlf.il.il_dataset import BatchIndexSampler, ImitationLearningDataset
 from rlf.il.traj_dataset import TrajDataset
 from rlf.il.traj_mgr import GoalTrajSaver, TrajSaver
 from rlf.il.transition_dataset import TransitionDataset
@@ -1,22 +1,20 @@
 from abc import ABC, abstractmethod
-from typing import Callable, Dict
+from typing import Callable, Dict, Iterator
 
 import torch
 import torch.utils.data
+from rlf.il.lazy_demos import LazyDemoField
+from torch.utils.data.dataloader import default_collate
 
 
 def convert_to_tensors(trajs):
-    if not isinstance(trajs["obs"], dict) and not isinstance(
-        trajs["obs"], torch.Tensor
-    ):
+    if not isinstance(trajs["obs"], (dict, torch.Tensor, LazyDemoField)):
         trajs["obs"] = torch.tensor(trajs["obs"])
     if not isinstance(trajs["done"], torch.Tensor):
         trajs["done"] = torch.tensor(trajs["done"])
     if not isinstance(trajs["actions"], torch.Tensor):
         trajs["actions"] = torch.tensor(trajs["actions"])
-    if not isinstance(trajs["next_obs"], dict) and not isinstance(
-        trajs["next_obs"], torch.Tensor
-    ):
+    if not isinstance(trajs["next_obs"], (dict, torch.Tensor, LazyDemoField)):
         trajs["next_obs"] = torch.tensor(trajs["next_obs"])
     return trajs
 
@@ -31,6 +29,9 @@ class ImitationLearningDataset(torch.utils.data.Dataset, ABC):
         'actions': torch.tensor
         }
         All tensors should be exactly the same length.
+
+    For datasets too large to load in memory, convert the file to the memory
+    mapped format in `rlf/il/lazy_demos.py` and pass the directory instead.
     """
 
     def __init__(
@@ -47,6 +48,17 @@ class ImitationLearningDataset(torch.utils.data.Dataset, ABC):
     def get_add_data_loader_kwargs(self):
         return {}
 
+    def get_batch(self, idxs: torch.Tensor) -> Dict[str, torch.Tensor]:
+        """
+        Returns the collated items at `idxs`. This default fetches the items
+        one at a time, datasets holding their data as tensors should override
+        this to gather each field in one op.
+        """
+        collate_fn = self.get_add_data_loader_kwargs().get(
+            "collate_fn", default_collate
+        )
+        return collate_fn([self[i] for i in idxs.tolist()])
+
     def viz(self, args):
         pass
 
@@ -67,3 +79,63 @@ class ImitationLearningDataset(torch.utils.data.Dataset, ABC):
 
     def to(self, device):
         return self
+
+
+class BatchIndexSampler:
+    """
+    Replacement for a shuffling `torch.utils.data.DataLoader` over an
+    `ImitationLearningDataset`. Each batch is a tensor of indices passed to
+    `get_batch` of the dataset, so there is no per item Python overhead.
+    Iterating gives one epoch over the data and every new iterator
+    reshuffles, like the `DataLoader` it replaces.
+    """
+
+    def __init__(
+        self,
+        dataset: torch.utils.data.Dataset,
+        batch_size: int,
+        shuffle: bool = True,
+        drop_last: bool = True,
+        device=None,
+    ):
+        """
+        :param dataset: The `ImitationLearningDataset` or a (possibly nested)
+            `torch.utils.data.Subset` of one.
+        :param device: Where the indices are sampled. Should be the device of
+            the dataset.
+        """
+        idxs = torch.arange(len(dataset), device=device)
+        # Map the subset indices back to the underlying dataset.
+        while isinstance(dataset, torch.utils.data.Subset):
+            idxs = torch.as_tensor(dataset.indices, device=device)[idxs]
+            dataset = dataset.dataset
+
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.idxs = idxs
+        self._extra_fields = {}
+
+    def set_extra_field(self, name: str, values: torch.Tensor) -> None:
+        """
+        Adds `values[idxs]` under `name` to every batch. `values` is indexed
+        by the items of `self.dataset`, so the indices in `self.idxs`.
+        """
+        self._extra_fields[name] = values
+
+    def __len__(self) -> int:
+        if self.drop_last:
+            return len(self.idxs) // self.batch_size
+        return (len(self.idxs) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self) -> Iterator[Dict[str, torch.Tensor]]:
+        idxs = self.idxs
+        if self.shuffle:
+            idxs = idxs[torch.randperm(len(idxs), device=idxs.device)]
+        for i in range(len(self)):
+            batch_idxs = idxs[i * self.batch_size : (i + 1) * self.batch_size]
+            batch = self.dataset.get_batch(batch_idxs)
+            for k, values in self._extra_fields.items():
+                batch[k] = values[batch_idxs]
+            yield batch
@@ -0,0 +1,343 @@
+"""
+On disk demonstration format that is opened with `mmap` so the observations
+are only read and converted to tensors one batch at a time. This is for
+expert datasets, such as image demonstrations, that do not fit in memory.
+
+A demonstration directory contains:
+- `index.json`: The number of chunks and episodes, if `next_obs` is shared
+  with `obs` and the names of any extra per transition info fields.
+- `episodes.npy`: Episode `i` is transitions `episodes[i]` to
+  `episodes[i + 1]`.
+- `{field}_{chunk}.npy`: For each of `obs`, `actions` and `done`, and also
+  `next_obs` if it is not shared. Each chunk holds whole episodes. Info
+  fields missing from a chunk are read as zeros.
+
+When `next_obs` is shared, each episode stores its observations followed by
+the final next observation, so the next observation of a transition is just
+the row after its observation.
+
+Convert an existing `.pt` or `.npz` demonstration file with:
+```
+python -m rlf.il.lazy_demos --load-path trajs.pt --save-dir trajs_lazy
+```
+"""
+import argparse
+import json
+import os
+import os.path as osp
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+INDEX_NAME = "index.json"
+EPISODES_NAME = "episodes.npy"
+
+
+def is_lazy_demo_dir(load_path: str) -> bool:
+    return osp.isfile(osp.join(load_path, INDEX_NAME))
+
+
+class LazyDemoField:
+    """
+    A read only, per transition view of an observation field stored in
+    memory mapped `.npy` chunks. Indexing reads only the selected rows and
+    returns a float tensor on the device of the field. Only indexing is
+    supported, the full field is never loaded.
+    """
+
+    def __init__(
+        self, chunks: List[np.ndarray], rows: torch.Tensor, device="cpu"
+    ) -> None:
+        """
+        :param chunks: Memory mapped arrays, the global rows are the
+            concatenation of these.
+        :param rows: The global row of each transition.
+        """
+        self._chunks = chunks
+        self._chunk_starts = np.cumsum([0] + [len(c) for c in chunks])
+        self._rows = rows
+        self.device = device
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return (len(self._rows), *self._chunks[0].shape[1:])
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def float(self) -> "LazyDemoField":
+        # Rows are always converted to floats when read.
+        return self
+
+    def to(self, device) -> "LazyDemoField":
+        return LazyDemoField(self._chunks, self._rows, device)
+
+    def _read(self, rows: np.ndarray) -> np.ndarray:
+        chunk_ids = np.searchsorted(self._chunk_starts, rows, side="right") - 1
+        out = np.empty(
+            (len(rows), *self._chunks[0].shape[1:]), dtype=self._chunks[0].dtype
+        )
+        for c in np.unique(chunk_ids):
+            sel = chunk_ids == c
+            out[sel] = self._chunks[c][rows[sel] - self._chunk_starts[c]]
+        return out
+
+    def __getitem__(self, idx) -> torch.Tensor:
+        if isinstance(idx, torch.Tensor):
+            idx = idx.cpu()
+        rows = self._rows[idx]
+        data = self._read(rows.view(-1).numpy())
+        data = data.reshape(*rows.shape, *data.shape[1:])
+        return torch.from_numpy(data).to(self.device, torch.float32)
+
+    def mean_std(self, chunk_size: int = 4096) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Same as `torch.mean` and `torch.std` over the first dimension but only
+        reads `chunk_size` transitions at a time.
+        """
+        total = 0.0
+        total_sq = 0.0
+        for i in range(0, len(self), chunk_size):
+            x = self._read(self._rows[i : i + chunk_size].numpy()).astype(np.float64)
+            total = total + x.sum(0)
+            total_sq = total_sq + np.square(x).sum(0)
+        n = len(self)
+        mean = total / n
+        var = np.maximum(total_sq - n * np.square(mean), 0.0) / max(n - 1, 1)
+        return (
+            torch.tensor(mean, dtype=torch.float32, device=self.device),
+            torch.tensor(np.sqrt(var), dtype=torch.float32, device=self.device),
+        )
+
+
+def _get_episode_ends(done: np.ndarray) -> np.ndarray:
+    ends = np.nonzero(done.reshape(len(done), -1)[:, 0])[0] + 1
+    if len(ends) == 0 or ends[-1] != len(done):
+        raise ValueError("Trajectory from dataset does not end in termination")
+    return ends
+
+
+def _is_next_obs_shared(
+    obs: np.ndarray, next_obs: np.ndarray, ends: np.ndarray
+) -> bool:
+    """
+    Checks if `next_obs` is the next `obs` everywhere except at the episode
+    ends.
+    """
+    not_end = np.ones(len(obs) - 1, dtype=bool)
+    not_end[ends[:-1] - 1] = False
+    return np.array_equal(obs[1:][not_end], next_obs[:-1][not_end])
+
+
+class LazyDemoWriter:
+    """
+    Writes demonstrations to the lazy format one chunk of whole episodes at a
+    time. The index is atomically rewritten after every chunk so the
+    directory is always loadable, even if the writer is interrupted.
+    """
+
+    def __init__(
+        self,
+        save_dir: str,
+        share_next_obs: Optional[bool] = True,
+        append: bool = False,
+    ):
+        """
+        :param share_next_obs: If None, storage is shared if `next_obs` is the
+            following `obs` in the first chunk.
+        :param append: Add the chunks to the demonstrations already in
+            `save_dir` rather than overwriting them.
+        """
+        self.save_dir = save_dir
+        self.share_next_obs = share_next_obs
+        self._num_chunks = 0
+        self._episodes = [0]
+        self._info_fields = []
+        if append and is_lazy_demo_dir(save_dir):
+            index = _load_index(save_dir)
+            share = index["share_next_obs"]
+            if share_next_obs is not None and share_next_obs != share:
+                raise ValueError(
+                    f"Cannot append to {save_dir}, it has share_next_obs={share}"
+                )
+            self.share_next_obs = share
+            self._num_chunks = index["num_chunks"]
+            self._episodes = _load_episodes(save_dir, index).tolist()
+            self._info_fields = index["info_fields"]
+        if not osp.exists(save_dir):
+            os.makedirs(save_dir)
+
+    @property
+    def num_transitions(self) -> int:
+        return self._episodes[-1]
+
+    def _save_field(self, name: str, x: np.ndarray) -> None:
+        np.save(osp.join(self.save_dir, f"{name}_{self._num_chunks}.npy"), x)
+
+    def add_chunk(
+        self,
+        obs: np.ndarray,
+        next_obs: np.ndarray,
+        actions: np.ndarray,
+        done: np.ndarray,
+        infos: Optional[Dict[str, np.ndarray]] = None,
+    ) -> None:
+        """
+        :param infos: Extra per transition fields, such as episode statistics.
+        """
+        ends = _get_episode_ends(done)
+        if self.share_next_obs is None:
+            self.share_next_obs = _is_next_obs_shared(obs, next_obs, ends)
+        if self.share_next_obs:
+            if not _is_next_obs_shared(obs, next_obs, ends):
+                raise ValueError(
+                    "next_obs is not the following obs, cannot share storage"
+                )
+            # Insert the final next observation after each episode.
+            ep_ids = np.repeat(np.arange(len(ends)), np.diff(ends, prepend=0))
+            rows = np.arange(len(obs)) + ep_ids
+            store_obs = np.empty((len(obs) + len(ends), *obs.shape[1:]), obs.dtype)
+            store_obs[rows] = obs
+            store_obs[ends + np.arange(len(ends))] = next_obs[ends - 1]
+            self._save_field("obs", store_obs)
+        else:
+            self._save_field("obs", obs)
+            self._save_field("next_obs", next_obs)
+        self._save_field("actions", actions)
+        self._save_field("done", done)
+        if infos is not None:
+            for k, v in infos.items():
+                self._save_field(f"info_{k}", v)
+                if k not in self._info_fields:
+                    self._info_fields.append(k)
+
+        self._episodes.extend((self._episodes[-1] + ends).tolist())
+        self._num_chunks += 1
+        # Write to temporary files first so an interruption never leaves a
+        # partially written index.
+        episodes_path = osp.join(self.save_dir, EPISODES_NAME)
+        np.save(episodes_path + ".tmp.npy", np.array(self._episodes))
+        os.replace(episodes_path + ".tmp.npy", episodes_path)
+        index_path = osp.join(self.save_dir, INDEX_NAME)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump(
+                {
+                    "num_chunks": self._num_chunks,
+                    "num_episodes": len(self._episodes) - 1,
+                    "share_next_obs": self.share_next_obs,
+                    "info_fields": self._info_fields,
+                },
+                f,
+            )
+        os.replace(index_path + ".tmp", index_path)
+
+
+def _load_index(load_dir: str) -> Dict:
+    with open(osp.join(load_dir, INDEX_NAME), "r") as f:
+        index = json.load(f)
+    index.setdefault("info_fields", [])
+    return index
+
+
+def _load_episodes(load_dir: str, index: Dict) -> np.ndarray:
+    episodes = np.load(osp.join(load_dir, EPISODES_NAME))
+    if "num_episodes" in index:
+        # The episodes are written before the index, so there may be episodes
+        # from a chunk the index does not include yet.
+        episodes = episodes[: index["num_episodes"] + 1]
+    return episodes
+
+
+def load_lazy_demos(load_dir: str) -> Dict[str, object]:
+    """
+    Opens a lazy demonstration directory. The observations are returned as
+    `LazyDemoField` while the actions, dones and info fields are loaded in
+    memory.
+    """
+    index = _load_index(load_dir)
+    episodes = torch.as_tensor(_load_episodes(load_dir, index))
+
+    def load_chunks(name, mmap_mode="r"):
+        return [
+            np.load(osp.join(load_dir, f"{name}_{i}.npy"), mmap_mode=mmap_mode)
+            for i in range(index["num_chunks"])
+        ]
+
+    num_trans = int(episodes[-1])
+    rows = torch.arange(num_trans)
+    obs_chunks = load_chunks("obs")
+    if index["share_next_obs"]:
+        lens = episodes[1:] - episodes[:-1]
+        rows = rows + torch.repeat_interleave(torch.arange(len(lens)), lens)
+        obs = LazyDemoField(obs_chunks, rows)
+        next_obs = LazyDemoField(obs_chunks, rows + 1)
+    else:
+        obs = LazyDemoField(obs_chunks, rows)
+        next_obs = LazyDemoField(load_chunks("next_obs"), rows)
+
+    done_chunks = load_chunks("done", None)
+    infos = {}
+    for k in index["info_fields"]:
+        info_chunks = []
+        for i, done_chunk in enumerate(done_chunks):
+            info_path = osp.join(load_dir, f"info_{k}_{i}.npy")
+            if osp.exists(info_path):
+                info_chunks.append(np.load(info_path))
+            else:
+                info_chunks.append(np.zeros(len(done_chunk), dtype=np.float32))
+        infos[k] = torch.as_tensor(np.concatenate(info_chunks))
+
+    return {
+        "obs": obs,
+        "next_obs": next_obs,
+        "actions": torch.as_tensor(np.concatenate(load_chunks("actions", None))),
+        "done": torch.as_tensor(np.concatenate(done_chunks)),
+        **infos,
+    }
+
+
+def convert_to_lazy_demos(
+    load_path: str, save_dir: str, episodes_per_chunk: int = 100
+) -> None:
+    """
+    Converts a `.pt` or `.npz` demonstration file to the lazy format.
+    Fields other than the observations, actions and dones are not kept.
+    """
+    from rlf.il.transition_dataset import TransitionDataset
+
+    if load_path.endswith(".npz"):
+        trajs = TransitionDataset._load_npz(load_path)
+    else:
+        trajs = TransitionDataset._load_pt(load_path)
+
+    def to_np(x):
+        if isinstance(x, torch.Tensor):
+            return x.cpu().numpy()
+        return np.asarray(x)
+
+    obs, next_obs, actions, done = [
+        to_np(trajs[k]) for k in ["obs", "next_obs", "actions", "done"]
+    ]
+    ends = _get_episode_ends(done)
+    writer = LazyDemoWriter(save_dir, _is_next_obs_shared(obs, next_obs, ends))
+    starts = np.concatenate([[0], ends])
+    for i in range(0, len(ends), episodes_per_chunk):
+        start = starts[i]
+        end = ends[min(i + episodes_per_chunk, len(ends)) - 1]
+        writer.add_chunk(
+            obs[start:end], next_obs[start:end], actions[start:end], done[start:end]
+        )
+    print(
+        f"Converted {len(ends)} episodes to {save_dir} "
+        f"(shared next_obs: {writer.share_next_obs})"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--load-path", type=str, required=True)
+    parser.add_argument("--save-dir", type=str, required=True)
+    parser.add_argument("--episodes-per-chunk", type=int, default=100)
+    args = parser.parse_args()
+    convert_to_lazy_demos(args.load_path, args.save_dir, args.episodes_per_chunk)
@@ -20,7 +20,8 @@ class TrajDataset(TransitionDataset):
         override_data=None,
     ):
         super().__init__(load_path, transform_dem_dataset_fn, override_data)
-        self.trajs = self.group_into_trajs()
+        # Trajectories are ranges of the flat tensors in `self.trajs`.
+        self.get_traj_offsets()
 
     def get_add_data_loader_kwargs(self):
         """
@@ -38,7 +39,8 @@ class TrajDataset(TransitionDataset):
     def viz(self, args):
         import seaborn as sns
 
-        traj_lens = [len(t) for t in self.trajs]
+        offsets = self.get_traj_offsets()
+        traj_lens = (offsets[1:] - offsets[:-1]).tolist()
         if len(traj_lens) == 0 or np.var(traj_lens) == 0:
             return
         p = sns.distplot(traj_lens)
@@ -48,8 +50,8 @@ class TrajDataset(TransitionDataset):
         print(f"Saved expert data visualization to {save_path}")
 
     def compute_split(self, traj_frac, rnd_seed):
-        use_count = int(len(self.trajs) * traj_frac)
-        idxs = np.arange(len(self.trajs))
+        use_count = int(len(self) * traj_frac)
+        idxs = np.arange(len(self))
 
         rng = np.random.default_rng(rnd_seed)
         rng.shuffle(idxs)
@@ -57,21 +59,22 @@ class TrajDataset(TransitionDataset):
 
         return torch.utils.data.Subset(self, idxs)
 
-    def to(self, device):
-        for i, traj in enumerate(self.trajs):
-            self.trajs[i] = [t.to(device) for t in traj]
-        return self
-
     def __getitem__(self, i):
+        offsets = self.get_traj_offsets()
+        start, end = int(offsets[i]), int(offsets[i + 1])
         return {
-            "state": torch.stack([t.obs for t in self.trajs[i]]),
-            "next_state": torch.stack([t.next_obs for t in self.trajs[i]]),
-            "done": torch.stack([t.done for t in self.trajs[i]]),
-            "actions": torch.stack([t.action for t in self.trajs[i]]),
+            "state": self.trajs["obs"][start:end],
+            "next_state": self.trajs["next_obs"][start:end],
+            "done": self.trajs["done"][start:end],
+            "actions": self.trajs["actions"][start:end],
         }
 
+    def get_batch(self, idxs):
+        # Same as concatenating the trajectories at `idxs`.
+        return TransitionDataset.__getitem__(self, self.get_traj_trans_idxs(idxs))
+
     def __len__(self):
-        return len(self.trajs)
+        return len(self.get_traj_offsets()) - 1
 
     def get_num_trajs(self):
-        return len(self.trajs)
+        return len(self)
@@ -1,10 +1,12 @@
 import os
 import os.path as osp
 from collections import defaultdict
+from typing import Optional
 
 import numpy as np
 import rlf.rl.utils as rutils
 import torch
+from rlf.il.lazy_demos import LazyDemoWriter
 
 
 def decode_gw_state(state):
@@ -25,9 +27,26 @@ class TrajSaver(object):
     A helper class to accumulate and save transition pairs. Note that obs
     refers to RAW observations not normalized observations. This to preserve
     any observation information for a downstream task.
+
+    If `chunk_size` is set, completed trajectories are streamed to a lazy
+    demonstration directory (see `rlf/il/lazy_demos.py`) every `chunk_size`
+    transitions rather than held in memory until `save`. This is loaded by
+    `TransitionDataset` without concatenating the observations.
     """
 
-    def __init__(self, save_dir, is_stochastic_policy=False):
+    def __init__(
+        self,
+        save_dir,
+        is_stochastic_policy=False,
+        chunk_size: Optional[int] = None,
+        append: bool = False,
+    ):
+        """
+        :param chunk_size: Minimum number of transitions in each streamed
+            chunk. Only whole trajectories are written.
+        :param append: When streaming, add to the trajectories already saved
+            in the directory instead of overwriting them.
+        """
         self.save_dir = save_dir
         self.all_obs = []
         self.all_next_obs = []
@@ -44,6 +63,16 @@ class TrajSaver(object):
         if not osp.exists(self.save_dir):
             os.makedirs(self.save_dir)
 
+        self._chunk_size = chunk_size
+        self._writer = None
+        if chunk_size is not None:
+            self.save_name = f"trajs{add_txt}"
+            self._writer = LazyDemoWriter(
+                osp.join(self.save_dir, self.save_name),
+                share_next_obs=None,
+                append=append,
+            )
+
     def should_save_traj(self, traj):
         """
         Can override in child class to filter some trajectories from being
@@ -58,6 +87,8 @@ class TrajSaver(object):
         self.all_done.extend(done)
         self.all_actions.extend(action)
         self.all_info.extend(info)
+        if self._writer is not None and len(self.all_done) >= self._chunk_size:
+            self._write_chunk()
 
     def collect(self, obs, next_obs, done, action, info):
         """
@@ -91,10 +122,9 @@ class TrajSaver(object):
                 self.traj_buffer[i] = []
         return num_done
 
-    def save(self):
+    def _get_save_data(self):
         """
-        Saves all observations, actions, and masks from trajectories. Saves all
-        data in info starting with key `ep_`.
+        Stacks the collected transitions into CPU tensors.
         """
         info_tensors = defaultdict(lambda: torch.zeros(len(self.all_info)))
 
@@ -129,6 +159,51 @@ class TrajSaver(object):
             torch.tensor(np.array(self.all_done).astype(np.float32)).cpu().detach()
         )
         save_actions = torch.stack(self.all_actions).cpu().detach()
+        return save_obs, save_next_obs, save_done, save_actions, dict(info_tensors)
+
+    def _write_chunk(self):
+        """
+        Streams the collected trajectories to disk and clears them.
+        """
+        obs, next_obs, done, actions, info_tensors = self._get_save_data()
+        if not isinstance(obs, torch.Tensor):
+            raise ValueError("Only tensor observations can be streamed to disk")
+        self._writer.add_chunk(
+            obs.numpy(),
+            next_obs.numpy(),
+            actions.numpy(),
+            done.numpy(),
+            {k: v.numpy() for k, v in info_tensors.items()},
+        )
+        self.all_obs = []
+        self.all_next_obs = []
+        self.all_done = []
+        self.all_actions = []
+        self.all_info = []
+
+    def save(self):
+        """
+        Saves all observations, actions, and masks from trajectories. Saves all
+        data in info starting with key `ep_`.
+        """
+        if self._writer is not None:
+            if len(self.all_done) > 0:
+                self._write_chunk()
+            if self._writer.num_transitions == 0:
+                raise ValueError("There is no data to save")
+            print(
+                "Saved %i transitions to %s"
+                % (self._writer.num_transitions, self._writer.save_dir)
+            )
+            return self._writer.save_dir
+
+        (
+            save_obs,
+            save_next_obs,
+            save_done,
+            save_actions,
+            info_tensors,
+        ) = self._get_save_data()
 
         save_name = osp.join(self.save_dir, self.save_name)
         n_steps = len(save_actions)
@@ -159,6 +234,8 @@ class GoalTrajSaver(TrajSaver):
         look_for_subkey: str,
         assert_saved: bool = False,
         is_stochastic_policy=False,
+        chunk_size: Optional[int] = None,
+        append: bool = False,
     ):
         """
         :param assert_saved: If true, will raise an exception if the trajectory did not end in success.
@@ -169,7 +246,7 @@ class GoalTrajSaver(TrajSaver):
         """
         self.assert_saved = assert_saved
         self._look_for_key = look_for_subkey
-        super().__init__(save_dir, is_stochastic_policy)
+        super().__init__(save_dir, is_stochastic_policy, chunk_size, append)
 
     def should_save_traj(self, traj):
         last_info = traj[-1][-1]
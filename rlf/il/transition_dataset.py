@@ -1,4 +1,3 @@
-from collections import namedtuple
 from dataclasses import dataclass
 from typing import List
 
@@ -6,6 +5,7 @@ import numpy as np
 import rlf.rl.utils as rutils
 import torch
 from rlf.il.il_dataset import ImitationLearningDataset, convert_to_tensors
+from rlf.il.lazy_demos import LazyDemoField, is_lazy_demo_dir, load_lazy_demos
 
 
 @dataclass(frozen=True)
@@ -27,28 +27,39 @@ class DatasetTransition:
 
 
 class DatasetTrajectory:
-    def __init__(self):
-        self._dataset_transitions = []
+    """
+    A view of one trajectory in the flat tensors of a `TransitionDataset`.
+    Transitions are only created when they are accessed.
+    """
+
+    def __init__(self, trajs, start: int, end: int):
+        self._trajs = trajs
+        self._idxs = range(start, end)
 
-    def append(self, t: DatasetTransition):
-        self._dataset_transitions.append(t)
+    def _get_transition(self, i) -> DatasetTransition:
+        return DatasetTransition(
+            i,
+            self._trajs["obs"][i],
+            self._trajs["done"][i],
+            self._trajs["actions"][i],
+            self._trajs["next_obs"][i],
+        )
 
     def __getitem__(self, key):
-        return self._dataset_transitions[key]
+        if isinstance(key, slice):
+            return [self._get_transition(i) for i in self._idxs[key]]
+        return self._get_transition(self._idxs[key])
 
     def __iter__(self):
-        return iter(self._dataset_transitions)
-
-    def __next__(self):
-        return next(self._dataset_transitions)
+        return (self._get_transition(i) for i in self._idxs)
 
     def __len__(self):
-        return len(self._dataset_transitions)
+        return len(self._idxs)
 
     def obs_to_tensor(self) -> torch.Tensor:
-        obs = torch.stack([t.obs for t in self], dim=0)
-        last_t = self[-1].next_obs
-        return torch.cat([obs, last_t.view(1, -1)], dim=0)
+        obs = self._trajs["obs"][self._idxs.start : self._idxs.stop]
+        last_t = self._trajs["next_obs"][self._idxs.stop - 1]
+        return torch.cat([obs, last_t.unsqueeze(0)], dim=0)
 
 
 class TransitionDataset(ImitationLearningDataset):
@@ -66,6 +77,8 @@ class TransitionDataset(ImitationLearningDataset):
         super().__init__(load_path, transform_dem_dataset_fn)
         if override_data is not None:
             trajs = override_data
+        elif is_lazy_demo_dir(load_path):
+            trajs = load_lazy_demos(load_path)
         elif load_path.endswith(".npz"):
             trajs = self._load_npz(load_path)
         else:
@@ -81,21 +94,21 @@ class TransitionDataset(ImitationLearningDataset):
         self.trajs["actions"] = trajs["actions"].float()
         self.trajs["next_obs"] = trajs["next_obs"].float()
 
-        self.state_mean = torch.mean(self.trajs["obs"], dim=0)
-        self.state_std = torch.std(self.trajs["obs"], dim=0)
+        self._traj_offsets = None
+
+        if isinstance(self.trajs["obs"], LazyDemoField):
+            self.state_mean, self.state_std = self.trajs["obs"].mean_std()
+        else:
+            self.state_mean = torch.mean(self.trajs["obs"], dim=0)
+            self.state_std = torch.std(self.trajs["obs"], dim=0)
         self._compute_action_stats()
 
     def viz(self, args):
         import seaborn as sns
 
-        traj_lens = []
-        cur_len = 0
-        for done in self.trajs["done"]:
-            if done:
-                traj_lens.append(cur_len)
-                cur_len = 0
-            else:
-                cur_len += 1
+        ends = (self.trajs["done"] == 1).nonzero().view(-1).cpu().numpy()
+        # Number of non-terminal steps in each trajectory.
+        traj_lens = np.diff(ends, prepend=-1) - 1
         if len(traj_lens) == 0 or np.var(traj_lens) == 0:
             return
         p = sns.distplot(traj_lens)
@@ -106,7 +119,8 @@ class TransitionDataset(ImitationLearningDataset):
         save_path = rutils.plt_save(rutils.get_save_dir(args), "traj_len_dist.png")
         print(f"Saved expert data visualization to {save_path}")
 
-    def _load_npz(self, load_path):
+    @staticmethod
+    def _load_npz(load_path):
         x = np.load(load_path)
         n_trajs, traj_len, _ = x["obs"].shape
         N = n_trajs * traj_len
@@ -126,7 +140,8 @@ class TransitionDataset(ImitationLearningDataset):
             "next_obs": torch.tensor(next_obs),
         }
 
-    def _load_pt(self, load_path):
+    @staticmethod
+    def _load_pt(load_path):
         return torch.load(load_path)
 
     def get_num_trajs(self):
@@ -145,6 +160,8 @@ class TransitionDataset(ImitationLearningDataset):
     def to(self, device):
         for k in self.trajs:
             self.trajs[k] = self.trajs[k].to(device)
+        if self._traj_offsets is not None:
+            self._traj_offsets = self._traj_offsets.to(device)
         return self
 
     def get_expert_stats(self, device):
@@ -164,38 +181,71 @@ class TransitionDataset(ImitationLearningDataset):
             "actions": self.trajs["actions"][i],
         }
 
+    def get_batch(self, idxs):
+        # Indexing with the whole index tensor gathers each field at once.
+        return self[idxs]
+
+    def get_traj_offsets(self) -> torch.Tensor:
+        """
+        Trajectory `i` is the transitions `offsets[i]` to `offsets[i + 1]` in
+        the flat tensors of `self.trajs`. Returns a tensor of shape
+        [# trajs + 1].
+        """
+        if self._traj_offsets is None:
+            done = self.trajs["done"]
+            ends = (done == 1).nonzero().view(-1) + 1
+            if len(ends) == 0 or ends[-1] != len(done):
+                raise ValueError("Trajectory from dataset does not end in termination")
+            self._traj_offsets = torch.cat([ends.new_zeros(1), ends])
+        return self._traj_offsets
+
+    def get_traj_trans_idxs(self, traj_idxs: torch.Tensor) -> torch.Tensor:
+        """
+        Returns the indices of all transitions in the trajectories
+        `traj_idxs`, in that trajectory order.
+        """
+        offsets = self.get_traj_offsets()
+        traj_idxs = torch.as_tensor(traj_idxs, device=offsets.device)
+        starts = offsets[traj_idxs]
+        lens = offsets[traj_idxs + 1] - starts
+        # Shift each trajectory's block of a flat arange onto its start.
+        block_starts = torch.cumsum(lens, 0) - lens
+        return torch.arange(
+            int(lens.sum()), device=offsets.device
+        ) + torch.repeat_interleave(starts - block_starts, lens)
+
+    def get_action_chunks(self, horizon: int) -> torch.Tensor:
+        """
+        Returns the next `horizon` actions from every transition as a
+        (N, horizon, action_dim) tensor. Chunks running past the end of their
+        trajectory repeat the final action.
+        """
+        offsets = self.get_traj_offsets()
+        lens = offsets[1:] - offsets[:-1]
+        last_idxs = torch.repeat_interleave(offsets[1:] - 1, lens)
+        idxs = torch.arange(len(last_idxs), device=offsets.device).unsqueeze(1)
+        idxs = idxs + torch.arange(horizon, device=offsets.device)
+        idxs = torch.minimum(idxs, last_idxs.unsqueeze(1))
+        actions = self.trajs["actions"]
+        return actions[idxs.to(actions.device)]
+
     def group_into_trajs(self) -> List[DatasetTrajectory]:
-        idxs = range(self.trajs["obs"].shape[0])
-
-        trajs = []
-        cur_traj = DatasetTrajectory()
-        Transition = namedtuple("Transition", "index obs done actions next_obs")
-
-        for i, obs, done, actions, next_obs in zip(
-            idxs,
-            self.trajs["obs"],
-            self.trajs["done"],
-            self.trajs["actions"],
-            self.trajs["next_obs"],
-        ):
-            cur_traj.append(DatasetTransition(i, obs, done, actions, next_obs))
-            if done.item():
-                trajs.append(cur_traj)
-                cur_traj = DatasetTrajectory()
-        if len(cur_traj) != 0:
-            raise ValueError("Trajectory from dataset does not end in termination")
-        return trajs
+        offsets = self.get_traj_offsets().tolist()
+        return [
+            DatasetTrajectory(self.trajs, start, end)
+            for start, end in zip(offsets[:-1], offsets[1:])
+        ]
 
     def compute_split(self, traj_frac, rnd_seed):
         # Need to split by trajectories, not transitions
-        trajs = self.group_into_trajs()
-
-        use_count = int(len(trajs) * traj_frac)
+        num_trajs = len(self.get_traj_offsets()) - 1
+        use_count = int(num_trajs * traj_frac)
 
         rng = np.random.default_rng(rnd_seed)
-        rng.shuffle(trajs)
-        trajs = trajs[:use_count]
+        traj_idxs = np.arange(num_trajs)
+        rng.shuffle(traj_idxs)
+        traj_idxs = traj_idxs[:use_count]
 
-        idxs = [step.index for traj in trajs for step in traj]
+        idxs = self.get_traj_trans_idxs(torch.as_tensor(traj_idxs))
 
-        return torch.utils.data.Subset(self, idxs)
+        return torch.utils.data.Subset(self, idxs.tolist())
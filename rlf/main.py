@@ -77,10 +77,10 @@ def run_policy(run_settings, runner=None) -> RunResult:
                 runner.eval(j, force_eval=True)
 
         if args.save_interval > 0:
-            runner.save(j + 1, force_save=True)
+            runner.save(j + 1, force_save=True, next_update=end_update)
         if args.eval_interval > 0:
             eval_result = runner.eval(
-                j + 1, num_eval=args.final_num_eval, force_eval=True
+                j + 1, num_eval=args.final_num_eval, force_eval=True, wait=True
             )
         else:
             eval_result = None
@@ -4,6 +4,7 @@ from rlf.policies.actor_critic.reg_actor_critic import RegActorCritic
 from rlf.policies.base_net_policy import BaseNetPolicy
 from rlf.policies.base_policy import BasePolicy, get_empty_step_info
 from rlf.policies.basic_policy import BasicPolicy
+from rlf.policies.diffusion_policy import DiffusionPolicy
 from rlf.policies.dqn import DQN
 from rlf.policies.random_policy import RandomPolicy
 from rlf.policies.solve_policy import SolvePolicy
@@ -33,7 +33,8 @@ class ActionData(object):
         self.hxs = hxs
         self.add_reward = add_reward
         self.extra = extra
-        self.take_action = torch.tensor(action.detach().cpu().numpy())
+        # Copy without going through numpy so this also works in `vmap`.
+        self.take_action = action.detach().cpu().clone()
 
     def clip_action(self, low_bound, upp_bound):
         # When CUDA is enabled the action will be on the GPU.
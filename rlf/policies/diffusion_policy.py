@@ -0,0 +1,292 @@
+import math
+from typing import Callable, List, Optional, Tuple
+
+import rlf.rl.utils as rutils
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from rlf.policies.base_net_policy import BaseNetPolicy
+from rlf.policies.base_policy import create_simple_action_data
+from rlf.rl.model import MLPBase, reg_mlp_weight_init
+
+
+def get_timestep_embedding(t: torch.Tensor, dim: int) -> torch.Tensor:
+    """
+    Sinusoidal embedding of the integer diffusion timesteps `t` of shape (N,).
+    """
+    half = dim // 2
+    freqs = torch.exp(
+        -math.log(10000.0) * torch.arange(half, device=t.device) / max(half - 1, 1)
+    )
+    args = t.float().unsqueeze(-1) * freqs
+    return torch.cat([args.sin(), args.cos()], dim=-1)
+
+
+class DiffusionPolicy(BaseNetPolicy):
+    """
+    Denoising diffusion policy over a chunk of `--dp-action-horizon` future
+    actions, conditioned on the encoded state. Trained with the DDPM noise
+    prediction loss by `DiffPolicy`.
+
+    Inference is configured with arguments that can be changed at evaluation
+    time without retraining:
+    - `--dp-sampler`: `ddpm` runs the full ancestral chain, `ddim` only runs
+      `--dp-sample-steps` deterministic (for `--dp-ddim-eta 0`) steps.
+    - `--dp-replan-interval`: Number of actions of a predicted chunk executed
+      open-loop before predicting a new chunk.
+    - `--dp-warm-start`: When replanning, noise the remainder of the previous
+      chunk to this fraction of the diffusion chain and only denoise from
+      there.
+    """
+
+    def __init__(
+        self,
+        use_goal: bool = False,
+        fuse_states: List[str] = [],
+        get_base_net_fn: Optional[Callable[[Tuple[int], bool], nn.Module]] = None,
+    ):
+        super().__init__(use_goal, fuse_states, get_base_net_fn)
+
+    def init(self, obs_space, action_space, args):
+        super().init(obs_space, action_space, args)
+        self.action_dim = rutils.get_ac_dim(self.action_space)
+        self.action_horizon = self.args.dp_action_horizon
+        chunk_dim = self.action_horizon * self.action_dim
+        hidden_dim = self.args.policy_hidden_dim
+        self.noise_net = MLPBase(
+            self._get_base_out_shape()[0] + chunk_dim + self.args.dp_time_emb_dim,
+            False,
+            [hidden_dim] * self.args.policy_hidden_depth + [chunk_dim],
+            weight_init=reg_mlp_weight_init,
+            get_activation=lambda: nn.Mish(),
+            no_last_act=True,
+        )
+
+        betas = torch.linspace(
+            self.args.dp_beta_start,
+            self.args.dp_beta_end,
+            self.args.dp_num_diffusion_steps,
+        )
+        self.register_buffer("alphas_cumprod", torch.cumprod(1.0 - betas, dim=0))
+
+        # Chunk being executed for each environment.
+        self._chunks = None
+        self._chunk_steps = None
+
+    def _encode_state(self, state, add_state=None, hxs=None, masks=None):
+        base_features, _ = self._apply_base_net(state, add_state, hxs, masks)
+        return self._fuse_base_out(base_features, add_state)
+
+    def _predict_noise(self, x, t, cond):
+        t_emb = get_timestep_embedding(t, self.args.dp_time_emb_dim)
+        net_in = torch.cat([cond, x.flatten(1), t_emb], dim=-1)
+        noise, _ = self.noise_net(net_in, None, None)
+        return noise.view(x.shape)
+
+    def _as_chunk(self, actions: torch.Tensor) -> torch.Tensor:
+        if actions.dim() == 2:
+            # Single actions are chunks of one.
+            actions = actions.unsqueeze(1)
+        return actions
+
+    def get_loss(self, true_actions, states, add_state=None):
+        """
+        DDPM noise prediction loss.
+        :param true_actions: Shape (N, H, action_dim) action chunks or
+            (N, action_dim) if the horizon is 1.
+        """
+        x0 = self._as_chunk(true_actions)
+        cond = self._encode_state(states, add_state)
+        t = torch.randint(
+            0, len(self.alphas_cumprod), (x0.shape[0],), device=x0.device
+        )
+        ac = self.alphas_cumprod[t].view(-1, 1, 1)
+        noise = torch.randn_like(x0)
+        x_t = ac.sqrt() * x0 + (1.0 - ac).sqrt() * noise
+        return F.mse_loss(self._predict_noise(x_t, t, cond), noise)
+
+    def _get_timesteps(self, start_t: int, num_steps: int) -> List[int]:
+        """
+        Descending timesteps from `start_t` to 0, evenly spaced.
+        """
+        ts = torch.linspace(start_t, 0, max(num_steps, 1)).round().long()
+        return ts.unique_consecutive().tolist()
+
+    def _get_sampler_settings(self) -> Tuple[int, float]:
+        """
+        Returns the number of denoising steps over the full chain and the
+        DDIM eta, 1.0 is ancestral DDPM sampling.
+        """
+        if self.args.dp_sampler == "ddpm":
+            return len(self.alphas_cumprod), 1.0
+        elif self.args.dp_sampler == "ddim":
+            return self.args.dp_sample_steps, self.args.dp_ddim_eta
+        raise ValueError(f"Unrecognized sampler {self.args.dp_sampler}")
+
+    @torch.no_grad()
+    def predict_action(
+        self, noise_shape, states, device, add_state=None, init_actions=None
+    ):
+        """
+        Samples action chunks for `states`.
+        :param noise_shape: Shape of the sampled actions, (N, action_dim) or
+            (N, H, action_dim).
+        :param init_actions: Warm start, if given denoising starts from these
+            actions noised to `--dp-warm-start` of the chain.
+        """
+        cond = self._encode_state(states, add_state)
+        num_steps, eta = self._get_sampler_settings()
+        T = len(self.alphas_cumprod)
+
+        if init_actions is None:
+            start_t = T - 1
+            x = torch.randn(noise_shape, device=device)
+        else:
+            start_t = max(int(round(self.args.dp_warm_start * (T - 1))), 0)
+            num_steps = max(int(math.ceil(num_steps * start_t / (T - 1))), 1)
+            ac = self.alphas_cumprod[start_t]
+            x = ac.sqrt() * init_actions + (1.0 - ac).sqrt() * torch.randn(
+                noise_shape, device=device
+            )
+        x = self._as_chunk(x)
+
+        ts = self._get_timesteps(start_t, num_steps)
+        for i, t in enumerate(ts):
+            ac_t = self.alphas_cumprod[t]
+            if i + 1 < len(ts):
+                ac_prev = self.alphas_cumprod[ts[i + 1]]
+            else:
+                ac_prev = torch.ones_like(ac_t)
+            t_in = torch.full((x.shape[0],), t, device=device, dtype=torch.long)
+            noise = self._predict_noise(x, t_in, cond)
+
+            x0 = (x - (1.0 - ac_t).sqrt() * noise) / ac_t.sqrt()
+            if self.args.dp_clip_sample != 0.0:
+                x0 = x0.clamp(-self.args.dp_clip_sample, self.args.dp_clip_sample)
+                noise = (x - ac_t.sqrt() * x0) / (1.0 - ac_t).sqrt()
+            sigma = (
+                eta
+                * ((1.0 - ac_prev) / (1.0 - ac_t)).sqrt()
+                * (1.0 - ac_t / ac_prev).sqrt()
+            )
+            dir_scale = (1.0 - ac_prev - sigma ** 2).clamp(min=0.0).sqrt()
+            x = ac_prev.sqrt() * x0 + dir_scale * noise
+            if i + 1 < len(ts) and eta != 0.0:
+                x = x + sigma * torch.randn_like(x)
+        return x.view(noise_shape)
+
+    def _get_warm_start(self, env_idxs):
+        """
+        The unexecuted part of the previous chunks, padded by repeating the
+        last action.
+        """
+        chunks = self._chunks[env_idxs]
+        steps = self._chunk_steps[env_idxs]
+        idxs = torch.arange(self.action_horizon, device=chunks.device)
+        idxs = idxs.unsqueeze(0) + steps.unsqueeze(1)
+        idxs = idxs.clamp(max=self.action_horizon - 1)
+        return chunks.gather(1, idxs.unsqueeze(-1).expand(-1, -1, self.action_dim))
+
+    def get_action(self, state, add_state, hxs, masks, step_info):
+        n_envs = state.shape[0]
+        if self._chunks is None or self._chunks.shape[0] != n_envs:
+            # Different environments (such as evaluation), start over.
+            self._chunks = torch.zeros(
+                n_envs, self.action_horizon, self.action_dim, device=state.device
+            )
+            self._chunk_steps = torch.full(
+                (n_envs,), self.action_horizon, device=state.device, dtype=torch.long
+            )
+            masks = torch.zeros_like(masks)
+
+        new_ep = masks.view(-1) == 0.0
+        replan_interval = min(self.args.dp_replan_interval, self.action_horizon)
+        replan = new_ep | (self._chunk_steps >= replan_interval)
+        if self.args.dp_warm_start != 0.0:
+            warm = replan & ~new_ep
+        else:
+            warm = torch.zeros_like(replan)
+        for sel, warm_start in [(replan & ~warm, False), (warm, True)]:
+            if not sel.any():
+                continue
+            env_idxs = sel.nonzero().view(-1)
+            sub_add_state = (
+                None
+                if add_state is None
+                else {k: v[env_idxs] for k, v in add_state.items()}
+            )
+            self._chunks[env_idxs] = self.predict_action(
+                (len(env_idxs), self.action_horizon, self.action_dim),
+                state[env_idxs],
+                state.device,
+                add_state=sub_add_state,
+                init_actions=self._get_warm_start(env_idxs) if warm_start else None,
+            )
+            self._chunk_steps[env_idxs] = 0
+
+        env_range = torch.arange(n_envs, device=state.device)
+        chunk_steps = self._chunk_steps.clamp(max=self.action_horizon - 1)
+        action = self._chunks[env_range, chunk_steps]
+        self._chunk_steps += 1
+        return create_simple_action_data(action, hxs)
+
+    def get_add_args(self, parser):
+        super().get_add_args(parser)
+        parser.add_argument("--dp-num-diffusion-steps", type=int, default=100)
+        parser.add_argument("--dp-beta-start", type=float, default=1e-4)
+        parser.add_argument("--dp-beta-end", type=float, default=0.02)
+        parser.add_argument("--dp-time-emb-dim", type=int, default=32)
+        parser.add_argument(
+            "--dp-action-horizon",
+            type=int,
+            default=1,
+            help="""
+                Number of future actions predicted together. Changing this
+                requires retraining.
+                """,
+        )
+        parser.add_argument(
+            "--dp-sampler",
+            type=str,
+            default="ddim",
+            help="""
+                One of [ddpm, ddim]. The sampler used at inference time.
+                """,
+        )
+        parser.add_argument(
+            "--dp-sample-steps",
+            type=int,
+            default=10,
+            help="""
+                Number of denoising steps of the DDIM sampler.
+                """,
+        )
+        parser.add_argument("--dp-ddim-eta", type=float, default=0.0)
+        parser.add_argument(
+            "--dp-replan-interval",
+            type=int,
+            default=1,
+            help="""
+                Number of actions of each predicted chunk executed before
+                predicting a new one. At most the action horizon.
+                """,
+        )
+        parser.add_argument(
+            "--dp-warm-start",
+            type=float,
+            default=0.0,
+            help="""
+                If non-zero, a new chunk starts from the remainder of the
+                previous chunk noised to this fraction of the diffusion chain,
+                which also scales down the number of denoising steps.
+                """,
+        )
+        parser.add_argument(
+            "--dp-clip-sample",
+            type=float,
+            default=0.0,
+            help="""
+                If non-zero, clip the predicted actions to this magnitude at
+                every denoising step.
+                """,
+        )
@@ -0,0 +1,200 @@
+import copy
+import queue
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+import torch.nn as nn
+from rlf.rl.evaluation import evaluate
+
+
+class _VideoCollector:
+    """
+    Stands in for the logger in the evaluation worker and records the videos
+    so the training process logs them.
+    """
+
+    def __init__(self):
+        self.videos = []
+
+    def log_video(self, video_file, step_count, fps):
+        self.videos.append((video_file, step_count, fps))
+
+
+def _eval_worker(
+    policy,
+    vec_norm,
+    args,
+    env_interface,
+    alg_env_settings,
+    create_traj_saver_fn,
+    task_queue,
+    result_queue,
+) -> None:
+    # Leave the cores to the training process.
+    torch.set_num_threads(1)
+    args = copy.copy(args)
+    args.evaluation_mode = True
+
+    eval_envs = None
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            if task["policy"] is not None:
+                policy.load_state_dict(task["policy"])
+            if vec_norm is not None:
+                vec_norm.ob_rms_dict = task["ob_rms"]
+
+            video_log = _VideoCollector()
+            eval_info, eval_envs = evaluate(
+                args,
+                alg_env_settings,
+                policy,
+                vec_norm,
+                env_interface,
+                task["total_num_steps"],
+                "train",
+                eval_envs,
+                video_log,
+                create_traj_saver_fn,
+                num_eval=task["num_eval"],
+            )
+            result_queue.put(
+                {
+                    "total_num_steps": task["total_num_steps"],
+                    "eval_info": eval_info,
+                    "videos": video_log.videos,
+                }
+            )
+    finally:
+        if eval_envs is not None:
+            eval_envs.close()
+
+
+class AsyncEvaluator:
+    """
+    Evaluates snapshots of the policy in a persistent background process so
+    training continues while evaluating. `submit` copies the policy weights
+    and the observation normalization statistics, and the results are logged
+    against the step of the snapshot once they are ready.
+
+    The worker is forked when it is created, so the algorithm callbacks in the
+    environment settings see the algorithm as it was at that time. Forked
+    processes cannot use CUDA, so training must be on the CPU.
+    """
+
+    def __init__(
+        self,
+        policy,
+        vec_norm,
+        args,
+        env_interface,
+        alg_env_settings,
+        create_traj_saver_fn,
+    ):
+        if args.device.type != "cpu":
+            raise ValueError(
+                "Asynchronous evaluation forks the training process and only "
+                "supports the CPU"
+            )
+        self._policy = policy
+        self._vec_norm = vec_norm
+        self._num_pending = 0
+
+        ctx = mp.get_context("fork")
+        self._task_queue = ctx.Queue()
+        self._result_queue = ctx.Queue()
+        self._worker = ctx.Process(
+            target=_eval_worker,
+            args=(
+                policy,
+                vec_norm,
+                args,
+                env_interface,
+                alg_env_settings,
+                create_traj_saver_fn,
+                self._task_queue,
+                self._result_queue,
+            ),
+            daemon=True,
+        )
+        self._worker.start()
+
+    @property
+    def num_pending(self) -> int:
+        return self._num_pending
+
+    def submit(self, total_num_steps: int, num_eval: Optional[int] = None) -> None:
+        """
+        Queues an evaluation of the current policy.
+        """
+        if isinstance(self._policy, nn.Module):
+            # Copy since the queue serializes the tensors in the background.
+            policy_state = {
+                k: v.detach().clone() for k, v in self._policy.state_dict().items()
+            }
+        else:
+            policy_state = None
+        ob_rms = None
+        if self._vec_norm is not None:
+            ob_rms = copy.deepcopy(self._vec_norm.ob_rms_dict)
+
+        self._task_queue.put(
+            {
+                "policy": policy_state,
+                "ob_rms": ob_rms,
+                "total_num_steps": total_num_steps,
+                "num_eval": num_eval,
+            }
+        )
+        self._num_pending += 1
+
+    def get_results(self, log, wait: bool = False) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Logs the evaluations that finished and returns them as
+        `(total_num_steps, eval_info)` in the order they were submitted.
+        :param wait: If true, blocks until all submitted evaluations finish.
+        """
+        results = []
+        while self._num_pending > 0:
+            if wait:
+                result = self._get_result(block=True)
+            else:
+                result = self._get_result(block=False)
+                if result is None:
+                    break
+            self._num_pending -= 1
+
+            step = result["total_num_steps"]
+            eval_info = result["eval_info"]
+            log.log_vals(
+                {"eval_train_%s" % k: np.mean(v) for k, v in eval_info.items()}, step
+            )
+            for video_file, step_count, fps in result["videos"]:
+                log.log_video(video_file, step_count, fps)
+            results.append((step, eval_info))
+        return results
+
+    def _get_result(self, block: bool) -> Optional[Dict[str, Any]]:
+        while True:
+            try:
+                if block:
+                    return self._result_queue.get(timeout=1.0)
+                return self._result_queue.get_nowait()
+            except queue.Empty:
+                if not self._worker.is_alive():
+                    raise RuntimeError(
+                        f"Evaluation worker exited with code {self._worker.exitcode}"
+                    )
+                if not block:
+                    return None
+
+    def close(self) -> None:
+        if self._worker is None:
+            return
+        self._task_queue.put(None)
+        self._worker.join()
+        self._worker = None
@@ -1,12 +1,174 @@
+import atexit
+import copy
+import json
+import queue
+import threading
 import torch
 import os.path as osp
 import os
 
+MANIFEST_NAME = 'manifest.json'
+# Keys of a delta checkpoint that point to the full checkpoint it is based on
+# and the tensors that are the same as in that checkpoint.
+DELTA_BASE_KEY = '__delta_base__'
+DELTA_UNCHANGED_KEY = '__delta_unchanged__'
+
+
+def _snapshot(val):
+    """
+    Copies the state so it can be written while training continues. Tensors
+    are copied to the CPU.
+    """
+    if isinstance(val, torch.Tensor):
+        return val.detach().to('cpu', copy=True)
+    if isinstance(val, dict):
+        return {k: _snapshot(v) for k, v in val.items()}
+    if isinstance(val, (list, tuple)):
+        return type(val)(_snapshot(v) for v in val)
+    return copy.deepcopy(val)
+
+
+def _atomic_save(save_state, save_path):
+    """
+    Writes to a temporary file first so an interrupted save never leaves a
+    partially written checkpoint.
+    """
+    tmp_path = save_path + '.tmp'
+    torch.save(save_state, tmp_path)
+    os.replace(tmp_path, save_path)
+
+
+def _flatten_tensors(state, prefix=()):
+    """
+    Yields the path of keys to and value of every tensor in nested dicts.
+    """
+    for k, v in state.items():
+        if isinstance(v, torch.Tensor):
+            yield prefix + (k,), v
+        elif isinstance(v, dict):
+            yield from _flatten_tensors(v, prefix + (k,))
+
+
+def _get_delta(state, base_tensors, prefix=()):
+    """
+    Replaces the tensors equal to those in `base_tensors` with None.
+    :returns: The new state and the paths of the replaced tensors.
+    """
+    delta = {}
+    unchanged = []
+    for k, v in state.items():
+        path = prefix + (k,)
+        if isinstance(v, torch.Tensor):
+            base_v = base_tensors.get(path)
+            v_cpu = v.detach().cpu()
+            if (base_v is not None and base_v.shape == v_cpu.shape
+                    and base_v.dtype == v_cpu.dtype and torch.equal(base_v, v_cpu)):
+                delta[k] = None
+                unchanged.append(path)
+            else:
+                delta[k] = v
+        elif isinstance(v, dict):
+            delta[k], sub_unchanged = _get_delta(v, base_tensors, path)
+            unchanged.extend(sub_unchanged)
+        else:
+            delta[k] = v
+    return delta, unchanged
+
+
+def _read_manifest(model_dir):
+    manifest_path = osp.join(model_dir, MANIFEST_NAME)
+    if not osp.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+
+def list_checkpoints(model_dir):
+    """
+    Returns the checkpoint files in `model_dir` sorted by the number of
+    updates. Uses the manifest if there is one, so the directory is not
+    listed.
+    """
+    manifest = _read_manifest(model_dir)
+    if manifest is not None:
+        entries = sorted(manifest['checkpoints'], key=lambda e: e['num_updates'])
+        return [osp.join(model_dir, e['file']) for e in entries]
+    model_files = [x for x in os.listdir(model_dir)
+            if x.startswith('model_') and x.endswith('.pt')]
+    model_files.sort(key=lambda x: int(x.split('_')[1].split('.')[0]))
+    return [osp.join(model_dir, x) for x in model_files]
+
+
+def _torch_load(load_path, mmap):
+    """
+    With `mmap`, the tensors are backed by the file and only read when they
+    are used.
+    """
+    kwargs = {'weights_only': False}
+    if mmap:
+        kwargs['mmap'] = True
+    try:
+        return torch.load(load_path, **kwargs)
+    except TypeError:
+        # Versions of PyTorch without these options.
+        return torch.load(load_path)
+    except RuntimeError:
+        # Files in the legacy format cannot be memory mapped.
+        if not mmap:
+            raise
+        return _torch_load(load_path, False)
+
+
+def load_checkpoint(load_path, keys=None, mmap=True):
+    """
+    Loads a checkpoint, filling in the unchanged tensors of delta checkpoints
+    from the full checkpoint they are based on.
+    :param keys: If not None, only these keys are kept.
+    :param mmap: Memory map the file so tensors are read from disk when they
+        are used rather than when the checkpoint is loaded.
+    """
+    load_state = _torch_load(load_path, mmap)
+    base_name = load_state.pop(DELTA_BASE_KEY, None)
+    unchanged = load_state.pop(DELTA_UNCHANGED_KEY, [])
+    if keys is not None:
+        load_state = {k: v for k, v in load_state.items() if k in keys}
+        unchanged = [path for path in unchanged if path[0] in keys]
+    if base_name is not None and len(unchanged) > 0:
+        base_state = _torch_load(osp.join(osp.dirname(load_path), base_name),
+                mmap)
+        for path in unchanged:
+            src = base_state
+            dst = load_state
+            for k in path[:-1]:
+                src = src[k]
+                dst = dst[k]
+            dst[path[-1]] = src[path[-1]]
+    return load_state
+
 
 class Checkpointer(object):
+    """
+    With `--async-save`, `flush` snapshots the state and a background thread
+    writes it, so training only waits for the copy. At most
+    `--max-pending-saves` snapshots are held before `flush` blocks. Pending
+    saves are written by `close`, which also runs at exit.
+
+    Saved checkpoints and their evaluation metrics are indexed in a manifest
+    in the save directory. The retention options delete the checkpoints that
+    are not the latest, the last `--ckpt-keep-last`, every
+    `--ckpt-keep-every`-th saved, or the best `--ckpt-keep-best` by
+    `--ckpt-best-metric`. With `--ckpt-delta`, only every
+    `--ckpt-full-every`-th checkpoint is written in full and the others only
+    store the tensors that changed since then.
+
+    The checkpoint in `--load-file` is only read when a key is first
+    accessed. It is memory mapped unless `--load-mmap` is false and only
+    the `--load-keys` are kept if they are given.
+    """
+
     def __init__(self, args):
         self.save_state = {}
-        self.load_state = {}
+        self._load_state = {}
         self.save_dir = args.save_dir
         self.prefix = args.prefix
         self.env_name = args.env_name
@@ -16,16 +178,47 @@ class Checkpointer(object):
 
         self.model_dir_name = osp.join(self.save_dir, self.env_name, self.prefix)
 
+        # Guards the manifest which is updated by the save thread.
+        self._manifest_lock = threading.Lock()
+        self._manifest = None
+        # Metrics of checkpoints that are not written yet by the save thread.
+        self._pending_metrics = {}
+        self._delta_base = None
+        self._num_saved = 0
+
+        self._save_queue = None
+        self._save_thread = None
+        self._save_error = None
+        if getattr(args, 'async_save', False):
+            self._save_queue = queue.Queue(maxsize=args.max_pending_saves)
+            self._save_thread = threading.Thread(target=self._save_worker,
+                    daemon=True)
+            self._save_thread.start()
+            atexit.register(self.close)
+
         if self.load_file != '':
             self.load()
 
     def load(self):
-        self.load_state = torch.load(self.load_file)
-        print('-' * 30)
-        print('Loaded model from %s' % self.load_file)
-        print('-' * 30)
+        if not osp.exists(self.load_file):
+            raise ValueError(f"Checkpoint {self.load_file} does not exist")
+        # Loaded on first access.
+        self._load_state = None
         self.is_loaded = True
 
+    @property
+    def load_state(self):
+        if self._load_state is None:
+            load_keys = getattr(self.args, 'load_keys', None)
+            if load_keys is not None:
+                load_keys = load_keys.split(',')
+            self._load_state = load_checkpoint(self.load_file, load_keys,
+                    getattr(self.args, 'load_mmap', True))
+            print('-' * 30)
+            print('Loaded model from %s' % self.load_file)
+            print('-' * 30)
+        return self._load_state
+
     def should_load(self):
         return self.is_loaded
 
@@ -47,17 +240,173 @@ class Checkpointer(object):
     def get_save_path(self):
         return self.model_dir_name
 
-    def flush(self, num_updates):
+    def flush(self, num_updates, on_saved=None):
+        """
+        :param on_saved: Called once the checkpoint file is in place, from
+            the save thread with `--async-save`.
+        """
         if not self.should_save():
             return
 
         if not osp.exists(self.model_dir_name):
             os.makedirs(self.model_dir_name)
-        save_path = osp.join(self.model_dir_name, 'model_%i.pt' % num_updates)
 
-        torch.save(self.save_state, save_path)
+        if self._save_queue is not None:
+            self._check_save_error()
+            self._save_queue.put((_snapshot(self.save_state), num_updates,
+                on_saved))
+        else:
+            self._write_checkpoint(self.save_state, num_updates, on_saved)
+
+        self.save_state = {}
+
+    def add_metrics(self, num_updates, metrics):
+        """
+        Records the evaluation metrics of the checkpoint saved at
+        `num_updates` in the manifest. The retention rules are then applied
+        again since the best checkpoints may have changed.
+        """
+        if not self.should_save():
+            return
+        metrics = {k: float(v) for k, v in metrics.items()}
+        with self._manifest_lock:
+            manifest = self._get_manifest()
+            for entry in manifest['checkpoints']:
+                if entry['num_updates'] == num_updates:
+                    entry['metrics'].update(metrics)
+                    self._apply_retention()
+                    self._write_manifest()
+                    break
+            else:
+                # Added to the entry once the checkpoint is written.
+                self._pending_metrics.setdefault(num_updates, {}).update(
+                        metrics)
+
+    def _get_manifest(self):
+        if self._manifest is None:
+            self._manifest = _read_manifest(self.model_dir_name)
+            if self._manifest is None:
+                self._manifest = {'checkpoints': []}
+        return self._manifest
+
+    def _write_manifest(self):
+        manifest_path = osp.join(self.model_dir_name, MANIFEST_NAME)
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(self._manifest, f, indent=2)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    def _write_checkpoint(self, save_state, num_updates, on_saved=None):
+        save_name = 'model_%i.pt' % num_updates
+        save_path = osp.join(self.model_dir_name, save_name)
+
+        base_name = None
+        if self.args.ckpt_delta:
+            if self._num_saved % self.args.ckpt_full_every == 0:
+                self._delta_base = (save_name, {
+                    path: v.detach().to('cpu', copy=True)
+                    for path, v in _flatten_tensors(save_state)})
+            else:
+                base_name, base_tensors = self._delta_base
+                save_state, unchanged = _get_delta(save_state, base_tensors)
+                save_state[DELTA_BASE_KEY] = base_name
+                save_state[DELTA_UNCHANGED_KEY] = unchanged
+        self._num_saved += 1
+
+        _atomic_save(save_state, save_path)
         print('-' * 30)
         print('Saved model to %s' % save_path)
         print('-' * 30)
 
-        self.save_state = {}
+        with self._manifest_lock:
+            entries = self._get_manifest()['checkpoints']
+            # Counts all saves, including the deleted checkpoints, so
+            # `--ckpt-keep-every` does not depend on which were deleted.
+            save_index = 0
+            if len(entries) > 0:
+                save_index = entries[-1].get('save_index',
+                        len(entries) - 1) + 1
+            entries[:] = [e for e in entries if e['file'] != save_name]
+            entries.append({
+                'num_updates': num_updates,
+                'save_index': save_index,
+                'file': save_name,
+                'base': base_name,
+                'metrics': self._pending_metrics.pop(num_updates, {}),
+            })
+            self._apply_retention()
+            self._write_manifest()
+
+        if on_saved is not None:
+            on_saved()
+
+    def _apply_retention(self):
+        args = self.args
+        keep_last = args.ckpt_keep_last
+        keep_every = args.ckpt_keep_every
+        keep_best = args.ckpt_keep_best
+        if keep_last is None and keep_every is None and keep_best == 0:
+            return
+
+        entries = self._get_manifest()['checkpoints']
+        keep = {entries[-1]['file']}
+        if keep_last is not None:
+            keep.update(e['file'] for e in entries[-keep_last:])
+        if keep_every is not None:
+            keep.update(e['file'] for i, e in enumerate(entries)
+                    if e.get('save_index', i) % keep_every == 0)
+        if keep_best > 0:
+            metric = args.ckpt_best_metric
+            scored = [(i, e) for i, e in enumerate(entries) if metric in e['metrics']]
+            sign = 1.0 if args.ckpt_best_mode == 'max' else -1.0
+            best = sorted(scored, key=lambda x: -sign * x[1]['metrics'][metric])
+            keep.update(e['file'] for _, e in best[:keep_best])
+            # Checkpoints after the last evaluated one may still be evaluated.
+            last_scored = scored[-1][0] if len(scored) > 0 else -1
+            keep.update(e['file'] for e in entries[last_scored + 1:])
+        # Delta checkpoints need the checkpoint they are based on.
+        keep.update(e['base'] for e in entries
+                if e['file'] in keep and e['base'] is not None)
+
+        for e in entries:
+            if e['file'] not in keep:
+                del_path = osp.join(self.model_dir_name, e['file'])
+                if osp.exists(del_path):
+                    os.remove(del_path)
+        entries[:] = [e for e in entries if e['file'] in keep]
+
+    def _save_worker(self):
+        while True:
+            item = self._save_queue.get()
+            if item is None:
+                self._save_queue.task_done()
+                break
+            save_state, num_updates, on_saved = item
+            try:
+                self._write_checkpoint(save_state, num_updates, on_saved)
+            except Exception as e:
+                self._save_error = e
+            self._save_queue.task_done()
+
+    def _check_save_error(self):
+        if self._save_error is not None:
+            error = self._save_error
+            self._save_error = None
+            raise RuntimeError('Failed to save checkpoint') from error
+
+    def wait(self):
+        """
+        Blocks until all pending saves are written.
+        """
+        if self._save_queue is not None:
+            self._save_queue.join()
+            self._check_save_error()
+
+    def close(self):
+        if self._save_thread is None:
+            return
+        self._save_queue.put(None)
+        self._save_thread.join()
+        self._save_thread = None
+        self._save_queue = None
+        atexit.unregister(self.close)
+        self._check_save_error()
@@ -411,6 +411,45 @@ class VecNormalize(VecNormalize_):
         super(VecNormalize, self).__init__(*args, **kwargs)
         self.training = True
 
+    @property
+    def ob_rms_dict(self):
+        return self._ob_rms_dict
+
+    @ob_rms_dict.setter
+    def ob_rms_dict(self, ob_rms_dict):
+        # Also called when the statistics are loaded from the "ob_rms"
+        # checkpoint key, the torch copies are rebuilt on the next use.
+        self._ob_rms_dict = ob_rms_dict
+        self._torch_ob_rms = {}
+        self._torch_ob_rms_stale = True
+
+    def torch_obfilt(self, obs: torch.Tensor) -> torch.Tensor:
+        """
+        Normalizes a batch of default observations on the device of `obs`
+        without updating the statistics. Equivalent to `_obfilt(obs,
+        update=False)` followed by `rutils.get_def_obs` but without the
+        conversion to numpy.
+        """
+        if not self.ob_rms_dict:
+            return obs
+        k = None if None in self.ob_rms_dict else "observation"
+        if k not in self.ob_rms_dict:
+            return obs
+
+        if self._torch_ob_rms_stale:
+            for sync_k, torch_ob_rms in self._torch_ob_rms.items():
+                torch_ob_rms.load_np(self.ob_rms_dict[sync_k])
+            self._torch_ob_rms_stale = False
+
+        if k not in self._torch_ob_rms:
+            from rlf.algos.utils import TorchRunningMeanStd
+
+            ob_rms = self.ob_rms_dict[k]
+            self._torch_ob_rms[k] = TorchRunningMeanStd(ob_rms.mean.shape)
+            self._torch_ob_rms[k].load_np(ob_rms)
+        torch_ob_rms = self._torch_ob_rms[k].to(obs.device)
+        return torch_ob_rms.normalize(obs, self.epsilon, self.clipob)
+
     def _obfilt(self, obs, update=True):
         if not isinstance(obs, dict) and rutils.is_dict_obs(self.observation_space):
             obs = {"observation": obs}
@@ -420,6 +459,7 @@ class VecNormalize(VecNormalize_):
                 if k is None:
                     if self.training and update:
                         ob_rms.update(obs)
+                        self._torch_ob_rms_stale = True
                     obs = np.clip(
                         (obs - ob_rms.mean) / np.sqrt(ob_rms.var + self.epsilon),
                         -self.clipob,
@@ -430,6 +470,7 @@ class VecNormalize(VecNormalize_):
                         continue
                     if self.training and update:
                         ob_rms.update(obs[k])
+                        self._torch_ob_rms_stale = True
                     obs[k] = np.clip(
                         (obs[k] - ob_rms.mean) / np.sqrt(ob_rms.var + self.epsilon),
                         -self.clipob,
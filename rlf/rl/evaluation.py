@@ -1,18 +1,119 @@
-import os
+import copy
 import os.path as osp
 import time
 from collections import defaultdict
+from typing import Dict, List, Optional
 
 import numpy as np
 import rlf.rl.utils as rutils
+import scipy.stats
 import torch
 from rlf.algos.base_algo import AlgorithmSettings
-from rlf.exp_mgr.viz_utils import save_mp4
+from rlf.baselines.vec_env import VecEnv
+from rlf.exp_mgr.viz_utils import AsyncVideoWriter
 from rlf.policies.base_policy import get_empty_step_info
 from rlf.rl.envs import get_vec_normalize, make_vec_envs
 from tqdm import tqdm
 
 
+class EvalEnvPool:
+    """
+    Owns the evaluation environments so they are only created once and reused
+    by every evaluation. Each evaluation reseeds them instead. One set of
+    environments is kept for each number of processes requested.
+    """
+
+    def __init__(self, env_interface, args, alg_env_settings, previous_env=None):
+        """
+        :param previous_env: Takes the action and observation space from this
+            environment, see `make_vec_envs`.
+        """
+        # Things often break if both the train and evaluation environment are
+        # forced to multi proc.
+        self._args = copy.copy(args)
+        self._args.force_multi_proc = False
+        self._env_interface = env_interface
+        self._alg_env_settings = alg_env_settings
+        self._previous_env = previous_env
+        self._envs: Dict[int, VecEnv] = {}
+
+    def get_envs(self, num_processes: int, seed: int) -> VecEnv:
+        """
+        Returns environments where process `i` is seeded with `seed + i`.
+        """
+        envs = self._envs.get(num_processes)
+        if envs is not None:
+            try:
+                envs.seed([seed + i for i in range(num_processes)])
+                return envs
+            except NotImplementedError:
+                # Custom vectorized environments may not support seeding.
+                envs.close()
+
+        envs = make_vec_envs(
+            self._args.env_name,
+            seed,
+            num_processes,
+            self._args.gamma,
+            self._args.device,
+            True,
+            self._env_interface,
+            self._args,
+            self._alg_env_settings,
+            set_eval=True,
+            previous_env=self._previous_env,
+        )
+        self._envs[num_processes] = envs
+        return envs
+
+    def close(self) -> None:
+        for envs in self._envs.values():
+            envs.close()
+        self._envs = {}
+
+
+class SequentialEvalStopper:
+    """
+    Decides when enough evaluation episodes have run to know the value of a
+    metric. After `min_episodes`, evaluation stops once the Student-t
+    confidence interval of the metric mean is narrower than `ci_width`, or
+    lies entirely above or below `threshold`.
+    """
+
+    def __init__(
+        self,
+        min_episodes: int,
+        ci_width: Optional[float] = None,
+        threshold: Optional[float] = None,
+        confidence: float = 0.95,
+    ):
+        self.min_episodes = min_episodes
+        self.ci_width = ci_width
+        self.threshold = threshold
+        self.confidence = confidence
+
+    def get_stop_reason(self, values: List[float]) -> Optional[str]:
+        """
+        :param values: The metric of each finished episode.
+        :returns: Why evaluation should stop, or None to continue.
+        """
+        n = len(values)
+        if n < max(self.min_episodes, 2):
+            return None
+        mean = np.mean(values)
+        t = scipy.stats.t.ppf((1.0 + self.confidence) / 2.0, n - 1)
+        half_width = t * np.std(values, ddof=1) / np.sqrt(n)
+
+        if self.ci_width is not None and 2.0 * half_width <= self.ci_width:
+            return "ci_width"
+        if self.threshold is not None:
+            if mean - half_width > self.threshold:
+                return "above_threshold"
+            if mean + half_width < self.threshold:
+                return "below_threshold"
+        return None
+
+
 def eval_print(
     env_interface,
     args,
@@ -108,7 +209,8 @@ def full_eval(
         create_traj_saver_fn,
         num_eval=num_eval,
     )
-    envs.close()
+    if not isinstance(envs, EvalEnvPool):
+        envs.close()
 
     return ret_info
 
@@ -133,23 +235,11 @@ def evaluate(
         num_processes = args.eval_num_processes
 
     if eval_envs is None:
-        # Things often break if both the train and evaluation environment are
-        # forced to multi proc.
-        args.force_multi_proc = False
-
-        eval_envs = make_vec_envs(
-            args.env_name,
-            args.seed + num_steps,
-            num_processes,
-            args.gamma,
-            args.device,
-            True,
-            env_interface,
-            args,
-            alg_env_settings,
-            set_eval=True,
-            previous_env=previous_env,
-        )
+        eval_envs = EvalEnvPool(env_interface, args, alg_env_settings, previous_env)
+    env_pool = None
+    if isinstance(eval_envs, EvalEnvPool):
+        env_pool = eval_envs
+        eval_envs = env_pool.get_envs(num_processes, args.seed + num_steps)
 
     assert get_vec_normalize(eval_envs) is None, "Norm is manually applied"
 
@@ -171,7 +261,6 @@ def evaluate(
         hidden_states[k] = torch.zeros(num_processes, dim).to(args.device)
     eval_masks = torch.zeros(num_processes, 1, device=args.device)
 
-    frames = []
     infos = None
 
     policy.eval()
@@ -189,13 +278,24 @@ def evaluate(
 
     total_num_eval = num_processes * num_eval
 
+    eval_stopper = None
+    if args.eval_adaptive:
+        eval_stopper = SequentialEvalStopper(
+            args.eval_min_episodes,
+            args.eval_ci_width,
+            args.eval_threshold,
+            args.eval_confidence,
+        )
+    stop_reason = "max_episodes"
+    # Processes whose episodes are finished before stopping, None until the
+    # stopping rule is met.
+    finishing = None
+
     # Measure the number of episodes completed
     pbar = tqdm(total=total_num_eval)
     evaluated_episode_count = 0
     n_succs = 0
     n_fails = 0
-    succ_frames = []
-    fail_frames = []
     if args.render_succ_fails and args.eval_num_processes > 1:
         raise ValueError(
             """
@@ -203,9 +303,24 @@ def evaluate(
                 processes is 1.
                 """
         )
+    # Frames are encoded in the background as they are rendered. When
+    # rendering successes and failures, the frames of the current episode are
+    # kept until it is known if the episode succeeded.
+    frames = []
+    if args.render_succ_fails:
+        succ_writer = create_video_writer("succ_" + mode, num_steps, args)
+        fail_writer = create_video_writer("fail_" + mode, num_steps, args)
+    else:
+        video_writer = create_video_writer(mode, num_steps, args)
+
+    def add_frames(new_frames):
+        if args.render_succ_fails:
+            frames.extend(new_frames)
+        else:
+            video_writer.add_frames(new_frames)
 
     if args.num_render is None or args.num_render > 0:
-        frames.extend(
+        add_frames(
             get_render_frames(
                 eval_envs,
                 env_interface,
@@ -220,7 +335,7 @@ def evaluate(
         )
     trajs = [[] for _ in range(num_processes)]
 
-    while evaluated_episode_count < total_num_eval:
+    while evaluated_episode_count < total_num_eval or finishing:
         step_info = get_empty_step_info()
         with torch.no_grad():
             act_obs = obfilt(rutils.ob_to_np(obs), update=False)
@@ -245,6 +360,13 @@ def evaluate(
         else:
             finished_count = sum([int(d) for d in done])
 
+        step_infos = infos
+        if finishing is not None:
+            # Episodes started after the stopping rule was met are not counted.
+            step_infos = [inf if i in finishing else {} for i, inf in enumerate(infos)]
+            finished_count = sum([int(done[i]) for i in finishing])
+            finishing = {i for i in finishing if not done[i]}
+
         if alg_env_settings.on_traj_finished is not None:
             for i in range(num_processes):
                 if done[i]:
@@ -279,7 +401,7 @@ def evaluate(
             should_render = n_succs < args.num_render or n_fails < args.num_render
 
         if should_render:
-            frames.extend(
+            add_frames(
                 get_render_frames(
                     eval_envs,
                     env_interface,
@@ -294,7 +416,7 @@ def evaluate(
             )
         obs = next_obs
 
-        step_log_vals = rutils.agg_ep_log_stats(infos, ac_info.extra)
+        step_log_vals = rutils.agg_ep_log_stats(step_infos, ac_info.extra)
         for k, v in step_log_vals.items():
             ep_stats[k].extend(v)
 
@@ -302,13 +424,28 @@ def evaluate(
             is_succ = step_log_vals["ep_success"][0]
             if is_succ == 1.0:
                 if n_succs < args.num_render:
-                    succ_frames.extend(frames)
+                    succ_writer.add_frames(frames)
                 n_succs += 1
             else:
                 if n_fails < args.num_render:
-                    fail_frames.extend(frames)
+                    fail_writer.add_frames(frames)
                 n_fails += 1
-            frames = []
+            frames.clear()
+
+        if finishing is not None:
+            if len(finishing) == 0:
+                break
+        elif eval_stopper is not None and finished_count > 0:
+            reason = eval_stopper.get_stop_reason(
+                ep_stats.get(args.eval_metric, [])
+            )
+            if reason is not None:
+                stop_reason = reason
+                # Stopping right away would over represent the episodes that
+                # finish sooner, so the running episodes are finished first.
+                finishing = {i for i in range(num_processes) if not done[i]}
+                if len(finishing) == 0:
+                    break
 
     pbar.close()
     info = {}
@@ -323,25 +460,29 @@ def evaluate(
         ret_info[k] = np.mean(v)
         ret_info[k + "_std"] = np.std(v)
 
+    if eval_stopper is not None:
+        print(f" Stopped evaluation from {stop_reason}")
+        ret_info["num_episodes"] = evaluated_episode_count
+        ret_info["stop_" + stop_reason] = 1.0
+
     if args.render_succ_fails:
         # Render the success and failures to two separate files.
-        save_frames(succ_frames, "succ_" + mode, num_steps, args)
-        save_frames(fail_frames, "fail_" + mode, num_steps, args)
+        succ_writer.close()
+        fail_writer.close()
     else:
-        save_file = save_frames(frames, mode, num_steps, args)
+        save_file = video_writer.close()
         if save_file is not None:
-            log.log_video(save_file, num_steps, args.vid_fps)
+            log.log_video(osp.splitext(save_file)[0], num_steps, args.vid_fps)
 
     # Switch policy back to train mode
     policy.train()
 
+    if env_pool is not None:
+        return ret_info, env_pool
     return ret_info, eval_envs
 
 
-def save_frames(frames, mode, num_steps, args):
-    if not osp.exists(args.vid_dir):
-        os.makedirs(args.vid_dir)
-
+def _get_vid_save_path(mode, num_steps, args):
     add = ""
     if args.load_file != "":
         add = args.load_file.split("/")[-2]
@@ -350,13 +491,23 @@ def save_frames(frames, mode, num_steps, args):
     save_name = "%s%s_%s" % (add, rutils.human_format_int(num_steps), mode)
 
     save_dir = osp.join(args.vid_dir, args.env_name, args.prefix)
-
-    fps = args.vid_fps
-
-    if len(frames) > 0:
-        save_mp4(frames, save_dir, save_name, fps=args.vid_fps, no_frame_drop=True)
-        return osp.join(save_dir, save_name)
-    return None
+    return save_dir, save_name
+
+
+def create_video_writer(mode, num_steps, args) -> AsyncVideoWriter:
+    """
+    Creates a writer that encodes the evaluation video in the background as
+    frames are rendered.
+    """
+    save_dir, save_name = _get_vid_save_path(mode, num_steps, args)
+    return AsyncVideoWriter(
+        save_dir,
+        save_name,
+        fps=args.vid_fps,
+        queue_size=args.vid_queue_size,
+        scale=args.vid_scale,
+        frame_skip=args.vid_frame_skip,
+    )
 
 
 def get_render_frames(
@@ -7,7 +7,7 @@ import string
 import sys
 import time
 from collections import defaultdict, deque
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, List, Optional
 
 import numpy as np
 import rlf.rl.utils as rutils
@@ -90,6 +90,21 @@ class BaseLogger(object):
         for k in step_log_info:
             self._step_log_info[keys_prefix + k].extend(step_log_info[k])
 
+    def get_resume_state(self) -> Dict[str, Any]:
+        """
+        The smoothing windows and step count needed to continue logging
+        where a resumed run left off.
+        """
+        return {
+            "step_log_info": {k: list(v) for k, v in self._step_log_info.items()},
+            "prev_steps": self.prev_steps,
+        }
+
+    def load_resume_state(self, resume_state: Dict[str, Any]) -> None:
+        for k, v in resume_state["step_log_info"].items():
+            self._step_log_info[k].extend(v)
+        self.prev_steps = resume_state["prev_steps"]
+
     def _get_env_id(self, args):
         upper_case = [c for c in args.env_name if c.isupper()]
         if len(upper_case) == 0:
@@ -182,16 +197,35 @@ class BaseLogger(object):
         episode_count,
         updater_log_vals,
         log_env_stats,
+        phase_times: Optional[Dict[str, float]] = None,
+        update_latencies: Optional[List[float]] = None,
+        num_samples: Optional[int] = None,
     ):
         """
         Printed FPS is all inclusive of updates, evaluations, logging and everything.
         This is NOT the environment FPS.
+        :param phase_times: Seconds spent in each phase of training since the
+            last log, such as "rollout" and "update". Used to log the
+            environment FPS, learner samples per second and the fraction of
+            time of each phase.
+        :param update_latencies: Seconds of each update since the last log.
+        :param num_samples: Transitions sampled by the updates since the last
+            log.
         """
         end = time.time()
 
-        fps = int((total_num_steps - self.prev_steps) / (end - self.start))
+        interval_time = end - self.start
+        num_steps = total_num_steps - self.prev_steps
+        fps = int(num_steps / interval_time)
         self.prev_steps = total_num_steps
         self.start = time.time()
+        perf_vals = self._get_perf_vals(
+            num_steps,
+            interval_time,
+            phase_times,
+            update_latencies,
+            num_samples,
+        )
         num_eps = len(self._step_log_info.get("r", []))
         rewards = self._step_log_info.get("r", [0])
 
@@ -213,6 +247,12 @@ class BaseLogger(object):
             print(
                 f"Updates {num_updates}, Steps {total_num_steps}, Episodes {episode_count}, FPS {fps}"
             )
+            if "env_fps" in perf_vals:
+                perf_str = f"Env FPS {perf_vals['env_fps']:.0f}"
+                samples_per_sec = perf_vals.get("learner_samples_per_sec")
+                if samples_per_sec is not None:
+                    perf_str += f", Learner samples/s {samples_per_sec:.0f}"
+                print(perf_str)
             if log_env_stats:
                 print(
                     f"Over the last {num_eps} episodes:\n"
@@ -231,12 +271,43 @@ class BaseLogger(object):
 
         # Log additional core training metrics
         log_dat["fps"] = fps
+        log_dat.update(perf_vals)
         log_dat["episodes"] = episode_count
         log_dat["updates"] = num_updates
 
         self.log_vals(log_dat, total_num_steps)
         return log_dat
 
+    def _get_perf_vals(
+        self,
+        num_steps: int,
+        interval_time: float,
+        phase_times: Optional[Dict[str, float]],
+        update_latencies: Optional[List[float]],
+        num_samples: Optional[int],
+    ) -> Dict[str, float]:
+        """
+        Throughput metrics that separate environment collection from learning.
+        Nothing is returned for phases that were not timed.
+        """
+        perf_vals = {}
+        if phase_times is None:
+            return perf_vals
+        if phase_times.get("rollout", 0) > 0:
+            perf_vals["env_fps"] = num_steps / phase_times["rollout"]
+        if num_samples and phase_times.get("update", 0) > 0:
+            perf_vals["learner_samples_per_sec"] = num_samples / phase_times["update"]
+        if update_latencies:
+            for q in [50, 90, 99]:
+                perf_vals[f"update_latency_p{q}"] = np.percentile(update_latencies, q)
+        if interval_time > 0:
+            for k, v in phase_times.items():
+                perf_vals[f"frac_time_{k}"] = v / interval_time
+            perf_vals["frac_time_other"] = max(
+                0.0, 1.0 - sum(phase_times.values()) / interval_time
+            )
+        return perf_vals
+
     def log_image(self, k, img_file, step_count):
         pass
 
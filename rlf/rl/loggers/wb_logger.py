@@ -77,6 +77,7 @@ class WbLogger(BaseLogger):
         self.wb_entity = wb_entity
         self.should_log_vids = should_log_vids
         self.skip_create_wb = skip_create_wb
+        self._last_step = 0
 
     def init(self, args, mod_prefix=lambda x: x):
         super().init(args, mod_prefix)
@@ -89,7 +90,14 @@ class WbLogger(BaseLogger):
             return
         # try:
         key_vals = {k: get_wb_media(v) for k, v in key_vals.items()}
-        wandb.log(key_vals, step=int(step_count))
+        step_count = int(step_count)
+        if step_count < self._last_step:
+            # W&B drops values logged at an earlier step, such as results of
+            # asynchronous evaluations. Log them now with the step they are for.
+            key_vals["logged_step"] = step_count
+            step_count = self._last_step
+        self._last_step = step_count
+        wandb.log(key_vals, step=step_count)
         # except Exception as e:
         #    print(e)
         #    self.is_closed = True
@@ -134,7 +142,10 @@ class WbLogger(BaseLogger):
     def log_video(self, video_file, step_count, fps):
         if not self.should_log_vids:
             return
-        wandb.log({"video": wandb.Video(video_file + ".mp4", fps=fps)}, step=step_count)
+        wandb.log(
+            {"video": wandb.Video(video_file + ".mp4", fps=fps)},
+            step=max(step_count, self._last_step),
+        )
 
     def close(self):
         self.is_closed = True
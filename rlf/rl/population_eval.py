@@ -0,0 +1,227 @@
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import rlf.rl.utils as rutils
+import torch
+import torch.nn as nn
+from rlf.algos.base_algo import AlgorithmSettings
+from rlf.policies.base_policy import ActionData, BasePolicy, get_empty_step_info
+from rlf.rl.evaluation import EvalEnvPool
+from torch.utils._pytree import tree_map
+from tqdm import tqdm
+
+# Messages of the errors `torch.func.vmap` raises for operations it cannot
+# vectorize, such as `.item()`, data dependent control flow or numpy.
+_VMAP_UNSUPPORTED_ERRORS = ("vmap:", "Cannot access data pointer of Tensor")
+
+
+class _ActionModule(nn.Module):
+    """
+    Exposes `get_action` as `forward` so it can be called with
+    `torch.func.functional_call`.
+    """
+
+    def __init__(self, policy):
+        super().__init__()
+        self.policy = policy
+
+    def forward(self, state, add_state, hxs, masks, step_info):
+        ac_info = self.policy.get_action(state, add_state, hxs, masks, step_info)
+        return ac_info.action, ac_info.value, ac_info.action_log_probs, ac_info.hxs
+
+
+class PopulationPolicy(BasePolicy):
+    """
+    Acts with K sets of weights for the same policy network in one call.
+    Process `i` of the environments is controlled by member `i // M` where
+    `M` is the number of processes per member. The stacked weights are
+    applied with `torch.func.vmap`, which falls back to calling the members
+    one at a time if the policy uses operations that cannot be vectorized.
+    Other errors of the policy are raised. The policy must not
+    keep state between calls other than its hidden states.
+    """
+
+    def __init__(self, policy: nn.Module, state_dicts: List[Dict[str, torch.Tensor]]):
+        """
+        :param policy: Network with the architecture of every member. Its own
+            weights are not used.
+        :param state_dicts: The policy weights of each member.
+        """
+        super().__init__()
+        self._action_module = _ActionModule(policy)
+        self._policy = policy
+        self.pop_size = len(state_dicts)
+        self._params = {
+            "policy." + k: torch.stack([sd[k] for sd in state_dicts])
+            for k in state_dicts[0]
+        }
+        self._use_vmap = True
+
+    def get_storage_hidden_states(self):
+        return self._policy.get_storage_hidden_states()
+
+    def to(self, device):
+        self._params = {k: v.to(device) for k, v in self._params.items()}
+        self._policy.to(device)
+        return self
+
+    def eval(self):
+        self._policy.eval()
+
+    def train(self):
+        self._policy.train()
+
+    def _call_member(self, params, state, add_state, hxs, masks, step_info):
+        return torch.func.functional_call(
+            self._action_module, params, (state, add_state, hxs, masks, step_info)
+        )
+
+    def _call_members(self, state, add_state, hxs, masks, step_info):
+        if self._use_vmap:
+            try:
+                return torch.func.vmap(
+                    lambda *x: self._call_member(*x, step_info), randomness="different"
+                )(self._params, state, add_state, hxs, masks)
+            except RuntimeError as e:
+                if not any(msg in str(e) for msg in _VMAP_UNSUPPORTED_ERRORS):
+                    raise
+                print(f"Cannot vectorize the population policy, looping instead: {e}")
+                self._use_vmap = False
+
+        outs = [
+            self._call_member(
+                *tree_map(lambda x: x[i], (self._params, state, add_state, hxs, masks)),
+                step_info,
+            )
+            for i in range(self.pop_size)
+        ]
+        return tree_map(lambda *x: torch.stack(x), *outs)
+
+    def get_action(self, state, add_state, hxs, masks, step_info) -> ActionData:
+        def split(x):
+            return x.view(self.pop_size, -1, *x.shape[1:])
+
+        def merge(x):
+            # Policies may return scalars, such as a placeholder value.
+            if x.dim() < 2:
+                return x
+            return x.reshape(-1, *x.shape[2:])
+
+        action, value, action_log_probs, hxs = tree_map(
+            merge,
+            self._call_members(
+                *tree_map(split, (state, add_state, hxs, masks)), step_info
+            ),
+        )
+        return ActionData(value, action, action_log_probs, hxs, {})
+
+
+def _filter_obs(obs, vec_norm, ob_rms_dicts, num_processes):
+    """
+    Normalizes the observations of each member with its own statistics. The
+    statistics of `vec_norm` are left unchanged.
+    """
+    obs = rutils.ob_to_np(obs)
+    if vec_norm is None:
+        return obs
+    filt_obs = []
+    orig_ob_rms_dict = vec_norm.ob_rms_dict
+    try:
+        for i, ob_rms_dict in enumerate(ob_rms_dicts):
+            vec_norm.ob_rms_dict = ob_rms_dict
+            member_obs = rutils.obs_op(
+                obs, lambda x: x[i * num_processes : (i + 1) * num_processes]
+            )
+            filt_obs.append(vec_norm._obfilt(member_obs, update=False))
+    finally:
+        vec_norm.ob_rms_dict = orig_ob_rms_dict
+    if isinstance(filt_obs[0], dict):
+        return {k: np.concatenate([x[k] for x in filt_obs]) for k in filt_obs[0]}
+    return np.concatenate(filt_obs)
+
+
+def evaluate_population(
+    args,
+    alg_env_settings: AlgorithmSettings,
+    policy: nn.Module,
+    state_dicts: List[Dict[str, torch.Tensor]],
+    ob_rms_dicts: List[Optional[Dict[Any, Any]]],
+    vec_norm,
+    env_pool: EvalEnvPool,
+    num_eval: Optional[int] = None,
+) -> List[Dict[str, float]]:
+    """
+    Evaluates K policy weights in one rollout loop over a single set of K * M
+    environment processes, where M is the usual number of evaluation
+    processes. Each member runs `M * num_eval` episodes. Nothing is rendered
+    or saved.
+    :param ob_rms_dicts: The observation normalization statistics of each
+        member, applied with `vec_norm`.
+    :returns: The evaluation result of each member.
+    """
+    if args.eval_num_processes is None:
+        num_processes = args.num_processes
+    else:
+        num_processes = args.eval_num_processes
+    if num_eval is None:
+        num_eval = args.num_eval
+    pop_size = len(state_dicts)
+    total_processes = pop_size * num_processes
+    num_member_eval = num_processes * num_eval
+
+    pop_policy = PopulationPolicy(policy, state_dicts).to(args.device)
+    eval_envs = env_pool.get_envs(total_processes, args.seed)
+    obs = eval_envs.reset()
+
+    hidden_states = {}
+    for k, dim in pop_policy.get_storage_hidden_states().items():
+        hidden_states[k] = torch.zeros(total_processes, dim).to(args.device)
+    eval_masks = torch.zeros(total_processes, 1, device=args.device)
+    ep_stats = [defaultdict(list) for _ in range(pop_size)]
+    num_done = np.zeros(pop_size, dtype=int)
+
+    pop_policy.eval()
+    pbar = tqdm(total=pop_size * num_member_eval)
+    while (num_done < num_member_eval).any():
+        with torch.no_grad():
+            act_obs = _filter_obs(obs, vec_norm, ob_rms_dicts, num_processes)
+            act_obs = rutils.ob_to_tensor(act_obs, args.device)
+            ac_info = pop_policy.get_action(
+                rutils.get_def_obs(act_obs),
+                rutils.get_other_obs(act_obs),
+                hidden_states,
+                eval_masks,
+                get_empty_step_info(),
+            )
+            hidden_states = ac_info.hxs
+
+        obs, _, done, infos = eval_envs.step(ac_info.take_action)
+        eval_masks = torch.tensor(
+            [[0.0] if done_ else [1.0] for done_ in done],
+            dtype=torch.float32,
+            device=args.device,
+        )
+
+        for i in range(total_processes):
+            member = i // num_processes
+            # Extra episodes of members that are already done are ignored.
+            if not done[i] or num_done[member] >= num_member_eval:
+                continue
+            num_done[member] += 1
+            pbar.update(1)
+            for k, v in rutils.agg_ep_log_stats([infos[i]], {}).items():
+                ep_stats[member][k].extend(v)
+    pbar.close()
+    pop_policy.train()
+
+    ret_infos = []
+    for member, member_stats in enumerate(ep_stats):
+        print(f" Member {member} evaluation using {num_done[member]} episodes:")
+        ret_info = {}
+        for k, v in member_stats.items():
+            print(" - %s: %.5f" % (k, np.mean(v)))
+            ret_info[k] = np.mean(v)
+            ret_info[k + "_std"] = np.std(v)
+        ret_infos.append(ret_info)
+    return ret_infos
@@ -1,5 +1,10 @@
 import contextlib
-from typing import Any, Dict, Optional, Tuple
+import os
+import os.path as osp
+import random
+import shutil
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import torch
@@ -8,8 +13,14 @@ from rlf.algos.custom_iter_algo import CustomIterAlgo
 from rlf.baselines.vec_env import VecEnvWrapper
 from rlf.policies.base_policy import get_step_info
 from rlf.rl import utils
+from rlf.rl.async_eval import AsyncEvaluator
+from rlf.rl.checkpointer import load_checkpoint
 from rlf.rl.envs import get_vec_normalize, make_vec_envs, wrap_in_vec_normalize
-from rlf.rl.evaluation import full_eval, train_eval
+from rlf.rl.evaluation import EvalEnvPool, full_eval, train_eval
+from rlf.rl.population_eval import evaluate_population
+
+# Timers of the phases of training whose share of the time is logged.
+PHASE_TIMERS = ["rollout", "update", "eval", "save"]
 
 
 class Runner:
@@ -28,7 +39,13 @@ class Runner:
         args,
         updater,
         create_traj_saver_fn=None,
+        eval_env_pool=None,
     ):
+        """
+        :param eval_env_pool: Evaluation environments to reuse, by default
+            they are created on the first evaluation. With `--eval-only`,
+            `envs` are the evaluation environments of this pool.
+        """
         self.envs = envs
         self.storage = storage
         self.policy = policy
@@ -37,8 +54,22 @@ class Runner:
         self.checkpointer = checkpointer
         self.args = args
         self.updater = updater
-        self.train_eval_envs = None
+        self.eval_env_pool = eval_env_pool
         self.create_traj_saver_fn = create_traj_saver_fn
+        self.async_evaluator = None
+        self.episode_count = 0
+        # Times of the current log interval and of the whole run.
+        self.timer = utils.TimeProfilee()
+        self._run_timer = utils.TimeProfilee()
+        self._start_time = time.perf_counter()
+        if not args.log_timers:
+            self.timer.freeze()
+        # Latency of each update and the sampled transitions count since the
+        # last log.
+        self._update_latencies = []
+        self._prev_num_sampled = 0
+        # The update of each pending asynchronous evaluation by its step.
+        self._async_eval_updates = {}
 
         if self.policy.requires_inference_grads():
             self.train_ctx = contextlib.nullcontext
@@ -71,7 +102,7 @@ class Runner:
 
             step_info = get_step_info(update_iter, step, self.episode_count, self.args)
 
-            with self.train_ctx():
+            with self.train_ctx(), utils.TimeProfiler("policy_act", self):
                 ac_info = policy.get_action(
                     utils.get_def_obs(obs, self.args.policy_ob_key),
                     utils.get_other_obs(obs),
@@ -82,14 +113,16 @@ class Runner:
                 if self.args.clip_actions:
                     ac_info.clip_action(*self.ac_tensor)
 
-            next_obs, reward, done, infos = self.envs.step(ac_info.take_action)
+            with utils.TimeProfiler("env_step", self):
+                next_obs, reward, done, infos = self.envs.step(ac_info.take_action)
 
             reward += ac_info.add_reward
 
             self.episode_count += sum([int(d) for d in done])
             self.log.collect_step_info(infos, ac_info.extra)
 
-            storage.insert(obs, next_obs, reward, done, infos, ac_info)
+            with utils.TimeProfiler("storage_insert", self):
+                storage.insert(obs, next_obs, reward, done, infos, ac_info)
         return self.storage
 
     def training_iter(self, update_iter: int) -> Dict[str, Any]:
@@ -101,8 +134,13 @@ class Runner:
                 self.rl_rollout, self.storage, update_iter
             )
         else:
-            self.rl_rollout(self.policy, self.storage, update_iter)
-            updater_log_vals = self.updater.update(self.storage)
+            with utils.TimeProfiler("rollout", self):
+                self.rl_rollout(self.policy, self.storage, update_iter)
+            with utils.TimeProfiler("update", self) as update_profiler:
+                updater_log_vals = self.updater.update(self.storage)
+            if update_profiler.elapsed is not None:
+                self._update_latencies.append(update_profiler.elapsed)
+        self.updater.add_timer_to(self.timer)
         self.updater.add_and_clear_timer(updater_log_vals)
 
         self.storage.after_update()
@@ -120,11 +158,19 @@ class Runner:
         """
         Runs before any evaluation or training.
         """
-        self.episode_count = 0
         self.alg_env_settings = self.updater.get_env_settings(self.args)
         self.updater.first_train(self.log, self._eval_policy, self.env_interface)
         if self.args.clip_actions:
             self.ac_tensor = utils.ac_space_to_tensor(self.policy.action_space)
+        if self.args.async_eval:
+            self.async_evaluator = AsyncEvaluator(
+                self.policy,
+                get_vec_normalize(self.envs),
+                self.args,
+                self.env_interface,
+                self.alg_env_settings,
+                self.create_traj_saver_fn,
+            )
 
     def easy_make_vec_envs(
         self, args, num_processes=None, set_eval=True, seed_offset=0, env_name=None
@@ -162,38 +208,158 @@ class Runner:
             self.log,
             total_num_steps,
             self.env_interface,
-            self.train_eval_envs,
+            self._get_eval_env_pool(self.alg_env_settings),
             self.create_traj_saver_fn,
             num_eval=num_eval,
         )
 
+    def _get_eval_env_pool(self, alg_env_settings) -> EvalEnvPool:
+        if self.eval_env_pool is None:
+            self.eval_env_pool = EvalEnvPool(
+                self.env_interface, self.args, alg_env_settings, previous_env=self.envs
+            )
+        return self.eval_env_pool
+
     def log_vals(self, updater_log_vals, update_iter):
+        if self.async_evaluator is not None:
+            self._get_async_eval_results()
         total_num_steps = self.updater.get_completed_update_steps(update_iter + 1)
-        return self.log.interval_log(
+        phase_times = None
+        num_sampled = self.storage.get_num_sampled()
+        if self.timer.is_timing:
+            timer_sums = self.timer.get_sums()
+            updater_log_vals = {
+                **updater_log_vals,
+                **{"timing_" + k: v for k, v in timer_sums.items()},
+            }
+            phase_times = {k: timer_sums[k] for k in PHASE_TIMERS if k in timer_sums}
+            self._run_timer.merge(self.timer)
+            self.timer.clear()
+        log_dat = self.log.interval_log(
             update_iter,
             total_num_steps,
             self.episode_count,
             updater_log_vals,
             self.args.num_steps != 0,
+            phase_times=phase_times,
+            update_latencies=self._update_latencies,
+            num_samples=num_sampled - self._prev_num_sampled,
         )
+        self._update_latencies = []
+        self._prev_num_sampled = num_sampled
+        return log_dat
 
-    def save(self, update_iter: int, force_save: bool = False) -> None:
+    def save(
+        self,
+        update_iter: int,
+        force_save: bool = False,
+        next_update: Optional[int] = None,
+    ) -> None:
+        """
+        :param next_update: The update training continues from when resuming
+            from this checkpoint. By default the one after `update_iter`.
+        """
+        if next_update is None:
+            next_update = update_iter + 1
         if (
             (self.episode_count > 0) or (self.args.num_steps == 0) or force_save
         ) and self.checkpointer.should_save():
-            vec_norm = get_vec_normalize(self.envs)
-            if vec_norm is not None:
-                self.checkpointer.save_key("ob_rms", vec_norm.ob_rms_dict)
-            self.checkpointer.save_key("step", update_iter)
-
-            self.policy.save(self.checkpointer)
-            self.updater.save(self.checkpointer)
+            with utils.TimeProfiler("save", self):
+                self._save(update_iter, next_update)
+
+    def _save(self, update_iter: int, next_update: int) -> None:
+        vec_norm = get_vec_normalize(self.envs)
+        if vec_norm is not None:
+            self.checkpointer.save_key("ob_rms", vec_norm.ob_rms_dict)
+        self.checkpointer.save_key("step", update_iter)
+
+        self.policy.save(self.checkpointer)
+        self.updater.save(self.checkpointer)
+        on_saved = None
+        if self.args.save_resume_state:
+            self.checkpointer.save_key(
+                "resume_state", self._get_resume_state(update_iter, next_update)
+            )
+            # Older storage contents are only deleted once a checkpoint that
+            # points to the new ones is written.
+            on_saved = lambda: self._remove_old_storage(update_iter)
 
-            self.checkpointer.flush(num_updates=update_iter)
+        self.checkpointer.flush(num_updates=update_iter, on_saved=on_saved)
 
-    def eval(self, update_iter, num_eval=None, force_eval=False) -> Dict[str, float]:
+    def _get_resume_state(self, update_iter: int, next_update: int) -> Dict[str, Any]:
+        """
+        The training state besides the model and optimizers. The storage
+        contents are written to a directory next to the checkpoints.
+        """
+        model_dir = self.checkpointer.get_save_path()
+        storage_dir = "storage_%i" % update_iter
+        tmp_dir = osp.join(model_dir, storage_dir + ".tmp")
+        if osp.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        storage_state = self.storage.save_resume(tmp_dir)
+        save_dir = osp.join(model_dir, storage_dir)
+        if osp.exists(save_dir):
+            shutil.rmtree(save_dir)
+        os.replace(tmp_dir, save_dir)
+
+        rng_state = {
+            "random": random.getstate(),
+            "numpy": np.random.get_state(),
+            "torch": torch.get_rng_state(),
+        }
+        if torch.cuda.is_available():
+            rng_state["cuda"] = torch.cuda.get_rng_state_all()
+
+        vec_norm = get_vec_normalize(self.envs)
+        return {
+            "storage_dir": storage_dir,
+            "next_update": next_update,
+            "storage": storage_state,
+            "rng": rng_state,
+            "ret_rms": None if vec_norm is None else vec_norm.ret_rms,
+            "episode_count": self.episode_count,
+            "log": self.log.get_resume_state(),
+        }
+
+    def _remove_old_storage(self, update_iter: int) -> None:
+        model_dir = self.checkpointer.get_save_path()
+        for f in os.listdir(model_dir):
+            if not f.startswith("storage_") or f.endswith(".tmp"):
+                continue
+            if int(f[len("storage_") :]) < update_iter:
+                shutil.rmtree(osp.join(model_dir, f))
+
+    def _load_resume_state(self, resume_state: Dict[str, Any]) -> None:
+        load_dir = osp.join(
+            osp.dirname(self.args.load_file), resume_state["storage_dir"]
+        )
+        if osp.exists(load_dir):
+            self.storage.load_resume(load_dir, resume_state["storage"])
+        else:
+            print(f"Storage contents {load_dir} are missing, starting empty")
+
+        vec_norm = get_vec_normalize(self.envs)
+        if vec_norm is not None:
+            vec_norm.ret_rms = resume_state["ret_rms"]
+        self.episode_count = resume_state["episode_count"]
+        self.log.load_resume_state(resume_state["log"])
+
+        rng_state = resume_state["rng"]
+        random.setstate(rng_state["random"])
+        np.random.set_state(rng_state["numpy"])
+        torch.set_rng_state(rng_state["torch"])
+        if "cuda" in rng_state and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(rng_state["cuda"])
+
+    def eval(
+        self, update_iter, num_eval=None, force_eval=False, wait=False
+    ) -> Dict[str, float]:
         """
-        Returns the evaluation result.
+        Returns the evaluation result. With asynchronous evaluation this is
+        the latest finished evaluation, if any.
+        :param wait: With asynchronous evaluation, wait for this evaluation
+            to finish.
         """
         if (
             (self.episode_count > 0)
@@ -202,23 +368,59 @@ class Runner:
             or force_eval
         ):
             total_num_steps = self.updater.get_completed_update_steps(update_iter + 1)
-            eval_result, self.train_eval_envs = self._eval_policy(
-                self.policy, total_num_steps, self.args, num_eval=num_eval
-            )
+            if self.async_evaluator is not None:
+                self._async_eval_updates[total_num_steps] = update_iter
+                self.async_evaluator.submit(total_num_steps, num_eval=num_eval)
+                results = self._get_async_eval_results(wait=wait)
+                if len(results) == 0:
+                    return None
+                return results[-1][1]
+            with utils.TimeProfiler("eval", self):
+                eval_result, _ = self._eval_policy(
+                    self.policy, total_num_steps, self.args, num_eval=num_eval
+                )
+            self.checkpointer.add_metrics(update_iter, eval_result)
             return eval_result
         return None
 
+    def _get_async_eval_results(self, wait: bool = False):
+        results = self.async_evaluator.get_results(self.log, wait=wait)
+        for total_num_steps, eval_result in results:
+            update_iter = self._async_eval_updates.pop(total_num_steps, None)
+            if update_iter is not None:
+                self.checkpointer.add_metrics(update_iter, eval_result)
+        return results
+
     def close(self):
+        self.updater.close()
+        if self.timer.is_timing:
+            self._run_timer.merge(self.timer)
+            utils.pstart_sep()
+            print("Time spent in each timed block:")
+            self._run_timer.print_summary(time.perf_counter() - self._start_time)
+            utils.pend_sep()
+        if self.async_evaluator is not None:
+            self._get_async_eval_results(wait=True)
+            self.async_evaluator.close()
+        self.checkpointer.close()
         self.log.close()
-        if self.train_eval_envs is not None:
-            self.train_eval_envs.close()
+        if self.eval_env_pool is not None:
+            self.eval_env_pool.close()
         self.envs.close()
         del self.envs
 
     def resume(self):
         self.updater.load_resume(self.checkpointer)
         self.policy.load_resume(self.checkpointer)
-        return self.checkpointer.get_key("step")
+        step = self.checkpointer.get_key("step")
+        if self.checkpointer.has_load_key("resume_state"):
+            resume_state = self.checkpointer.get_key("resume_state")
+            self._load_resume_state(resume_state)
+            # In-loop checkpoints store the update that finished before
+            # saving and the final one the number of updates, so the update
+            # to continue from is stored separately.
+            step = resume_state["next_update"]
+        return step
 
     def should_load_from_checkpoint(self):
         return self.checkpointer.should_load()
@@ -236,7 +438,7 @@ class Runner:
                 vec_norm.ob_rms_dict = ob_rms_dict
 
         return full_eval(
-            self.envs,
+            self._get_eval_env_pool(alg_env_settings),
             self.policy,
             self.log,
             self.checkpointer,
@@ -248,6 +450,38 @@ class Runner:
             num_eval=self.args.final_num_eval,
         )
 
+    def population_eval(
+        self, load_files: List[str], num_eval: Optional[int] = None
+    ) -> List[Dict[str, float]]:
+        """
+        Evaluates checkpoints of this policy together in one set of
+        environments, see `evaluate_population`.
+        :param load_files: Checkpoints saved by this type of runner.
+        """
+        alg_env_settings = self.updater.get_env_settings(self.args)
+        state_dicts = []
+        ob_rms_dicts = []
+        for load_file in load_files:
+            load_state = load_checkpoint(load_file)
+            state_dicts.append(load_state["policy"])
+            ob_rms_dicts.append(load_state.get("ob_rms"))
+
+        vec_norm = None
+        if ob_rms_dicts[0] is not None:
+            vec_norm = wrap_in_vec_normalize(
+                self.envs, self.args.gamma, alg_env_settings
+            )
+        return evaluate_population(
+            self.args,
+            alg_env_settings,
+            self.policy,
+            state_dicts,
+            ob_rms_dicts,
+            vec_norm,
+            self._get_eval_env_pool(alg_env_settings),
+            num_eval=num_eval,
+        )
+
     def load_from_checkpoint(self):
         self.policy.load(self.checkpointer)
 
@@ -7,6 +7,7 @@ import time
 from abc import ABC
 from collections import defaultdict
 from contextlib import ContextDecorator, contextmanager
+from functools import wraps
 from timeit import default_timer
 from typing import Any, Callable, Dict, List, Optional, Tuple
 
@@ -612,31 +613,43 @@ class TimeProfiler(ContextDecorator):
         """
         self.timer_name = timer_name
         self.timer_prop = timer_prop
+        # Seconds spent in the last timed block, None if it was not timed.
+        self.elapsed = None
         if timee is not None:
-            self.add_time_f = timee.timer.add_time
+            self.timer = timee.timer
         else:
-            self.add_time_f = None
+            self.timer = None
 
     def __enter__(self):
+        # Frozen timers skip reading the clock so disabled timing is cheap.
+        if not self.timer.is_timing:
+            self.start_time = None
+            self.elapsed = None
+            return self
         if profiling_utils is not None:
             profiling_utils.range_push(self.timer_name)
-        self.start_time = time.time()
+        self.start_time = time.perf_counter()
         return self
 
     def __call__(self, f):
+        @wraps(f)
         def wrapper(*args, **kwargs):
             other_self = args[0]
+            # The timer must be set before entering the timed block.
             if self.timer_prop is not None:
-                self.add_time_f = eval(f"other_self.{self.timer_prop}.timer.add_time")
+                self.timer = eval(f"other_self.{self.timer_prop}.timer")
             else:
-                self.add_time_f = other_self.timer.add_time
-            return f(*args, **kwargs)
+                self.timer = other_self.timer
+            with self:
+                return f(*args, **kwargs)
 
-        return super().__call__(wrapper)
+        return wrapper
 
     def __exit__(self, *exc):
-        elapsed = time.time() - self.start_time
-        self.add_time_f(self.timer_name, elapsed)
+        if self.start_time is None:
+            return False
+        self.elapsed = time.perf_counter() - self.start_time
+        self.timer.add_time(self.timer_name, self.elapsed)
         if profiling_utils is not None:
             profiling_utils.range_pop()
         return False
@@ -647,6 +660,10 @@ class TimeProfilee:
         self.clear()
         self._should_time = True
 
+    @property
+    def is_timing(self):
+        return self._should_time
+
     def freeze(self):
         self._should_time = False
 
@@ -658,6 +675,29 @@ class TimeProfilee:
             self.timers[timer_name] += timer_val
             self.timer_call_count[timer_name] += 1
 
+    def merge(self, other):
+        """
+        Adds the times and call counts of another `TimeProfilee`.
+        """
+        for timer_name, timer_val in other.timers.items():
+            self.timers[timer_name] += timer_val
+            self.timer_call_count[timer_name] += other.timer_call_count[timer_name]
+
+    def time_iter(self, timer_name, it):
+        """
+        Yields from `it` while adding the time spent getting each element to
+        `timer_name`.
+        """
+        it = iter(it)
+        profiler = TimeProfiler(timer_name)
+        profiler.timer = self
+        while True:
+            with profiler:
+                x = next(it, StopIteration)
+            if x is StopIteration:
+                return
+            yield x
+
     def get_time(self, timer_name):
         return (self.timers[timer_name], self.timer_call_count[timer_name])
 
@@ -685,6 +725,34 @@ class TimeProfilee:
         self.timers = defaultdict(lambda: 0)
         self.timer_call_count = defaultdict(lambda: 0)
 
+    def print_summary(self, total_time=None):
+        """
+        Prints the total, mean and share of `total_time` for each timer
+        sorted by the total time.
+        """
+        if len(self.timers) == 0:
+            return
+        print(
+            "%-25s %12s %10s %12s %8s"
+            % ("Timer", "Total (s)", "Calls", "Mean (ms)", "%")
+        )
+        for timer_name, timer_val in sorted(self.timers.items(), key=lambda x: -x[1]):
+            call_count = self.timer_call_count[timer_name]
+            if total_time:
+                percent = "%.1f" % (100.0 * timer_val / total_time)
+            else:
+                percent = "-"
+            print(
+                "%-25s %12.3f %10i %12.3f %8s"
+                % (
+                    timer_name,
+                    timer_val,
+                    call_count,
+                    1000.0 * timer_val / max(call_count, 1),
+                    percent,
+                )
+            )
+
 
 class StackHelper:
     """
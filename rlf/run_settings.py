@@ -16,7 +16,7 @@ from rlf.exp_mgr import config_mgr
 from rlf.il.traj_mgr import TrajSaver
 from rlf.rl.checkpointer import Checkpointer
 from rlf.rl.envs import make_vec_envs
-from rlf.rl.evaluation import full_eval
+from rlf.rl.evaluation import EvalEnvPool, full_eval
 from rlf.rl.loggers.base_logger import BaseLogger
 from rlf.rl.runner import Runner
 
@@ -80,12 +80,16 @@ class RunSettings(MasterClass):
         """
         return osp.join(self.working_dir, "configs/wandb.yaml")
 
-    def create_traj_saver(self, save_path: str) -> rlf.il.TrajSaver:
+    def create_traj_saver(self, save_path: str, args=None) -> rlf.il.TrajSaver:
         """
         How trajectories should be saved if desired.
         :save_path: file name to write the trajectories to
         """
-        return TrajSaver(save_path)
+        if args is None:
+            return TrajSaver(save_path)
+        return TrajSaver(
+            save_path, chunk_size=args.traj_chunk_size, append=args.traj_append
+        )
 
     def get_add_args(self, parser):
         pass
@@ -205,19 +209,28 @@ class RunSettings(MasterClass):
         print("args.eval_only:", args.eval_only)
         # import ipdb; ipdb.set_trace()
         # Setup environment
-        _, envs = make_vec_envs(
-            args.env_name,
-            args.seed,
-            args.num_processes,
-            args.gamma,
-            args.device,
-            True,
-            env_interface,
-            args,
-            alg_env_settings,
-            # set_eval=args.eval_only,
-            False
-        )
+        eval_env_pool = None
+        if args.eval_only:
+            # Only the evaluation environments are stepped, so create those
+            # in place of the training environments. The storage is sized
+            # for them too.
+            if args.eval_num_processes is not None:
+                args.num_processes = args.eval_num_processes
+            eval_env_pool = EvalEnvPool(env_interface, args, alg_env_settings)
+            envs = eval_env_pool.get_envs(args.num_processes, args.seed)
+        else:
+            envs = make_vec_envs(
+                args.env_name,
+                args.seed,
+                args.num_processes,
+                args.gamma,
+                args.device,
+                True,
+                env_interface,
+                args,
+                alg_env_settings,
+                False,
+            )
 
         rutils.pstart_sep()
         print("Action space:", envs.action_space)
@@ -251,7 +264,15 @@ class RunSettings(MasterClass):
                       'Rectangle-v1']
 
         runner = self._get_runner_cls(algo, policy)(
-            envs, storage, policy, log, env_interface, checkpointer, args, algo
+            envs,
+            storage,
+            policy,
+            log,
+            env_interface,
+            checkpointer,
+            args,
+            algo,
+            eval_env_pool=eval_env_pool,
         )
 
         return runner
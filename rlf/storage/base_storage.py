@@ -8,6 +8,7 @@ class BaseStorage(object):
     def __init__(self):
         self._add_info_keys = []
         self._on_traj_done_callback = lambda done_trajs: None
+        self.num_sampled = 0
 
     def set_traj_done_callback(self, on_traj_done_fn):
         self._on_traj_done_callback = on_traj_done_fn
@@ -61,9 +62,38 @@ class BaseStorage(object):
     def after_update(self):
         pass
 
+    def get_num_sampled(self):
+        """
+        The total number of transitions sampled from this storage for updates.
+        """
+        return self.num_sampled
+
+    def _count_sampled(self, batches):
+        """
+        Yields the minibatches of `batches` while adding the number of
+        transitions in each to `num_sampled`.
+        """
+        for batch in batches:
+            self.num_sampled += len(batch["mask"])
+            yield batch
+
     def to(self, device):
         pass
 
+    def save_resume(self, save_dir):
+        """
+        Writes the contents of the storage that are needed to exactly resume
+        training to the existing directory `save_dir`. The data that is tied
+        to the current environment episodes is not saved since the
+        environments are reset when resuming.
+        :returns: Small state to store in the checkpoint which is passed to
+            `load_resume`.
+        """
+        return {}
+
+    def load_resume(self, load_dir, resume_state):
+        pass
+
     def compute_masks(self, done, infos):
         # If done then clean the history of observations.
         masks = torch.FloatTensor([[0.0] if done_ else [1.0] for done_ in done])
@@ -1,3 +1,6 @@
+import os
+import os.path as osp
+
 from rlf.storage.base_storage import BaseStorage
 
 class NestedStorage(BaseStorage):
@@ -31,10 +34,25 @@ class NestedStorage(BaseStorage):
         for _,v in self.child_dict.items():
             v.after_update()
 
+    def get_num_sampled(self):
+        return sum(v.get_num_sampled() for v in self.child_dict.values())
+
     def to(self, device):
         for _,v in self.child_dict.items():
             v.to(device)
 
+    def save_resume(self, save_dir):
+        resume_state = {}
+        for k,v in self.child_dict.items():
+            child_dir = osp.join(save_dir, str(k))
+            os.makedirs(child_dir, exist_ok=True)
+            resume_state[k] = v.save_resume(child_dir)
+        return resume_state
+
+    def load_resume(self, load_dir, resume_state):
+        for k,v in self.child_dict.items():
+            v.load_resume(osp.join(load_dir, str(k)), resume_state[k])
+
     def add_info_key(self, key_name, data_size):
         for _,v in self.child_dict.items():
             v.add_info_key(key_name, data_size)
@@ -253,7 +253,41 @@ class RolloutStorage(BaseStorage):
             data_generator = self.feed_forward_generator(
                 advantages, num_mini_batch, mini_batch_size, **kwargs
             )
-        return data_generator
+        return self._count_sampled(data_generator)
+
+    def get_state_pair_generator(self, mini_batch_size):
+        """
+        Yields random batches of (state, next_state) pairs of the default
+        observation. The next state is gathered from the same observation
+        tensor at the flattened index plus the number of processes, so no
+        copy of the next observations is made.
+
+        `mask` is 0 where the episode ended in between, the next state is
+        then the reset observation. If "final_obs" is extracted from the info
+        it is also included so the caller can substitute it.
+        """
+        obs = self.get_def_obs_seq()
+        flat_obs = obs.view(-1, *obs.shape[2:])
+        next_masks = self.masks[1:].view(-1, 1)
+        batch_size = self.num_steps * self.n_procs
+
+        sampler = BatchSampler(
+            SubsetRandomSampler(range(batch_size)), mini_batch_size, drop_last=True
+        )
+        for indices in sampler:
+            self.num_sampled += len(indices)
+            indices = torch.as_tensor(indices, device=flat_obs.device)
+            ret_dict = {
+                "state": flat_obs[indices],
+                "next_state": flat_obs[indices + self.n_procs],
+                "mask": next_masks[indices],
+            }
+            if "final_obs" in self.add_data:
+                final_obs = self.add_data["final_obs"]
+                ret_dict["final_obs"] = final_obs.view(-1, *final_obs.shape[2:])[
+                    indices
+                ]
+            yield ret_dict
 
     def get_rollout_data(self, advantages=None):
         gen = self.get_generator(advantages, num_mini_batch=1)
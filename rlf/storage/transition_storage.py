@@ -2,11 +2,16 @@
 Code is heavily based off of https://github.com/denisyarats/pytorch_sac.
 The license is at `rlf/algos/off_policy/denis_yarats_LICENSE.md`
 """
+import os.path as osp
+
 import numpy as np
 import rlf.rl.utils as rutils
 import torch
 from rlf.storage.base_storage import BaseStorage
 
+# Approximate size of each file the buffer contents are saved in.
+RESUME_CHUNK_BYTES = 256 * 1024 * 1024
+
 
 class ReplayBuffer(BaseStorage):
     """Buffer to store environment transitions."""
@@ -132,10 +137,59 @@ class ReplayBuffer(BaseStorage):
         else:
             self._insert_range(obs, next_obs, reward, masks, bad_masks, infos, action)
 
+    def _get_arrays(self):
+        arrays = {
+            "obses": self.obses,
+            "next_obses": self.next_obses,
+            "actions": self.actions,
+            "rewards": self.rewards,
+            "not_dones": self.not_dones,
+            "not_dones_no_max": self.not_dones_no_max,
+        }
+        for k, v in self.add_data.items():
+            arrays["add_" + k] = v
+        return arrays
+
+    def _get_chunk_size(self):
+        row_bytes = sum(x[0].nbytes for x in self._get_arrays().values())
+        return max(1, RESUME_CHUNK_BYTES // max(1, row_bytes))
+
+    def save_resume(self, save_dir):
+        """
+        Saves the filled part of the buffer as raw `.npy` chunks of each
+        array so large buffers are never pickled or held twice in memory.
+        """
+        num_rows = len(self)
+        chunk_size = self._get_chunk_size()
+        for name, arr in self._get_arrays().items():
+            for chunk, start in enumerate(range(0, num_rows, chunk_size)):
+                np.save(
+                    osp.join(save_dir, "%s_%i.npy" % (name, chunk)),
+                    arr[start : start + chunk_size],
+                )
+        return {
+            "idx": self.idx,
+            "full": self.full,
+            "num_rows": num_rows,
+            "chunk_size": chunk_size,
+        }
+
+    def load_resume(self, load_dir, resume_state):
+        num_rows = resume_state["num_rows"]
+        chunk_size = resume_state["chunk_size"]
+        for name, arr in self._get_arrays().items():
+            for chunk, start in enumerate(range(0, num_rows, chunk_size)):
+                load_path = osp.join(load_dir, "%s_%i.npy" % (name, chunk))
+                data = np.load(load_path, mmap_mode="r")
+                np.copyto(arr[start : start + len(data)], data)
+        self.idx = resume_state["idx"]
+        self.full = resume_state["full"]
+
     def set_modify_reward_fn(self, modify_reward_fn):
         self._modify_reward_fn = modify_reward_fn
 
     def sample_tensors(self, batch_size):
+        self.num_sampled += batch_size
         idxs = np.random.randint(
             0, self.capacity if self.full else self.idx, size=batch_size
         )
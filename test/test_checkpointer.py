@@ -0,0 +1,101 @@
+import os
+
+import torch
+from rlf.args import get_default_parser
+from rlf.rl.checkpointer import Checkpointer, list_checkpoints, load_checkpoint
+
+
+def get_args(save_dir, args_str=""):
+    return get_default_parser().parse_args(
+        f"--env-name test --prefix test --save-dir {save_dir} {args_str}".split()
+    )
+
+
+def save_checkpoints(checkpointer, num_saves, metrics=None):
+    for i in range(num_saves):
+        checkpointer.save_key("policy", {"w": torch.full((2,), float(i))})
+        checkpointer.flush(num_updates=i)
+        if metrics is not None:
+            checkpointer.add_metrics(i, {"r": metrics[i]})
+    checkpointer.close()
+
+
+def get_saved_updates(checkpointer):
+    model_dir = checkpointer.get_save_path()
+    return sorted(
+        int(f.split("_")[1].split(".")[0])
+        for f in os.listdir(model_dir)
+        if f.startswith("model_") and f.endswith(".pt")
+    )
+
+
+def test_keep_every(tmp_path):
+    checkpointer = Checkpointer(get_args(tmp_path, "--ckpt-keep-every 2"))
+    save_checkpoints(checkpointer, 8)
+    assert get_saved_updates(checkpointer) == [0, 2, 4, 6, 7]
+
+
+def test_keep_last(tmp_path):
+    checkpointer = Checkpointer(get_args(tmp_path, "--ckpt-keep-last 3"))
+    save_checkpoints(checkpointer, 6)
+    assert get_saved_updates(checkpointer) == [3, 4, 5]
+
+
+def test_keep_best(tmp_path):
+    checkpointer = Checkpointer(get_args(tmp_path, "--ckpt-keep-best 2"))
+    save_checkpoints(checkpointer, 5, metrics=[1.0, 5.0, 2.0, 4.0, 0.0])
+    assert get_saved_updates(checkpointer) == [1, 3, 4]
+
+
+def test_keep_best_async(tmp_path):
+    checkpointer = Checkpointer(
+        get_args(tmp_path, "--ckpt-keep-best 1 --async-save True")
+    )
+    save_checkpoints(checkpointer, 4, metrics=[1.0, 3.0, 2.0, 0.0])
+    assert get_saved_updates(checkpointer) == [1, 3]
+
+
+def test_delta_round_trip(tmp_path):
+    checkpointer = Checkpointer(
+        get_args(tmp_path, "--ckpt-delta True --ckpt-full-every 3")
+    )
+    for i in range(5):
+        # Only "b" changes so the other tensors come from the full checkpoint.
+        checkpointer.save_key(
+            "policy", {"a": torch.ones(3), "b": torch.full((2,), float(i))}
+        )
+        checkpointer.save_key("step", i)
+        checkpointer.flush(num_updates=i)
+    checkpointer.close()
+
+    ckpt_files = list_checkpoints(checkpointer.get_save_path())
+    assert len(ckpt_files) == 5
+    for i, ckpt_file in enumerate(ckpt_files):
+        load_state = load_checkpoint(ckpt_file)
+        assert load_state["step"] == i
+        assert torch.equal(load_state["policy"]["a"], torch.ones(3))
+        assert torch.equal(load_state["policy"]["b"], torch.full((2,), float(i)))
+
+
+def test_load_keys(tmp_path):
+    checkpointer = Checkpointer(
+        get_args(tmp_path, "--ckpt-delta True --ckpt-full-every 2")
+    )
+    for i in range(2):
+        checkpointer.save_key("policy", {"a": torch.ones(3), "b": torch.full((2,), i)})
+        checkpointer.save_key("gail_disc", {"w": torch.ones(2)})
+        checkpointer.flush(num_updates=i)
+    checkpointer.close()
+    ckpt_file = list_checkpoints(checkpointer.get_save_path())[-1]
+
+    # The unchanged tensors of the kept keys still come from the full checkpoint.
+    load_state = load_checkpoint(ckpt_file, keys=["policy"])
+    assert list(load_state.keys()) == ["policy"]
+    assert torch.equal(load_state["policy"]["a"], torch.ones(3))
+    assert torch.equal(load_state["policy"]["b"], torch.full((2,), 1))
+
+    load_checkpointer = Checkpointer(
+        get_args(tmp_path, f"--load-file {ckpt_file} --load-keys policy")
+    )
+    assert load_checkpointer.has_load_key("policy")
+    assert not load_checkpointer.has_load_key("gail_disc")
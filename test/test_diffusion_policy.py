@@ -0,0 +1,90 @@
+import numpy as np
+import torch
+from gym import spaces
+from rlf.args import get_default_parser
+from rlf.policies.diffusion_policy import DiffusionPolicy
+
+HORIZON = 4
+AC_DIM = 2
+
+
+def create_policy(args_str=""):
+    policy = DiffusionPolicy()
+    parser = get_default_parser()
+    policy.get_add_args(parser)
+    args_str = f"--env-name test --prefix test --dp-action-horizon {HORIZON} {args_str}"
+    args = parser.parse_args(args_str.split())
+    args.device = "cpu"
+    policy.init(
+        spaces.Box(-1.0, 1.0, (3,), dtype=np.float32),
+        spaces.Box(-1.0, 1.0, (AC_DIM,), dtype=np.float32),
+        args,
+    )
+    return policy
+
+
+def test_ddim_schedule():
+    policy = create_policy("--dp-sample-steps 10")
+    T = len(policy.alphas_cumprod)
+    ts = []
+
+    def predict_noise(x, t, cond):
+        ts.append(t[0].item())
+        return torch.zeros_like(x)
+
+    policy._predict_noise = predict_noise
+    shape = (2, HORIZON, AC_DIM)
+    torch.manual_seed(0)
+    actions = policy.predict_action(shape, torch.zeros(2, 3), "cpu")
+    torch.manual_seed(0)
+    x_T = torch.randn(shape)
+
+    assert len(ts) == 10
+    assert ts[0] == T - 1 and ts[-1] == 0
+    assert all(t0 > t1 for t0, t1 in zip(ts[:-1], ts[1:]))
+    # With no predicted noise each step only rescales, the last step to
+    # `ac_prev = 1` so the result is the clean x0.
+    expected = x_T / policy.alphas_cumprod[-1].sqrt()
+    assert torch.allclose(actions, expected, atol=1e-5)
+
+
+def test_warm_start_shift():
+    policy = create_policy()
+    policy._chunks = torch.arange(2 * HORIZON * AC_DIM, dtype=torch.float32).view(
+        2, HORIZON, AC_DIM
+    )
+    policy._chunk_steps = torch.tensor([1, 3])
+    warm_start = policy._get_warm_start(torch.tensor([0, 1]))
+    # The unexecuted actions move to the front, padded with the last action.
+    assert torch.equal(warm_start[0], policy._chunks[0, [1, 2, 3, 3]])
+    assert torch.equal(warm_start[1], policy._chunks[1, [3, 3, 3, 3]])
+
+
+def test_replan_on_episode_end():
+    policy = create_policy(f"--dp-replan-interval {HORIZON} --dp-warm-start 0.5")
+    planned = []
+
+    def predict_action(noise_shape, states, device, add_state=None, init_actions=None):
+        planned.append((states[:, 0].tolist(), init_actions is not None))
+        return torch.zeros(noise_shape)
+
+    policy.predict_action = predict_action
+    state = torch.tensor([[0.0] * 3, [1.0] * 3])
+    masks = torch.ones(2, 1)
+    policy.get_action(state, None, {}, masks, None)
+    assert planned == [([0.0, 1.0], False)]
+
+    policy.get_action(state, None, {}, masks, None)
+    assert len(planned) == 1
+
+    # Only the environment that started a new episode replans, from noise.
+    policy.get_action(state, None, {}, torch.tensor([[1.0], [0.0]]), None)
+    assert planned[1:] == [([1.0], False)]
+    assert policy._chunk_steps.tolist() == [3, 1]
+
+    # The other environment replans once its chunk is used up, with a warm
+    # start.
+    policy.get_action(state, None, {}, masks, None)
+    assert len(planned) == 2
+    policy.get_action(state, None, {}, masks, None)
+    assert planned[2:] == [([0.0], True)]
@@ -0,0 +1,61 @@
+from argparse import Namespace
+
+import torch
+from rlf.algos import ExperienceGenerator, ParallelExperienceGenerator
+
+EPOCH_LEN = 3
+
+
+class CountingGenerator(ExperienceGenerator):
+    def init(self, policy, args, exp_gen_num_trans):
+        self.i = 0
+        self.num_trans = exp_gen_num_trans
+
+    def get_batch(self):
+        self.i += 1
+        if self.i % (EPOCH_LEN + 1) == 0:
+            return None
+        return {
+            "state": torch.rand(1),
+            "num_trans": torch.tensor([self.num_trans]),
+        }
+
+    def reset(self):
+        pass
+
+
+def get_batches(num_batches, num_workers=3, num_trans=10, seed=0):
+    gen = ParallelExperienceGenerator(
+        CountingGenerator, num_workers=num_workers, queue_size=6, start_method="fork"
+    )
+    gen.init(None, Namespace(seed=seed), num_trans)
+    batches = [gen.get_batch() for _ in range(num_batches)]
+    gen.close()
+    return batches
+
+
+def test_single_epoch_end():
+    num_workers = 3
+    epoch_len = num_workers * EPOCH_LEN + 1
+    batches = get_batches(2 * epoch_len, num_workers)
+
+    # Each epoch is every worker's batches followed by a single None.
+    for epoch in range(2):
+        epoch_batches = batches[epoch * epoch_len : (epoch + 1) * epoch_len]
+        assert all(b is not None for b in epoch_batches[:-1])
+        assert epoch_batches[-1] is None
+
+
+def test_split_num_trans():
+    # The first worker generates the remaining transition.
+    batches = get_batches(3, num_trans=10)
+    assert [b["num_trans"].item() for b in batches] == [4, 3, 3]
+
+
+def test_same_seed_same_order():
+    states = [
+        torch.cat([b["state"] for b in get_batches(12, seed=seed) if b is not None])
+        for seed in [0, 0, 1]
+    ]
+    assert torch.equal(states[0], states[1])
+    assert not torch.equal(states[0], states[2])
@@ -0,0 +1,55 @@
+import pytest
+import torch
+import torch.nn as nn
+from rlf.policies.base_policy import ActionData, get_empty_step_info
+from rlf.rl.population_eval import PopulationPolicy
+
+NUM_PROCS = 2
+
+
+class LinearPolicy(nn.Module):
+    def __init__(self, use_item=False):
+        super().__init__()
+        self.net = nn.Linear(3, 2)
+        # `.item()` cannot be vectorized so the members are looped over.
+        self.use_item = use_item
+
+    def get_action(self, state, add_state, hxs, masks, step_info):
+        action = self.net(state)
+        if self.use_item:
+            action = action * (state.sum().item() * 0.0 + 1.0)
+        value = torch.zeros(state.shape[0], 1)
+        return ActionData(value, action, value, hxs, {})
+
+
+def get_actions(pop_policy, state):
+    masks = torch.ones(state.shape[0], 1)
+    return pop_policy.get_action(state, {}, {}, masks, get_empty_step_info()).action
+
+
+@pytest.mark.parametrize("use_item", [False, True])
+def test_member_actions(use_item):
+    members = [LinearPolicy(use_item) for _ in range(3)]
+    pop_policy = PopulationPolicy(
+        LinearPolicy(use_item), [m.state_dict() for m in members]
+    )
+    # The same observation in every process.
+    state = torch.randn(1, 3).repeat(len(members) * NUM_PROCS, 1)
+    actions = get_actions(pop_policy, state).view(len(members), NUM_PROCS, 2)
+
+    for i, member in enumerate(members):
+        # Each member acts with its own weights on its slice.
+        expected = member.net(state[:NUM_PROCS])
+        assert torch.allclose(actions[i], expected, atol=1e-6)
+    assert not torch.allclose(actions[0], actions[1])
+    assert pop_policy._use_vmap != use_item
+
+
+def test_policy_error_raised():
+    pop_policy = PopulationPolicy(
+        LinearPolicy(), [LinearPolicy().state_dict() for _ in range(2)]
+    )
+    # Errors of the policy itself are not hidden by the loop fallback.
+    with pytest.raises(RuntimeError):
+        get_actions(pop_policy, torch.randn(2 * NUM_PROCS, 4))
+    assert pop_policy._use_vmap
@@ -0,0 +1,57 @@
+from argparse import Namespace
+
+import numpy as np
+import torch
+from rlf.storage import transition_storage
+from rlf.storage.transition_storage import ReplayBuffer
+
+
+def create_buffer(capacity):
+    buff = ReplayBuffer(
+        (4,), (2,), capacity, "cpu", Namespace(use_proper_time_limits=False)
+    )
+    buff.add_info_key("extra", (3,))
+    return buff
+
+
+def fill_buffer(buff, num_trans, batch_size=10):
+    for _ in range(num_trans // batch_size):
+        buff._insert_range(
+            torch.randn(batch_size, 4),
+            torch.randn(batch_size, 4),
+            torch.randn(batch_size, 1),
+            torch.ones(batch_size, 1),
+            torch.ones(batch_size, 1),
+            [{"extra": np.random.randn(3)} for _ in range(batch_size)],
+            torch.randn(batch_size, 2),
+        )
+
+
+def test_replay_buffer_resume(tmp_path, monkeypatch):
+    # Small chunks so the contents are split over several files.
+    monkeypatch.setattr(transition_storage, "RESUME_CHUNK_BYTES", 1000)
+    buff = create_buffer(500)
+    # Wraps around so the buffer is full and the index is not at the start.
+    fill_buffer(buff, 700)
+    resume_state = buff.save_resume(str(tmp_path))
+    assert len(list(tmp_path.iterdir())) > len(buff._get_arrays())
+
+    load_buff = create_buffer(500)
+    load_buff.load_resume(str(tmp_path), resume_state)
+    assert load_buff.idx == buff.idx == 200
+    assert load_buff.full
+    for k, arr in buff._get_arrays().items():
+        assert np.array_equal(arr, load_buff._get_arrays()[k]), k
+
+
+def test_partial_replay_buffer_resume(tmp_path):
+    buff = create_buffer(500)
+    fill_buffer(buff, 120)
+    resume_state = buff.save_resume(str(tmp_path))
+
+    load_buff = create_buffer(500)
+    load_buff.load_resume(str(tmp_path), resume_state)
+    assert len(load_buff) == 120
+    assert not load_buff.full
+    for k, arr in buff._get_arrays().items():
+        assert np.array_equal(arr[:120], load_buff._get_arrays()[k][:120]), k
@@ -0,0 +1,74 @@
+import time
+
+from rlf.rl.utils import TimeProfilee, TimeProfiler
+
+SLEEP = 0.01
+
+
+class Timed:
+    def __init__(self):
+        self.timer = TimeProfilee()
+
+    @TimeProfiler("step")
+    def step(self, x):
+        time.sleep(SLEEP)
+        return x + 1
+
+
+def sleep_iter(n):
+    for i in range(n):
+        time.sleep(SLEEP)
+        yield i
+
+
+def test_time_iter():
+    timer = TimeProfilee()
+    assert list(timer.time_iter("load", sleep_iter(3))) == [0, 1, 2]
+    total, call_count = timer.get_time("load")
+    assert total >= 3 * SLEEP
+    # Includes the final call that exhausts the iterator.
+    assert call_count == 4
+
+
+def test_time_iter_frozen():
+    timer = TimeProfilee()
+    timer.freeze()
+    assert list(timer.time_iter("load", range(3))) == [0, 1, 2]
+    assert timer.get_sums() == {}
+
+
+def test_context_manager():
+    timed = Timed()
+    timer = timed.timer
+    with TimeProfiler("block", timed) as profiler:
+        time.sleep(SLEEP)
+    assert profiler.elapsed >= SLEEP
+    assert timer.get_time("block") == (profiler.elapsed, 1)
+
+    timer.freeze()
+    with TimeProfiler("block", timed) as profiler:
+        pass
+    assert profiler.elapsed is None
+    assert timer.get_call_counts() == {"block": 1}
+
+
+def test_decorator():
+    timed = Timed()
+    assert timed.step(1) == 2
+    assert timed.step(2) == 3
+    assert Timed.step.__name__ == "step"
+    total, call_count = timed.timer.get_time("step")
+    assert total >= 2 * SLEEP
+    assert call_count == 2
+
+
+def test_merge():
+    timer = TimeProfilee()
+    timer.add_time("a", 1.0)
+    other = TimeProfilee()
+    other.add_time("a", 2.0)
+    other.add_time("b", 0.5)
+    timer.merge(other)
+    assert timer.get_sums() == {"a": 3.0, "b": 0.5}
+    assert timer.get_call_counts() == {"a": 2, "b": 1}
+    assert timer.get_means() == {"a": 1.5, "b": 0.5}
@@ -0,0 +1,67 @@
+import torch
+from rlf.il.il_dataset import BatchIndexSampler
+from rlf.il.transition_dataset import TransitionDataset
+
+# Trajectories of length 3, 1 and 2.
+TRAJ_LENS = [3, 1, 2]
+
+
+def create_dataset():
+    n = sum(TRAJ_LENS)
+    done = torch.zeros(n)
+    done[torch.cumsum(torch.tensor(TRAJ_LENS), 0) - 1] = 1.0
+    obs = torch.arange(n, dtype=torch.float32).view(-1, 1)
+    return TransitionDataset(
+        None,
+        None,
+        override_data={
+            "obs": obs,
+            "next_obs": obs + 0.5,
+            # The action of transition `i` is `10 * i`.
+            "actions": 10.0 * obs,
+            "done": done,
+        },
+    )
+
+
+def test_traj_trans_idxs():
+    dataset = create_dataset()
+    assert dataset.get_traj_offsets().tolist() == [0, 3, 4, 6]
+    trans_idxs = dataset.get_traj_trans_idxs(torch.tensor([2, 0]))
+    assert trans_idxs.tolist() == [4, 5, 0, 1, 2]
+    assert dataset.get_traj_trans_idxs(torch.tensor([1])).tolist() == [3]
+    assert dataset.get_traj_trans_idxs(torch.tensor([], dtype=torch.long)).numel() == 0
+
+
+def test_action_chunks():
+    dataset = create_dataset()
+    chunks = dataset.get_action_chunks(3)
+    assert chunks.shape == (6, 3, 1)
+    # Chunks are padded with the last action of their own trajectory.
+    assert chunks.view(6, 3).tolist() == [
+        [0.0, 10.0, 20.0],
+        [10.0, 20.0, 20.0],
+        [20.0, 20.0, 20.0],
+        [30.0, 30.0, 30.0],
+        [40.0, 50.0, 50.0],
+        [50.0, 50.0, 50.0],
+    ]
+
+
+def test_sampler_extra_field():
+    dataset = create_dataset()
+    # Only trajectories 0 and 2 so the sampler maps the subset indices back.
+    subset = torch.utils.data.Subset(dataset, [0, 1, 2, 4, 5])
+    sampler = BatchIndexSampler(subset, batch_size=2, drop_last=False)
+    sampler.set_extra_field("idx", torch.arange(len(dataset)))
+    assert len(sampler) == 3
+
+    seen = []
+    for batch in sampler:
+        # The extra field is aligned with the dataset items of the batch.
+        assert torch.equal(10.0 * batch["idx"].view(-1, 1), batch["actions"])
+        seen.extend(batch["state"].view(-1).tolist())
+    assert sorted(seen) == [0.0, 1.0, 2.0, 4.0, 5.0]
+
+    sampler = BatchIndexSampler(subset, batch_size=2)
+    assert len(sampler) == len(list(sampler)) == 2